@@ -653,11 +653,23 @@ class BLACS(object):
 
 class ExperimentServer(ZMQServer):
     def handler(self, h5_filepath):
+        if isinstance(h5_filepath, (list, tuple)):
+            # A batch submission: a list of filepaths, to which we
+            # respond with a list of messages, one per file:
+            return self.process_batch(h5_filepath)
         print h5_filepath
         message = self.process(h5_filepath)
         logger.info('Request handler: %s ' % message.strip())
         return message
 
+    def process_batch(self, h5_filepaths):
+        logger.info('received batch of %d filepaths'%len(h5_filepaths))
+        h5_filepaths = [labscript_utils.shared_drive.path_to_local(path) for path in h5_filepaths]
+        messages = app.queue.process_batch_request(h5_filepaths)
+        for h5_filepath, message in zip(h5_filepaths, messages):
+            logger.info('Request handler: %s: %s ' % (h5_filepath, message.strip()))
+        return messages
+
     @inmain_decorator(wait_for_return=True)
     def process(self,h5_filepath):
         # Convert path to local slashes and shared drive prefix:
@@ -17,12 +17,19 @@ import logging
 import labscript_utils.excepthook
 import numpy as np
 import copy
+import hashlib
+
+# Parsed connection tables, keyed by the hash labscript stores with them, so
+# that the many shots of a sequence, all with the same connection table, need
+# not each be parsed:
+_parsed_tables = {}
+MAX_PARSED_TABLES = 16
+
 
 class ConnectionTable(object):    
     def __init__(self, h5file):
         self.filepath = h5file
         self.logger = logging.getLogger('BLACS.ConnectionTable') 
-        self.toplevel_children = {}
         self.logger.debug('Parsing connection table from %s'%h5file)
         try:
             with h5py.File(h5file,'r') as hdf5_file:
@@ -31,14 +38,6 @@ class ConnectionTable(object):
                 except:
                     raise
                 try:
-                    if len(table):
-                        self.table = np.array(table)
-                    else:
-                        self.table = np.array([])
-                    for row in self.table:
-                        if row[3] == "None":
-                            row = Row(row)
-                            self.toplevel_children[row[0]] = Connection(row[0],row[1],None,row[3],row[4],row[5],row[6],row[7],self.table)
                     try:
                         self.master_pseudoclock = table.attrs['master_pseudoclock']
                     except:
@@ -47,12 +46,50 @@ class ConnectionTable(object):
                         #
                         #      Perhaps we should just raise an exception here?
                         self.master_pseudoclock = None
+                    # Tables written before labscript stored a hash are
+                    # hashed here instead, once they have been read:
+                    self.hash = table.attrs.get('hash', None)
+                    if self.hash is not None and self.hash in _parsed_tables:
+                        self.table, self.toplevel_children, self._connections = _parsed_tables[self.hash]
+                    else:
+                        self._parse(table)
                 except:
                     self.logger.error('Unable to get connection table  %s'%h5file)
                     raise
         except:
             self.logger.exception('An error occurred while trying to open the h5 file at %s'%h5file)
             raise
+
+    def _parse(self, table):
+        if len(table):
+            self.table = np.array(table)
+        else:
+            self.table = np.array([])
+        rows = self.table.tolist()
+        hash_stored = self.hash is not None
+        if not hash_stored:
+            self.hash = hashlib.sha1(repr((self.master_pseudoclock, rows))).hexdigest()
+        # Index the rows by parent in one pass, so that each device finds its
+        # children without searching the whole table:
+        children = {}
+        for row in rows:
+            children.setdefault(row[2], []).append(row)
+        self.toplevel_children = {}
+        for row in rows:
+            if row[3] == "None":
+                row = Row(row)
+                self.toplevel_children[row[0]] = Connection(row[0],row[1],None,row[3],row[4],row[5],row[6],row[7],children)
+        # Every connection, keyed by name:
+        self._connections = {}
+        def add_connections(connections):
+            for name, connection in connections.items():
+                self._connections[name] = connection
+                add_connections(connection.child_list)
+        add_connections(self.toplevel_children)
+        if hash_stored:
+            if len(_parsed_tables) >= MAX_PARSED_TABLES:
+                _parsed_tables.clear()
+            _parsed_tables[self.hash] = self.table, self.toplevel_children, self._connections
     
     def assert_superset(self,other):
         # let's check that we're a superset of the connection table in "other"
@@ -139,14 +176,7 @@ class ConnectionTable(object):
         return None
     
     def find_by_name(self,name):
-        for device_name,connection in self.toplevel_children.items():
-            if device_name == name:
-                return connection
-            else:
-                result = connection.find_by_name(name)
-                if result is not None:
-                    return result
-        return None
+        return self._connections.get(name)
 
 # A wrapper class for rows taken out of the connection table
 # This allows us to easily provide backwards compatibilty for older HDF5
@@ -172,7 +202,7 @@ class Row(object):
     
 class Connection(object):
     
-    def __init__(self, name, device_class, parent, parent_port, unit_conversion_class, unit_conversion_params, BLACS_connection, properties, table):
+    def __init__(self, name, device_class, parent, parent_port, unit_conversion_class, unit_conversion_params, BLACS_connection, properties, children):
         self.child_list = {}
         self.name = name
         self.device_class = device_class
@@ -194,11 +224,11 @@ class Connection(object):
         else:
             self._properties = eval(properties)
         
-        # Create children
-        for row in table:
-            if row[2] == self.name:
-                row = Row(row)
-                self.child_list[row[0]] = Connection(row[0],row[1],self,row[3],row[4],row[5],row[6],row[7],table)
+        # Create children, from the rows of the connection table keyed by
+        # the name of their parent:
+        for row in children.get(self.name, []):
+            row = Row(row)
+            self.child_list[row[0]] = Connection(row[0],row[1],self,row[3],row[4],row[5],row[6],row[7],children)
         
     @property
     def unit_conversion_params(self):
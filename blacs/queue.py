@@ -349,18 +349,72 @@ class QueueManager(object):
                 message = "Error: Queue is not running\n"
             return message
         else:
-            # TODO: Parse and display the contents of "error" in a more human readable format for analysis of what is wrong!
-            message =  ("Connection table of your file is not a subset of the experimental control apparatus.\n"
-                       "You may have:\n"
-                       "    Submitted your file to the wrong control PC\n"
-                       "    Added new channels to your h5 file, without rewiring the experiment and updating the control PC\n"
-                       "    Renamed a channel at the top of your script\n"
-                       "    Submitted an old file, and the experiment has since been rewired\n"
-                       "\n"
-                       "Please verify your experiment script matches the current experiment configuration, and try again\n"
-                       "The error was %s\n"%error)
-            return message
-                    
+            return self._connection_table_error_message(error)
+
+    def _connection_table_error_message(self, error):
+        # TODO: Parse and display the contents of "error" in a more human readable format for analysis of what is wrong!
+        message =  ("Connection table of your file is not a subset of the experimental control apparatus.\n"
+                   "You may have:\n"
+                   "    Submitted your file to the wrong control PC\n"
+                   "    Added new channels to your h5 file, without rewiring the experiment and updating the control PC\n"
+                   "    Renamed a channel at the top of your script\n"
+                   "    Submitted an old file, and the experiment has since been rewired\n"
+                   "\n"
+                   "Please verify your experiment script matches the current experiment configuration, and try again\n"
+                   "The error was %s\n"%error)
+        return message
+
+    def process_batch_request(self, h5_filepaths):
+        """Validate and enqueue many run files at once. Returns a list of
+        response messages, one per file, in the same order as h5_filepaths.
+
+        Unlike calling process_request once per file, connection tables with
+        the same hash (as all shots of a sequence have) are only compared
+        against the BLACS connection table once, and all accepted files are
+        added to the queue in a single model update."""
+        # Paths already in the queue, fetched once rather than per file:
+        queued = set(self.get_queued_files())
+        comparisons = {}
+        messages = []
+        to_append = []
+        for h5_filepath in h5_filepaths:
+            try:
+                new_conn = ConnectionTable(h5_filepath)
+            except:
+                messages.append("H5 file not accessible to Control PC\n")
+                continue
+            key = new_conn.hash
+            if key not in comparisons:
+                comparisons[key] = inmain(self.BLACS.connection_table.compare_to,new_conn)
+            result, error = comparisons[key]
+            if not result:
+                messages.append(self._connection_table_error_message(error))
+                continue
+            with h5py.File(h5_filepath,'r') as h5_file:
+                rerun = 'data' in h5_file['/']
+            if rerun or h5_filepath in queued:
+                self._logger.debug('Run file has already been run! Creating a fresh copy to rerun')
+                new_h5_filepath = labscript_utils.file_utils.new_rep_name(h5_filepath, repeats=self._repeats)
+                success = self.clean_h5_file(h5_filepath, new_h5_filepath)
+                if not success:
+                    messages.append('Cannot create a re run of this experiment. Is it a valid run file?')
+                    continue
+                to_append.append(new_h5_filepath)
+                queued.add(new_h5_filepath)
+                message = "Experiment added successfully: experiment to be re-run\n"
+            else:
+                to_append.append(h5_filepath)
+                queued.add(h5_filepath)
+                message = "Experiment added successfully\n"
+            if self.manager_paused:
+                message += "Warning: Queue is currently paused\n"
+            if not self.manager_running:
+                message = "Error: Queue is not running\n"
+            messages.append(message)
+        if to_append:
+            self.append(to_append)
+        return messages
+
     def clean_h5_file(self,h5file,new_h5_file):
         try:
             with h5py.File(h5file,'r') as old_file:
@@ -387,6 +441,10 @@ class QueueManager(object):
         else:
             return False
 
+    @inmain_decorator(wait_for_return=True)
+    def get_queued_files(self):
+        return [str(self._model.item(i, FILEPATH_COLUMN).text()) for i in range(self._model.rowCount())]
+
     @inmain_decorator(wait_for_return=True)
     def get_num_files(self):
         return int(self._model.rowCount())
@@ -12,7 +12,7 @@
 #####################################################################
 
 from __future__ import division
-from labscript import Device, PseudoClock, IntermediateDevice, AnalogOut, DigitalOut, bitfield
+from labscript import Device, PseudoClock, IntermediateDevice, AnalogOut, DigitalOut, bitfield, create_table
 from pylab import *
 default_cycle_time = 2500/300e6 # 8.333us
 
@@ -319,7 +319,7 @@ class ADWin(PseudoClock):
         # Add the 'end of data' instruction to the end:
         analog_data[-1]['t'] = 2**32-1
         # Save to the HDF5 file:
-        group.create_dataset('ANALOG_OUTS', data=analog_data)
+        create_table(group, 'ANALOG_OUTS', analog_data)
         
         # Make the digital output table:
         digital_dtypes = [('t',uint), ('card',int), ('bitfield',int)]
@@ -333,7 +333,7 @@ class ADWin(PseudoClock):
         # Add the 'end of data' instruction to the end:
         digital_data[-1]['t'] = 2**32-1
         # Save to the HDF5 file:
-        group.create_dataset('DIGITAL_OUTS', data=digital_data)
+        create_table(group, 'DIGITAL_OUTS', digital_data)
         group.attrs['stop_time'] = self.stop_time/self.clock_resolution
         group.attrs['cycle_time'] = self.clock_resolution
         
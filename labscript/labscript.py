@@ -16,6 +16,7 @@ import os
 import sys
 import subprocess
 import keyword
+import hashlib
 import traceback
 import importlib
 from inspect import getargspec
@@ -63,7 +64,16 @@ else:
 class config:
     suppress_mild_warnings = True
     suppress_all_warnings = False
-    compression = 'gzip'  # set to 'gzip' for compression 
+    # Compression for tables of at least compression_threshold bytes written
+    # with create_table(), or None for no compression. With the shuffle
+    # filter, the lowest gzip level compresses tables nearly as well as the
+    # default level, in about half the time. 'lzf' may also be used, but only
+    # h5py can decompress it:
+    compression = 'gzip'
+    gzip_level = 1
+    compression_threshold = 1 << 14
+    # The approximate size of a chunk of a compressed table:
+    table_chunk_bytes = 1 << 17
    
     
 class NoWarnings(object):
@@ -123,6 +133,60 @@ def fastflatten(inarray, dtype):
             i += 1
     return flat
 
+def table_chunk_shape(shape, itemsize, chunk_bytes=None):
+    """Returns a chunk shape for a table of the given shape and item size
+    in bytes: runs of whole rows of about config.table_chunk_bytes, since
+    tables are always read a whole row at a time, and usually in full."""
+    if chunk_bytes is None:
+        chunk_bytes = config.table_chunk_bytes
+    shape = tuple(int(n) for n in shape)
+    row_bytes = itemsize * int(prod(shape[1:]))
+    rows = max(1, min(shape[0], chunk_bytes // max(row_bytes, 1)))
+    return (rows,) + shape[1:]
+
+def table_nbytes(data):
+    """Returns about how many bytes the values of a table take up. numpy
+    arrays of variable length strings hold only references to the strings,
+    so for those the lengths of the strings are counted instead."""
+    if not data.dtype.hasobject:
+        return data.nbytes
+    if data.dtype.names is None:
+        fields = [data]
+    else:
+        fields = [data[name] for name in data.dtype.names]
+    nbytes = 0
+    for field in fields:
+        if field.dtype.hasobject:
+            nbytes += sum(len(value) if hasattr(value, '__len__') else field.dtype.itemsize
+                          for value in field.ravel())
+        else:
+            nbytes += field.nbytes
+    return nbytes
+
+def create_table(group, name, data, **kwargs):
+    """Creates a dataset in the given h5py group like group.create_dataset(),
+    for writing the tables devices compile to. Tables of at least
+    config.compression_threshold bytes, as counted by table_nbytes(), are
+    chunked and compressed with config.compression and the shuffle filter.
+    Shuffling stores the first byte of every value in a chunk together, then
+    the second byte, and so on. Bytes that change little from row to row,
+    such as those of a column holding the same value for many rows, as most
+    output columns do, then form long repeated sequences, which the
+    compressor stores as references to their first occurrence. Smaller
+    tables are stored as they are, as compressing them costs more time than
+    it saves space. Any other keyword arguments are passed to
+    create_dataset()."""
+    data = asarray(data)
+    nbytes = table_nbytes(data)
+    if (config.compression is not None and data.ndim and nbytes >= config.compression_threshold
+            and 'compression' not in kwargs):
+        kwargs['compression'] = config.compression
+        if config.compression == 'gzip':
+            kwargs.setdefault('compression_opts', config.gzip_level)
+        kwargs.setdefault('shuffle', True)
+        kwargs.setdefault('chunks', table_chunk_shape(data.shape, nbytes // max(data.size, 1)))
+    return group.create_dataset(name, data=data, **kwargs)
+
 def set_passed_properties(property_names = {}):
     """
     This decorator is intended to wrap the __init__ functions and to
@@ -1811,9 +1875,6 @@ class LabscriptError(Exception):
 def generate_connection_table(hdf5_file):
     connection_table = []
     devicedict = {}
-    
-    # Only use a string dtype as long as is needed:
-    max_BLACS_conn_length = -1
 
     for device in compiler.inventory:
         devicedict[device.name] = device
@@ -1824,12 +1885,9 @@ def generate_connection_table(hdf5_file):
         properties = device._properties["connection_table_properties"]
         serialised_properties = labscript_utils.properties.serialise(properties)
         
-        # If the device has a BLACS_connection atribute, then check to see if it is longer than the size of the hdf5 column
+        # If the device has a BLACS_connection atribute, then make sure it is a string:
         if hasattr(device,"BLACS_connection"):
-            # Make sure it is a string!
             BLACS_connection = str(device.BLACS_connection)
-            if len(BLACS_connection) > max_BLACS_conn_length:
-                max_BLACS_conn_length = len(BLACS_connection)
         else:
             BLACS_connection = ""
             
@@ -1842,21 +1900,29 @@ def generate_connection_table(hdf5_file):
                                  serialised_properties))
     
     connection_table.sort()
-    vlenstring = h5py.special_dtype(vlen=unicode)
-    connection_table_dtypes = [('name','a256'), ('class','a256'), ('parent','a256'), ('parent port','a256'),
-                               ('unit conversion class','a256'), ('unit conversion params', vlenstring),
-                               ('BLACS_connection','a'+str(max_BLACS_conn_length)),
-                               ('properties', vlenstring)]
-    connection_table_array = empty(len(connection_table),dtype=connection_table_dtypes)
-    for i, row in enumerate(connection_table):
-        connection_table_array[i] = row
-    dataset = hdf5_file.create_dataset('connection table', compression=config.compression, data=connection_table_array, maxshape=(None,))
-    
     if compiler.master_pseudoclock is None:
         master_pseudoclock_name = 'None'
     else:
         master_pseudoclock_name = compiler.master_pseudoclock.name
+        
+    # Variable length strings, so that the table is no bigger than its
+    # contents and no name is too long to fit:
+    vlenbytes = h5py.special_dtype(vlen=str)
+    vlenstring = h5py.special_dtype(vlen=unicode)
+    connection_table_dtypes = [('name',vlenbytes), ('class',vlenbytes), ('parent',vlenbytes), ('parent port',vlenbytes),
+                               ('unit conversion class',vlenbytes), ('unit conversion params', vlenstring),
+                               ('BLACS_connection',vlenbytes), ('properties', vlenstring)]
+    connection_table_array = array(connection_table, dtype=connection_table_dtypes)
+    dataset = create_table(hdf5_file, 'connection table', connection_table_array, maxshape=(None,))
     dataset.attrs['master_pseudoclock'] = master_pseudoclock_name
+    # A hash of the contents of the table, which is the same for every shot
+    # of a sequence unless the devices change, so that BLACS need only parse
+    # and check the connection table of the first:
+    hasher = hashlib.sha1()
+    hasher.update(repr(([name for name, _ in connection_table_dtypes], master_pseudoclock_name)))
+    for row in connection_table:
+        hasher.update(repr(row))
+    dataset.attrs['hash'] = hasher.hexdigest()
   
   
 def save_labscripts(hdf5_file):
@@ -1930,7 +1996,7 @@ def generate_wait_table(hdf5_file):
     for i, t in enumerate(sorted(compiler.wait_table)):
         label, timeout = compiler.wait_table[t]
         data_array[i] = label, t, timeout
-    dataset = hdf5_file.create_dataset('waits', data = data_array)
+    dataset = create_table(hdf5_file, 'waits', data_array)
     if compiler.wait_monitor is not None:
         acquisition_device = compiler.wait_monitor.acquisition_device.name 
         acquisition_connection = compiler.wait_monitor.acquisition_connection
@@ -0,0 +1,138 @@
+#####################################################################
+#                                                                   #
+# /table_benchmark.py                                               #
+#                                                                   #
+# Copyright 2013, Monash University                                 #
+#                                                                   #
+# This file is part of the program labscript, in the labscript      #
+# suite (see http://labscriptsuite.org), and is licensed under the  #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+
+"""Benchmark of writing and reading the tables of a representative shot with
+create_table(), compared to the previous behaviour of compressing every table
+with gzip. Run as a script:
+
+    python table_benchmark.py [n_ticks]
+
+The shot has a pulseblaster pulse program, an NI card's analog and digital
+outputs and a novatech's table, each with n_ticks rows, mostly holding their
+values with occasional steps and a few ramps, as in a typical experiment, and
+some small tables as written by static devices."""
+
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+import labscript_utils.h5_lock, h5py
+
+from labscript import create_table, config
+
+
+def make_shot_tables(n_ticks, seed=0):
+    """Returns a dict of (group name, dataset name): table for a shot with
+    n_ticks clock ticks"""
+    rng = np.random.RandomState(seed)
+    tables = {}
+
+    def steps(n_steps, values):
+        # Indices at which an output steps to the next of values:
+        change_points = np.sort(rng.randint(1, n_ticks, n_steps))
+        return values[np.searchsorted(change_points, np.arange(n_ticks), 'right') % len(values)]
+
+    # NI card, eight analog outputs, two of which ramp for a while:
+    analog_outs = np.empty((n_ticks, 8), dtype=np.float32)
+    for i in range(8):
+        analog_outs[:, i] = steps(20, rng.uniform(-10, 10, 21))
+    ramp = slice(n_ticks // 4, n_ticks // 2)
+    ramp_length = ramp.stop - ramp.start
+    analog_outs[ramp, 0] = np.linspace(0, 5, ramp_length)
+    analog_outs[ramp, 1] = 2*np.sin(np.linspace(0, 20*np.pi, ramp_length))
+    tables['ni_card', 'ANALOG_OUTS'] = analog_outs
+    # Two 16 bit halves, since randint's default integer type is only 32 bit
+    # on Windows, too small for 1 << 32:
+    high, low = rng.randint(0, 1 << 16, (2, 201)).astype(np.uint32)
+    tables['ni_card', 'DIGITAL_OUTS'] = steps(200, (high << 16) | low)
+
+    # Pulseblaster:
+    pb_dtype = [('flags', np.int32), ('inst', np.int32), ('inst_data', np.int32), ('length', np.float64)]
+    pulse_program = np.zeros(n_ticks, dtype=pb_dtype)
+    pulse_program['flags'] = steps(200, rng.randint(0, 1 << 12, 201))
+    pulse_program['length'] = steps(50, rng.uniform(1e3, 1e6, 51))
+    pulse_program['inst'][-1] = 6
+    tables['pulseblaster', 'PULSE_PROGRAM'] = pulse_program
+
+    # Novatech, four DDS channels:
+    novatech_dtype = [('%s%d' % (quantity, i), np.uint32) for i in range(4) for quantity in ('freq', 'amp', 'phase')]
+    novatech_table = np.zeros(n_ticks, dtype=novatech_dtype)
+    for name, _ in novatech_dtype:
+        novatech_table[name] = steps(30, rng.randint(0, 1 << 30, 31).astype(np.uint32))
+    novatech_table['freq0'][ramp] = np.linspace(1e8, 2e8, ramp_length).astype(np.uint32)
+    tables['novatech', 'TABLE_DATA'] = novatech_table
+
+    # Small tables of static devices:
+    tables['novatech', 'STATIC_DATA'] = novatech_table[:1]
+    tables['synthesizer', 'STATIC_DATA'] = np.zeros(1, dtype=[('freq0', np.uint64), ('gate0', np.uint16)])
+    return tables
+
+
+def write_gzip_every_table(group, name, data):
+    return group.create_dataset(name, data=data, compression='gzip')
+
+
+def benchmark_writer(write_table, tables, repeats):
+    """Returns the best time in seconds to write the tables with
+    write_table(group, name, data), the best time to read them back, and the
+    size in bytes of the file"""
+    fd, path = tempfile.mkstemp(suffix='.h5')
+    os.close(fd)
+    write_times = []
+    read_times = []
+    try:
+        for _ in range(repeats):
+            start_time = time.time()
+            with h5py.File(path, 'w') as f:
+                devices = f.create_group('devices')
+                for (group_name, name), data in sorted(tables.items()):
+                    if group_name not in devices:
+                        devices.create_group(group_name)
+                    write_table(devices[group_name], name, data)
+            write_times.append(time.time() - start_time)
+            start_time = time.time()
+            with h5py.File(path, 'r') as f:
+                for group_name, name in tables:
+                    f['devices'][group_name][name][:]
+            read_times.append(time.time() - start_time)
+        size = os.path.getsize(path)
+    finally:
+        os.remove(path)
+    return min(write_times), min(read_times), size
+
+
+def benchmark(n_ticks=200000, repeats=5):
+    tables = make_shot_tables(n_ticks)
+    raw_size = sum(data.nbytes for data in tables.values())
+    print 'Shot of %d clock ticks, %.1f MB of tables' % (n_ticks, raw_size/1e6)
+    print '%-32s %10s %10s %10s' % ('', 'write (ms)', 'read (ms)', 'size (kB)')
+    compression = config.compression
+    writers = [('gzip every table', write_gzip_every_table, None),
+               ('create_table, no compression', create_table, None),
+               ('create_table, gzip (default)', create_table, 'gzip'),
+               ('create_table, lzf', create_table, 'lzf')]
+    try:
+        for label, writer, config.compression in writers:
+            write_time, read_time, size = benchmark_writer(writer, tables, repeats)
+            print '%-32s %10.1f %10.1f %10.1f' % (label, 1e3*write_time, 1e3*read_time, size/1e3)
+    finally:
+        config.compression = compression
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        benchmark(int(sys.argv[1]))
+    else:
+        benchmark()
@@ -19,7 +19,7 @@ except ImportError:
 check_version('labscript', '2.0.1', '3')
 
 from labscript_devices import labscript_device, BLACS_tab, BLACS_worker
-from labscript import TriggerableDevice, LabscriptError, set_passed_properties
+from labscript import TriggerableDevice, LabscriptError, set_passed_properties, create_table
 import numpy as np
 
 @labscript_device
@@ -113,7 +113,7 @@ class Camera(TriggerableDevice):
         group = self.init_device_group(hdf5_file)
 
         if self.exposures:
-            group.create_dataset('EXPOSURES', data=data)
+            create_table(group, 'EXPOSURES', data)
             
         # DEPRECATED backward campatibility for use of exposuretime keyword argument instead of exposure_time:
         self.set_property('exposure_time', self.exposure_time, location='device_properties', overwrite=True)
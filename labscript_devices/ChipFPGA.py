@@ -12,7 +12,7 @@
 #####################################################################
 from labscript_devices import runviewer_parser, labscript_device, BLACS_tab, BLACS_worker
 
-from labscript import IntermediateDevice, AnalogQuantity, config, LabscriptError, set_passed_properties, MHz
+from labscript import IntermediateDevice, AnalogQuantity, config, create_table, LabscriptError, set_passed_properties, MHz
 from labscript_utils.unitconversions import NovaTechDDS9mFreqConversion
 
 import numpy as np
@@ -135,9 +135,9 @@ class ChipFPGA(IntermediateDevice):
             quantised_phases[:, i] = quantised_phase
         
         grp = self.init_device_group(hdf5_file)
-        grp.create_dataset('amplitude_table', compression=config.compression, data=quantised_amps)
-        grp.create_dataset('frequency_table', compression=config.compression, data=quantised_freqs) 
-        grp.create_dataset('phase_table', compression=config.compression, data=quantised_phases)
+        create_table(grp, 'amplitude_table', quantised_amps)
+        create_table(grp, 'frequency_table', quantised_freqs)
+        create_table(grp, 'phase_table', quantised_phases)
         self.set_property('frequency_scale_factor', freq_scale_factor, location='device_properties')
         self.set_property('amplitude_scale_factor', amp_scale_factor, location='device_properties')
         self.set_property('phase_scale_factor', phase_scale_factor, location='device_properties')
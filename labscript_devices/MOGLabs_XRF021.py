@@ -12,7 +12,7 @@
 #####################################################################
 from labscript_devices import runviewer_parser, labscript_device, BLACS_tab, BLACS_worker
 
-from labscript import IntermediateDevice, DDS, StaticDDS, Device, config, LabscriptError, set_passed_properties
+from labscript import IntermediateDevice, DDS, StaticDDS, Device, config, create_table, LabscriptError, set_passed_properties
 # from labscript_utils.unitconversions import NovaTechDDS9mFreqConversion, NovaTechDDS9mAmpConversion
 
 import numpy as np
@@ -415,7 +415,7 @@ class MOGLabs_XRF021(IntermediateDevice):
             out_table['phase%d'%connection][:] = dds.phase.raw_output
 
         grp = self.init_device_group(hdf5_file)
-        grp.create_dataset('TABLE_DATA',compression=config.compression,data=out_table)
+        create_table(grp, 'TABLE_DATA', out_table)
 
 import time
 
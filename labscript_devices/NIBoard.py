@@ -1,6 +1,7 @@
 import numpy as np
 from labscript_devices import runviewer_parser
-from labscript import IntermediateDevice, AnalogOut, DigitalOut, AnalogIn, bitfield, config, LabscriptError, set_passed_properties
+from labscript_devices.runviewer_utils import clock_ticks as get_clock_ticks, table_on_ticks, compact_trace
+from labscript import IntermediateDevice, AnalogOut, DigitalOut, AnalogIn, bitfield, config, create_table, LabscriptError, set_passed_properties
 import labscript_utils.h5_lock, h5py
 import labscript_utils.properties
 
@@ -96,18 +97,26 @@ class NIBoard(IntermediateDevice):
             digital_out_table = self.convert_bools_to_bytes(digitals.values())
         grp = self.init_device_group(hdf5_file)
         if all(analog_out_table.shape): # Both dimensions must be nonzero
-            grp.create_dataset('ANALOG_OUTS',compression=config.compression,data=analog_out_table)
+            create_table(grp, 'ANALOG_OUTS', analog_out_table)
             self.set_property('analog_out_channels', ', '.join(analog_out_attrs), location='device_properties')
         if len(digital_out_table): # Table must be non empty
-            grp.create_dataset('DIGITAL_OUTS',compression=config.compression,data=digital_out_table)
+            create_table(grp, 'DIGITAL_OUTS', digital_out_table)
             self.set_property('digital_lines', '/'.join((self.MAX_name,'port0','line0:%d'%(self.num_DO-1))), location='device_properties')
         if len(acquisition_table): # Table must be non empty
-            grp.create_dataset('ACQUISITIONS',compression=config.compression,data=acquisition_table)
+            create_table(grp, 'ACQUISITIONS', acquisition_table)
             self.set_property('analog_in_channels', ', '.join(input_attrs), location='device_properties')
         # TODO: move this to decorator (requires ability to set positional args with @set_passed_properties)
         self.set_property('clock_terminal', self.clock_terminal, location='connection_table_properties')
 
 
+def decode_digital_outs(digitals, num_DO):
+    """Decodes all lines of all digital output words at once. Column i of
+    the result is the state of line i."""
+    bit_indices = np.arange(num_DO)
+    digitals = np.asarray(digitals, dtype=int).reshape(-1)
+    return (digitals[:, None] >> bit_indices) & 1
+
+
 @runviewer_parser
 class RunviewerClass(object):
     
@@ -153,28 +162,15 @@ class RunviewerClass(object):
             else:
                 digitals = []
             
-        times, clock_value = clock[0], clock[1]
-        
-        clock_indices = np.where((clock_value[1:]-clock_value[:-1])==1)[0]+1
-        # If initial clock value is 1, then this counts as a rising edge (clock should be 0 before experiment)
-        # but this is not picked up by the above code. So we insert it!
-        if clock_value[0] == 1:
-            clock_indices = np.insert(clock_indices, 0, 0)
-        clock_ticks = times[clock_indices]
+        clock_ticks = get_clock_ticks(clock)
         
         traces = {}
+        line_values = decode_digital_outs(digitals, self.num_DO)
         for i in range(self.num_DO):
-            traces['port0/line%d'%i] = []
-        for row in digitals:
-            bit_string = np.binary_repr(row,self.num_DO)[::-1]
-            for i in range(self.num_DO):
-                traces[self.port_strings[i]].append(int(bit_string[i]))
-                
-        for i in range(self.num_DO):
-            traces[self.port_strings[i]] = (clock_ticks, np.array(traces[self.port_strings[i]]))
+            traces[self.port_strings[i]] = compact_trace(table_on_ticks(clock_ticks, line_values[:, i]))
         
         for i, channel in enumerate(analog_out_channels):
-            traces[channel.split('/')[-1]] = (clock_ticks, analogs[:,i])
+            traces[channel.split('/')[-1]] = compact_trace(table_on_ticks(clock_ticks, analogs[:,i]))
         
         triggers = {}
         for channel_name, channel in self.device.child_list.items():
@@ -184,4 +180,31 @@ class RunviewerClass(object):
                 add_trace(channel_name, traces[channel.parent_port], self.name, channel.parent_port)
         
         return triggers
-    
+
+
+def benchmark(n_words=1000000, num_DO=32):
+    """Times decoding DIGITAL_OUTS with decode_digital_outs() and with the
+    previous decode, one word at a time with np.binary_repr"""
+    import time
+    # Drawn as two 16 bit halves, since randint's default integer type is
+    # only 32 bit on Windows, too small for 1 << 32:
+    high, low = np.random.randint(0, 1 << 16, (2, n_words)).astype(np.uint32)
+    digitals = ((high << 16) | low) & np.uint32((1 << num_DO) - 1)
+
+    start_time = time.time()
+    traces = [[] for i in range(num_DO)]
+    for row in digitals:
+        bit_string = np.binary_repr(row, num_DO)[::-1]
+        for i in range(num_DO):
+            traces[i].append(int(bit_string[i]))
+    traces = [np.array(trace) for trace in traces]
+    print('Decoding one word at a time: %.3f s' % (time.time() - start_time))
+
+    start_time = time.time()
+    line_values = decode_digital_outs(digitals, num_DO)
+    print('decode_digital_outs: %.3f s' % (time.time() - start_time))
+    assert all(np.array_equal(traces[i], line_values[:, i]) for i in range(num_DO))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -11,7 +11,7 @@
 #                                                                   #
 #####################################################################
 
-from labscript import LabscriptError, set_passed_properties, config
+from labscript import LabscriptError, set_passed_properties, config, create_table
 from labscript import IntermediateDevice, AnalogOut, StaticAnalogOut, DigitalOut, StaticDigitalOut, AnalogIn
 from labscript_devices import labscript_device, BLACS_tab, BLACS_worker, runviewer_parser
 import labscript_devices.NIBoard as parent
@@ -171,13 +171,13 @@ class NI_DAQmx(parent.NIBoard):
             
         grp = self.init_device_group(hdf5_file)
         if all(analog_out_table.shape): # Both dimensions must be nonzero
-            grp.create_dataset('ANALOG_OUTS',compression=config.compression,data=analog_out_table)
+            create_table(grp, 'ANALOG_OUTS', analog_out_table)
             self.set_property('analog_out_channels', ', '.join(analog_out_attrs), location='device_properties')
         if len(digital_out_table): # Table must be non empty
-            grp.create_dataset('DIGITAL_OUTS',compression=config.compression,data=digital_out_table)
+            create_table(grp, 'DIGITAL_OUTS', digital_out_table)
             self.set_property('digital_lines', '/'.join((self.MAX_name,'port0','line0:%d'%(self.num_DO-1))), location='device_properties')
         if len(acquisition_table): # Table must be non empty
-            grp.create_dataset('ACQUISITIONS',compression=config.compression,data=acquisition_table)
+            create_table(grp, 'ACQUISITIONS', acquisition_table)
             self.set_property('analog_in_channels', ', '.join(input_attrs), location='device_properties')
 
         # I think this miscounts AO/DO/AI devices allowing me to have an odd 
@@ -545,6 +545,7 @@ class Ni_DAQmxAcquisitionWorker(Worker):
         exec 'from PyDAQmx.DAQmxConstants import *' in globals()
         exec 'from PyDAQmx.DAQmxTypes import *' in globals()
         global h5py; import labscript_utils.h5_lock, h5py
+        global create_roi_dataset; from labscript_utils.h5_chunking import create_roi_dataset
         global numpy; import numpy
         global threading; import threading
         global zprocess; import zprocess
@@ -874,7 +875,7 @@ class Ni_DAQmxAcquisitionWorker(Worker):
                 data = numpy.empty(len(values),dtype=dtypes)
                 data['t'] = times
                 data['values'] = values
-                measurements.create_dataset(label, data=data)
+                create_roi_dataset(measurements, label, data)
             
     def abort_buffered(self):
         #TODO: test this
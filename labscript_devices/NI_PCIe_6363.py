@@ -325,6 +325,7 @@ class NiPCIe6363AcquisitionWorker(Worker):
         exec 'from PyDAQmx.DAQmxConstants import *' in globals()
         exec 'from PyDAQmx.DAQmxTypes import *' in globals()
         global h5py; import labscript_utils.h5_lock, h5py
+        global create_roi_dataset; from labscript_utils.h5_chunking import create_roi_dataset
         global numpy; import numpy
         global threading; import threading
         global zprocess; import zprocess
@@ -626,7 +627,7 @@ class NiPCIe6363AcquisitionWorker(Worker):
                 data = numpy.empty(len(values),dtype=dtypes)
                 data['t'] = times
                 data['values'] = values
-                measurements.create_dataset(label, data=data)
+                create_roi_dataset(measurements, label, data)
             
     def abort_buffered(self):
         #TODO: test this
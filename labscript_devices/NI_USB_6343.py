@@ -317,6 +317,7 @@ class NI_USB_6343AcquisitionWorker(Worker):
         exec 'from PyDAQmx.DAQmxConstants import *' in globals()
         exec 'from PyDAQmx.DAQmxTypes import *' in globals()
         global h5py; import labscript_utils.h5_lock, h5py
+        global create_roi_dataset; from labscript_utils.h5_chunking import create_roi_dataset
         global numpy; import numpy
         global threading; import threading
         global zprocess; import zprocess
@@ -607,7 +608,7 @@ class NI_USB_6343AcquisitionWorker(Worker):
                 data = numpy.empty(len(values),dtype=dtypes)
                 data['t'] = times
                 data['values'] = values
-                measurements.create_dataset(label, data=data)
+                create_roi_dataset(measurements, label, data)
             
     def abort_buffered(self):
         #TODO: test this
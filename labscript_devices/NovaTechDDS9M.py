@@ -11,8 +11,9 @@
 #                                                                   #
 #####################################################################
 from labscript_devices import runviewer_parser, labscript_device, BLACS_tab, BLACS_worker
+from labscript_devices.runviewer_utils import clock_ticks as get_clock_ticks, table_on_ticks, constant_on_ticks, compact_trace
 
-from labscript import IntermediateDevice, DDS, StaticDDS, Device, config, LabscriptError, set_passed_properties
+from labscript import IntermediateDevice, DDS, StaticDDS, Device, config, create_table, LabscriptError, set_passed_properties
 from labscript_utils.unitconversions import NovaTechDDS9mFreqConversion, NovaTechDDS9mAmpConversion
 
 import numpy as np
@@ -198,8 +199,8 @@ class NovaTechDDS9M(IntermediateDevice):
             out_table = np.concatenate([out_table[0:1], out_table])
 
         grp = self.init_device_group(hdf5_file)
-        grp.create_dataset('TABLE_DATA',compression=config.compression,data=out_table)
-        grp.create_dataset('STATIC_DATA',compression=config.compression,data=static_table)
+        create_table(grp, 'TABLE_DATA', out_table)
+        create_table(grp, 'STATIC_DATA', static_table)
         self.set_property('frequency_scale_factor', 10, location='device_properties')
         self.set_property('amplitude_scale_factor', 1023, location='device_properties')
         self.set_property('phase_scale_factor', 45.511111111111113, location='device_properties')
@@ -515,14 +516,7 @@ class RunviewerClass(object):
             # we're the master pseudoclock, software triggered. So we don't have to worry about trigger delays, etc
             raise Exception('No clock passed to %s. The NovaTechDDS9M must be clocked by another device.'%self.name)
 
-        times, clock_value = clock[0], clock[1]
-
-        clock_indices = np.where((clock_value[1:]-clock_value[:-1])==1)[0]+1
-        # If initial clock value is 1, then this counts as a rising edge (clock should be 0 before experiment)
-        # but this is not picked up by the above code. So we insert it!
-        if clock_value[0] == 1:
-            clock_indices = np.insert(clock_indices, 0, 0)
-        clock_ticks = times[clock_indices]
+        clock_ticks = get_clock_ticks(clock)
 
         # get the data out of the H5 file
         data = {}
@@ -531,23 +525,18 @@ class RunviewerClass(object):
                 table_data = f['devices/%s/TABLE_DATA'%self.name][:]
                 for i in range(2):
                     for sub_chnl in ['freq', 'amp', 'phase']:
-                        data['channel %d_%s'%(i,sub_chnl)] = table_data['%s%d'%(sub_chnl,i)][:]
+                        data['channel %d_%s'%(i,sub_chnl)] = table_on_ticks(clock_ticks, table_data['%s%d'%(sub_chnl,i)])
 
             if 'STATIC_DATA' in f['devices/%s'%self.name]:
                 static_data = f['devices/%s/STATIC_DATA'%self.name][:]
                 for i in range(2,4):
                     for sub_chnl in ['freq', 'amp', 'phase']:
-                        data['channel %d_%s'%(i,sub_chnl)] = np.empty((len(clock_ticks),))
-                        data['channel %d_%s'%(i,sub_chnl)].fill(static_data['%s%d'%(sub_chnl,i)][0])
-
-
-        for channel, channel_data in data.items():
-            data[channel] = (clock_ticks, channel_data)
+                        data['channel %d_%s'%(i,sub_chnl)] = constant_on_ticks(clock_ticks, static_data['%s%d'%(sub_chnl,i)][0])
 
         for channel_name, channel in self.device.child_list.items():
             for subchnl_name, subchnl in channel.child_list.items():
                 connection = '%s_%s'%(channel.parent_port, subchnl.parent_port)
                 if connection in data:
-                    add_trace(subchnl.name, data[connection], self.name, connection)
+                    add_trace(subchnl.name, compact_trace(data[connection]), self.name, connection)
 
         return {}
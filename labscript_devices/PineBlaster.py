@@ -11,8 +11,9 @@
 #                                                                   #
 #####################################################################
 
-from labscript import PseudoclockDevice, Pseudoclock, ClockLine, config, LabscriptError, set_passed_properties
+from labscript import PseudoclockDevice, Pseudoclock, ClockLine, config, create_table, LabscriptError, set_passed_properties
 from labscript_devices import runviewer_parser, BLACS_tab, BLACS_worker, labscript_device
+from labscript_devices.runviewer_utils import clock_ticks as get_clock_ticks, expand_rows, segment_start_times
 
 import numpy as np
 import labscript_utils.h5_lock, h5py
@@ -107,7 +108,7 @@ class PineBlaster(PseudoclockDevice):
         for i, instruction in enumerate(reduced_instructions):
             pulse_program[i]['period'] = instruction['period']
             pulse_program[i]['reps'] = instruction['reps']
-        group.create_dataset('PULSE_PROGRAM', compression = config.compression, data=pulse_program)
+        create_table(group, 'PULSE_PROGRAM', pulse_program)
         # TODO: is this needed, the PulseBlasters don't save it... 
         self.set_property('is_master_pseudoclock', self.is_master_pseudoclock, location='device_properties')
         self.set_property('stop_time', self.stop_time, location='device_properties')
@@ -129,46 +130,34 @@ class RunviewerClass(object):
         
             
     def get_traces(self, add_trace, clock=None):
-        if clock is not None:
-            times, clock_value = clock[0], clock[1]
-            clock_indices = np.where((clock_value[1:]-clock_value[:-1])==1)[0]+1
-            # If initial clock value is 1, then this counts as a rising edge (clock should be 0 before experiment)
-            # but this is not picked up by the above code. So we insert it!
-            if clock_value[0] == 1:
-                clock_indices = np.insert(clock_indices, 0, 0)
-            clock_ticks = times[clock_indices]
-
-        
-            
         # get the pulse program
         with h5py.File(self.path, 'r') as f:
             pulse_program = f['devices/%s/PULSE_PROGRAM'%self.name][:]
             
-        time = []
-        states = []
-        trigger_index = 0
-        t = 0 if clock is None else clock_ticks[trigger_index]+self.trigger_delay
-        trigger_index += 1
-        
         clock_factor = self.clock_resolution/2.
+        periods = pulse_program['period']
+        reps = pulse_program['reps']
+        # Rows with a period of zero are special: a WAIT if reps is one,
+        # otherwise the end of the program. Other rows each output reps
+        # pulses, a rising and a falling edge a half period apart each:
+        waits = (periods == 0) & (reps == 1)
+        pulsing = periods != 0
+        n_edges = np.where(pulsing, 2*reps, 0)
+        half_periods = periods*clock_factor
+        durations = n_edges*half_periods
         
-        for row in pulse_program:
-            if row['period'] == 0:
-                #special case
-                if row['reps'] == 1: # WAIT
-                    if clock is not None:
-                        t = clock_ticks[trigger_index]+self.trigger_delay
-                        trigger_index += 1
-                    else:
-                        t += self.wait_delay
-            else:    
-                for i in range(row['reps']):
-                    for j in range(1, -1, -1):
-                        time.append(t)
-                        states.append(j)
-                        t += row['period']*clock_factor
+        if clock is not None:
+            # We start at a trigger, and resume after each WAIT at the next one:
+            triggers = get_clock_ticks(clock) + self.trigger_delay
+            row_starts = segment_start_times(durations, waits, triggers)
+        else:
+            durations = np.where(waits, self.wait_delay, durations)
+            row_starts = segment_start_times(durations, np.zeros(len(durations), dtype=bool), [0])
         
-        clock = (np.array(time), np.array(states))
+        time = expand_rows(row_starts[pulsing], half_periods[pulsing], n_edges[pulsing])
+        # Every row has an even number of edges, so they alternate high, low:
+        states = (np.arange(len(time)) + 1) % 2
+        clock = (time, states)
         
         clocklines_and_triggers = {}
         for pseudoclock_name, pseudoclock in self.device.child_list.items():
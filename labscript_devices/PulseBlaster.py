@@ -11,12 +11,15 @@
 #                                                                   #
 #####################################################################
 from labscript_devices import labscript_device, BLACS_tab, BLACS_worker, runviewer_parser
+from labscript_devices.runviewer_utils import compact_trace
 
-from labscript import Device, PseudoclockDevice, Pseudoclock, ClockLine, IntermediateDevice, DigitalQuantity, DigitalOut, DDS, config, LabscriptError, set_passed_properties
+from labscript import Device, PseudoclockDevice, Pseudoclock, ClockLine, IntermediateDevice, DigitalQuantity, DigitalOut, DDS, config, create_table, LabscriptError, set_passed_properties
 
 import numpy as np
 
 import labscript_utils.h5_lock, h5py
+import hashlib
+from collections import OrderedDict
 
 class x(object):
     pass
@@ -64,6 +67,40 @@ def stop_profile(name):
     profiles[name]['max'] = profiles[name]['max'] if profiles[name]['max'] > runtime else runtime
     profiles[name]['average_time_per_call'] = profiles[name]['total_time']/profiles[name]['num_calls']
           
+def changed_rows(new_table, old_table):
+    """Returns the (first, last) indices of rows in new_table that differ
+    from those in old_table, or None if the two are identical. If old_table
+    is None or of a different length, all rows are considered changed."""
+    if old_table is None or len(old_table) != len(new_table):
+        if len(new_table) == 0:
+            return None
+        return 0, len(new_table) - 1
+    differing = np.flatnonzero(new_table != old_table)
+    if not len(differing):
+        return None
+    return differing[0], differing[-1]
+    
+def program_pulse_program(pb_inst, pulse_program, previous_pulse_program=None):
+    """Programs the rows of pulse_program (a PULSE_PROGRAM table, not
+    including the two initial instructions) using the spinapi function
+    pb_inst (pb_inst_dds2 or pb_inst_pbonly), which must be called after
+    the first two instructions have been programmed.
+    
+    Instructions are programmed sequentially, so those before the first
+    changed row cannot be skipped. But if previous_pulse_program (the
+    program last written to the device) is of the same length, rows
+    after the last changed row are already correct in the device's memory
+    and are not programmed again. Arguments are converted to native
+    Python types all at once beforehand. Returns the number of rows
+    programmed."""
+    rows = changed_rows(pulse_program, previous_pulse_program)
+    if rows is None:
+        return 0
+    last = rows[1]
+    for args in pulse_program[:last + 1].tolist():
+        pb_inst(*args)
+    return last + 1
+    
 @labscript_device          
 class PulseBlaster(PseudoclockDevice):
     
@@ -93,6 +130,14 @@ class PulseBlaster(PseudoclockDevice):
     # This device can only have Pseudoclock children (digital outs and DDS outputs should be connected to a child device)
     allowed_children = [Pseudoclock]
     
+    # The layout of the PULSE_PROGRAM table written to the h5 file:
+    pb_dtype = [('freq0', np.int32), ('phase0', np.int32), ('amp0', np.int32), 
+                ('dds_en0', np.int32), ('phase_reset0', np.int32),
+                ('freq1', np.int32), ('phase1', np.int32), ('amp1', np.int32),
+                ('dds_en1', np.int32), ('phase_reset1', np.int32),
+                ('flags', np.int32), ('inst', np.int32),
+                ('inst_data', np.int32), ('length', np.float64)]
+    
     @set_passed_properties(
         property_names = {"connection_table_properties": ["firmware",  "programming_scheme"],
                           "device_properties": ["pulse_width"]}
@@ -303,9 +348,9 @@ class PulseBlaster(PseudoclockDevice):
             phase_table = np.array([0] + list(phases), dtype = np.float64)
             
             subgroup = group.create_group('DDS%d'%num)
-            subgroup.create_dataset('FREQ_REGS', compression=config.compression, data = freq_table)
-            subgroup.create_dataset('AMP_REGS', compression=config.compression, data = amp_table)
-            subgroup.create_dataset('PHASE_REGS', compression=config.compression, data = phase_table)
+            create_table(subgroup, 'FREQ_REGS', freq_table)
+            create_table(subgroup, 'AMP_REGS', amp_table)
+            create_table(subgroup, 'PHASE_REGS', phase_table)
             
         return freqdicts, ampdicts, phasedicts
         
@@ -485,15 +530,194 @@ class PulseBlaster(PseudoclockDevice):
             raise AssertionError('Invalid programming scheme %s'%str(self.programming_scheme))
         return pb_inst
         
+    def convert_to_pb_inst_table(self, dig_outputs, dds_outputs, freqs, amps, phases):
+        """Array-native equivalent of convert_to_pb_inst() followed by the
+        conversion in write_pb_inst_to_h5(). Computes the flag bitmasks,
+        register numbers, opcodes and delays for all clock instructions at
+        once with numpy, and returns the PULSE_PROGRAM structured array
+        (with dtype self.pb_dtype) directly, rather than a list of dicts."""
+        clock = self.pseudoclock.clock
+        n_clock = len(clock)
+        
+        # One pass over the clock instructions to pull out the few
+        # quantities we need as arrays. The clock flags enabled by each
+        # instruction are stored as a bitmask, with flag n in bit n:
+        clock_line_bits = {}
+        for clock_line in self.pseudoclock.child_devices:
+            if clock_line != self._direct_output_clock_line:
+                clock_line_bits[clock_line] = 1 << int(clock_line.connection.split()[1])
+        is_wait = np.zeros(n_clock, dtype=bool)
+        internal_tick = np.zeros(n_clock, dtype=np.int64)
+        clock_mask = np.zeros(n_clock, dtype=np.int64)
+        reps = np.zeros(n_clock, dtype=np.int64)
+        step = np.zeros(n_clock, dtype=np.float64)
+        for k, instruction in enumerate(clock):
+            if instruction == 'WAIT':
+                is_wait[k] = True
+                continue
+            for clock_line in instruction['enabled_clocks']:
+                if clock_line == self._direct_output_clock_line:
+                    internal_tick[k] = 1
+                else:
+                    clock_mask[k] |= clock_line_bits[clock_line]
+            reps[k] = instruction['reps']
+            step[k] = instruction['step']
+            
+        too_many_reps = np.flatnonzero(reps > 1048576)
+        if len(too_many_reps):
+            instruction = clock[too_many_reps[0]]
+            raise LabscriptError('Pulseblaster cannot support more than 1048576 loop iterations. ' +
+                                  str(instruction['reps']) +' were requested at t = ' + str(instruction['start']) + '. '+
+                                 'This can be fixed easily enough by using nested loops. If it is needed, ' +
+                                 'please file a feature request at' +
+                                 'http://redmine.physics.monash.edu.au/projects/labscript.')
+        
+        # Index into output.raw_output for each instruction. Starts at -1
+        # for the same reason as in convert_to_pb_inst():
+        i = np.cumsum(internal_tick) - 1
+        
+        # Flags set by the direct digital outputs:
+        dig_flags = np.zeros(n_clock, dtype=np.int64)
+        for output in dig_outputs:
+            flagindex = int(output.connection.split()[1])
+            if n_clock:
+                dig_flags |= np.asarray(output.raw_output, dtype=np.int64)[i] << flagindex
+                
+        # DDS registers. As in convert_to_pb_inst(), these are ones rather
+        # than zeros so that unused DDSs don't use the BLACS-inserted
+        # initial instructions:
+        regs = {}
+        for num in [0, 1]:
+            regs['freq%d'%num] = np.ones(n_clock, dtype=np.int64)
+            regs['amp%d'%num] = np.ones(n_clock, dtype=np.int64)
+            regs['phase%d'%num] = np.ones(n_clock, dtype=np.int64)
+            regs['dds_en%d'%num] = np.zeros(n_clock, dtype=np.int64)
+        def lookup_registers(register_dict, values):
+            # Vectorised version of [register_dict[value] for value in values]:
+            keys = np.array(list(register_dict.keys()))
+            registers = np.array(list(register_dict.values()))
+            order = np.argsort(keys)
+            return registers[order][np.searchsorted(keys[order], values)]
+        for output in dds_outputs:
+            ddsnumber = int(output.connection.split()[1])
+            if n_clock:
+                regs['freq%d'%ddsnumber] = lookup_registers(freqs[ddsnumber], np.asarray(output.frequency.raw_output)[i])
+                regs['amp%d'%ddsnumber] = lookup_registers(amps[ddsnumber], np.asarray(output.amplitude.raw_output)[i])
+                regs['phase%d'%ddsnumber] = lookup_registers(phases[ddsnumber], np.asarray(output.phase.raw_output)[i])
+                regs['dds_en%d'%ddsnumber] = np.asarray(output.gate.raw_output)[i]
+        
+        # Instruction delays > 55 secs will require a LONG_DELAY to be
+        # inserted, see convert_to_pb_inst():
+        only_internal = clock_mask == 0
+        delay = np.where(only_internal, step, step/2.0)
+        quotient = np.floor_divide(delay, 55.0)
+        remainder = np.remainder(delay, 55.0)
+        too_short = (quotient > 0) & (remainder < 100e-9)
+        quotient[too_short] -= 1
+        remainder[too_short] += 55.0
+        has_long_delay = quotient > 0
+        
+        # How many hardware instructions each clock instruction produces,
+        # and the index of the first of them. The first two instructions
+        # are the dummy ones that BLACS fills in:
+        n_inst = np.where(only_internal, 1, 2) + has_long_delay
+        n_inst[is_wait] = 1
+        start = 2 + np.cumsum(n_inst) - n_inst
+        n_rows = 2 + int(n_inst.sum()) + 1
+        
+        pb_inst_table = np.zeros(n_rows, dtype=self.pb_dtype)
+        fields = pb_inst_table.dtype.names
+        
+        # Register values and flags are the same for all hardware
+        # instructions belonging to one clock instruction. Flags for the
+        # LOOP instructions will have the clock flags added below:
+        owner = np.repeat(np.arange(n_clock), n_inst)
+        body = slice(2, n_rows - 1)
+        for name, values in regs.items():
+            if name in fields:
+                pb_inst_table[name][body] = values[owner]
+        pb_inst_table['flags'][body] = dig_flags[owner]
+        
+        # The dummy instructions:
+        pb_inst_table['inst'][:2] = self.pb_instructions['STOP']
+        pb_inst_table['length'][:2] = 10.0/self.clock_limit*1e9
+        
+        # Clocked instructions: LOOP, [LONG_DELAY], END_LOOP
+        clocked = ~only_internal & ~is_wait
+        loop_rows = start[clocked]
+        pb_inst_table['inst'][loop_rows] = self.pb_instructions['LOOP']
+        pb_inst_table['inst_data'][loop_rows] = reps[clocked]
+        pb_inst_table['length'][loop_rows] = self.pulse_width*1e9
+        pb_inst_table['flags'][loop_rows] |= clock_mask[clocked]
+        long_delay = clocked & has_long_delay
+        pb_inst_table['inst'][start[long_delay] + 1] = self.pb_instructions['LONG_DELAY']
+        pb_inst_table['inst_data'][start[long_delay] + 1] = (2*quotient[long_delay]).astype(np.int64)
+        pb_inst_table['length'][start[long_delay] + 1] = 55*1e9
+        end_loop_rows = start[clocked] + 1 + has_long_delay[clocked]
+        pb_inst_table['inst'][end_loop_rows] = self.pb_instructions['END_LOOP']
+        pb_inst_table['inst_data'][end_loop_rows] = loop_rows
+        pb_inst_table['length'][end_loop_rows] = (2*remainder[clocked] - self.pulse_width)*1e9
+        
+        # Instructions only updating direct outputs: CONTINUE, [LONG_DELAY]
+        internal = only_internal & ~is_wait
+        pb_inst_table['inst'][start[internal]] = self.pb_instructions['CONTINUE']
+        pb_inst_table['length'][start[internal]] = remainder[internal]*1e9
+        long_delay = internal & has_long_delay
+        pb_inst_table['inst'][start[long_delay] + 1] = self.pb_instructions['LONG_DELAY']
+        pb_inst_table['inst_data'][start[long_delay] + 1] = quotient[long_delay].astype(np.int64)
+        pb_inst_table['length'][start[long_delay] + 1] = 55*1e9
+        
+        # WAIT instructions repeat the previous instruction's registers and
+        # flags, with a 100ns delay. Forward fill from the nearest non-wait
+        # instruction so that consecutive waits are handled too:
+        wait_rows = start[is_wait]
+        if len(wait_rows):
+            row_is_wait = np.zeros(n_rows, dtype=bool)
+            row_is_wait[wait_rows] = True
+            source = np.maximum.accumulate(np.where(row_is_wait, 0, np.arange(n_rows)))
+            for name in fields:
+                if name not in ('inst', 'inst_data', 'length'):
+                    pb_inst_table[name][wait_rows] = pb_inst_table[name][source[wait_rows]]
+            pb_inst_table['inst'][wait_rows] = self.pb_instructions['WAIT']
+            pb_inst_table['length'][wait_rows] = 100
+            
+        # The final instruction has the same registers and flags as the
+        # one before it. See convert_to_pb_inst() for the two schemes:
+        if self.programming_scheme == 'pb_start/BRANCH':
+            final_instruction = 'BRANCH'
+        elif self.programming_scheme == 'pb_stop_programming/STOP':
+            final_instruction = 'STOP'
+        else:
+            raise AssertionError('Invalid programming scheme %s'%str(self.programming_scheme))
+        pb_inst_table[-1] = pb_inst_table[-2]
+        pb_inst_table['inst'][-1] = self.pb_instructions[final_instruction]
+        pb_inst_table['inst_data'][-1] = 0
+        pb_inst_table['length'][-1] = 10.0/self.clock_limit*1e9
+        return pb_inst_table
+        
+    def write_pulse_program(self, hdf5_file, dig_outputs, dds_outputs, freqs, amps, phases):
+        """Writes the pulse program to the shot file with
+        convert_to_pb_inst_table(), unless a subclass overrides
+        convert_to_pb_inst() (and not convert_to_pb_inst_table()) to customise
+        the instructions, in which case its list of instructions is written
+        with write_pb_inst_to_h5() as before."""
+        cls = self.__class__
+        if (cls.convert_to_pb_inst.im_func is not PulseBlaster.convert_to_pb_inst.im_func and
+                cls.convert_to_pb_inst_table.im_func is PulseBlaster.convert_to_pb_inst_table.im_func):
+            pb_inst = self.convert_to_pb_inst(dig_outputs, dds_outputs, freqs, amps, phases)
+            self.write_pb_inst_to_h5(pb_inst, hdf5_file)
+        else:
+            pb_inst_table = self.convert_to_pb_inst_table(dig_outputs, dds_outputs, freqs, amps, phases)
+            self.write_pb_inst_table_to_h5(pb_inst_table, hdf5_file)
+        
+    def write_pb_inst_table_to_h5(self, pb_inst_table, hdf5_file):
+        group = hdf5_file['/devices/'+self.name]  
+        create_table(group, 'PULSE_PROGRAM', pb_inst_table)
+        self.set_property('stop_time', self.stop_time, location='device_properties')
+        
     def write_pb_inst_to_h5(self, pb_inst, hdf5_file):
         # OK now we squeeze the instructions into a numpy array ready for writing to hdf5:
-        pb_dtype = [('freq0', np.int32), ('phase0', np.int32), ('amp0', np.int32), 
-                    ('dds_en0', np.int32), ('phase_reset0', np.int32),
-                    ('freq1', np.int32), ('phase1', np.int32), ('amp1', np.int32),
-                    ('dds_en1', np.int32), ('phase_reset1', np.int32),
-                    ('flags', np.int32), ('inst', np.int32),
-                    ('inst_data', np.int32), ('length', np.float64)]
-        pb_inst_table = np.empty(len(pb_inst),dtype = pb_dtype)
+        pb_inst_table = np.empty(len(pb_inst),dtype = self.pb_dtype)
         for i,inst in enumerate(pb_inst):
             flagint = int(inst['flags'][::-1],2)
             instructionint = self.pb_instructions[inst['instruction']]
@@ -512,7 +736,7 @@ class PulseBlaster(PseudoclockDevice):
                                 
         # Okay now write it to the file: 
         group = hdf5_file['/devices/'+self.name]  
-        group.create_dataset('PULSE_PROGRAM', compression=config.compression,data = pb_inst_table)   
+        create_table(group, 'PULSE_PROGRAM', pb_inst_table)
         self.set_property('stop_time', self.stop_time, location='device_properties')
 
         
@@ -522,8 +746,7 @@ class PulseBlaster(PseudoclockDevice):
         PseudoclockDevice.generate_code(self, hdf5_file)
         dig_outputs, dds_outputs = self.get_direct_outputs()
         freqs, amps, phases = self.generate_registers(hdf5_file, dds_outputs)
-        pb_inst = self.convert_to_pb_inst(dig_outputs, dds_outputs, freqs, amps, phases)
-        self.write_pb_inst_to_h5(pb_inst, hdf5_file)
+        self.write_pulse_program(hdf5_file, dig_outputs, dds_outputs, freqs, amps, phases)
         
 
 class PulseBlasterDirectOutputs(IntermediateDevice):
@@ -888,12 +1111,10 @@ class PulseblasterWorker(Worker):
                         initial_flags += '0'
                 # Line one is a continue with the current front panel values:
                 pb_inst_dds2(0,0,0,initial_values['dds 0']['gate'],0,0,0,0,initial_values['dds 1']['gate'],0,initial_flags, CONTINUE, 0, 100)
-                # Now the rest of the program:
-                if fresh or len(self.smart_cache['pulse_program']) != len(pulse_program) or \
-                (self.smart_cache['pulse_program'] != pulse_program).any():
-                    self.smart_cache['pulse_program'] = pulse_program
-                    for args in pulse_program:
-                        pb_inst_dds2(*args)
+                # Now the rest of the program, skipping the unchanged rows at the end:
+                previous_pulse_program = None if fresh else self.smart_cache['pulse_program']
+                program_pulse_program(pb_inst_dds2, pulse_program, previous_pulse_program)
+                self.smart_cache['pulse_program'] = pulse_program
             
             if self.programming_scheme == 'pb_start/BRANCH':
                 # We will be triggered by pb_start() if we are are the master pseudoclock or a single hardware trigger
@@ -965,6 +1186,11 @@ class PulseblasterWorker(Worker):
       
 
             
+# Traces decoded by PulseBlasterParser, keyed by a hash of the instructions
+# they were decoded from, least recently used first:
+_decoded_traces_cache = OrderedDict()
+DECODED_TRACES_CACHE_SIZE = 10
+
 @runviewer_parser
 class PulseBlasterParser(object):
     num_dds = 2
@@ -1013,6 +1239,141 @@ class PulseBlasterParser(object):
                 for reg in ['FREQ', 'AMP', 'PHASE']:
                     dds[i][reg] = f['devices/%s/DDS%d/%s_REGS'%(self.name, i, reg)][:]
         
+        # Decoded traces are cached by a hash of everything they depend on,
+        # so that re-opening a shot (or another shot with the same
+        # instructions) doesn't require decoding them again:
+        cache_key = hashlib.sha1()
+        cache_key.update(self.__class__.__name__)
+        cache_key.update(str(parent is None))
+        cache_key.update(pulse_program.tostring())
+        for i in range(self.num_dds):
+            for reg in ['FREQ', 'AMP', 'PHASE']:
+                cache_key.update(dds[i][reg].tostring())
+        cache_key = cache_key.hexdigest()
+        if cache_key in _decoded_traces_cache:
+            to_return = _decoded_traces_cache.pop(cache_key)
+        else:
+            to_return = self._decode_pulse_program(pulse_program, dds, parent)
+            for name, trace in to_return.items():
+                to_return[name] = compact_trace(trace)
+            while len(_decoded_traces_cache) >= DECODED_TRACES_CACHE_SIZE:
+                _decoded_traces_cache.popitem(last=False)
+        # Most recently used last:
+        _decoded_traces_cache[cache_key] = to_return
+        
+        # if slow_clock_flag is not None:
+            # to_return['slow clock'] = to_return['flag %d'%slow_clock_flag[0]]
+            
+        clocklines_and_triggers = {}
+        for pseudoclock_name, pseudoclock in self.device.child_list.items():
+            for clock_line_name, clock_line in pseudoclock.child_list.items():
+                if clock_line.parent_port == 'internal':
+                    parent_device_name = '%s.direct_outputs'%self.name
+                    for internal_device_name, internal_device in clock_line.child_list.items():
+                        for channel_name, channel in internal_device.child_list.items():
+                            if channel.device_class == 'Trigger':
+                                clocklines_and_triggers[channel_name] = to_return[channel.parent_port]
+                                add_trace(channel_name, to_return[channel.parent_port], parent_device_name, channel.parent_port)
+                            else:
+                                if channel.device_class == 'DDS':
+                                    for subchnl_name, subchnl in channel.child_list.items():
+                                        connection = '%s_%s'%(channel.parent_port, subchnl.parent_port)
+                                        if connection in to_return:
+                                            add_trace(subchnl.name, to_return[connection], parent_device_name, connection)
+                                else:
+                                    add_trace(channel_name, to_return[channel.parent_port], parent_device_name, channel.parent_port)
+                else:
+                    clocklines_and_triggers[clock_line_name] = to_return[clock_line.parent_port]
+                    add_trace(clock_line_name, to_return[clock_line.parent_port], self.name, clock_line.parent_port)
+            
+        return clocklines_and_triggers
+    
+    def _decode_pulse_program(self, pulse_program, dds, parent):
+        """Returns a dictionary of (times, values) traces for each flag and
+        DDS output. Programs with the loop structure that the labscript
+        compiler produces are decoded with numpy, anything else instruction
+        by instruction with _interpret_pulse_program()"""
+        rows = self._unroll_pulse_program(pulse_program)
+        if rows is None:
+            return self._interpret_pulse_program(pulse_program, dds, parent)
+        row_indices, top_level = rows
+        
+        # The time each executed instruction starts at is the cumulative
+        # sum of the lengths of the ones before it, plus the trigger delay
+        # after each (top-level) WAIT if we are not the master pseudoclock:
+        t0 = 0. if parent is None else PulseBlaster.trigger_delay # Offset by initial trigger of parent
+        durations = pulse_program['length'][row_indices]*1.0e-9
+        waits = (pulse_program['inst'][row_indices] == 8) & top_level
+        if parent is not None:
+            durations[waits] += PulseBlaster.trigger_delay
+        times = np.cumsum(np.concatenate([[t0], durations]))
+        clock = times[:-1]
+        for t in clock[waits]:
+            print 'Wait at %.9f'%t
+        print 'Stop time: %.9f'%times[-1]
+        
+        # Decode the flags of every row of the program (rather than of
+        # every executed instruction) in one go. Viewing the flags as
+        # little endian bytes and reversing the bit order within each byte
+        # puts flag n in column n:
+        flag_bytes = pulse_program['flags'].astype('<u4').view(np.uint8).reshape(-1, 4)
+        flag_bits = np.unpackbits(flag_bytes, axis=1).reshape(-1, 4, 8)[:, :, ::-1].reshape(-1, 32)
+        
+        to_return = {}
+        for i in range(self.num_flags):
+            to_return['flag %d'%i] = (clock, flag_bits[row_indices, i].astype(int))
+        for i in range(self.num_dds):
+            freqs = dds[i]['FREQ'][pulse_program['freq%d'%i]]
+            phases = dds[i]['PHASE'][pulse_program['phase%d'%i]]
+            amps = np.where(pulse_program['dds_en%d'%i], dds[i]['AMP'][pulse_program['amp%d'%i]], 0).astype(np.float64)
+            to_return['dds %d_freq'%i] = (clock, freqs[row_indices])
+            to_return['dds %d_phase'%i] = (clock, phases[row_indices])
+            to_return['dds %d_amp'%i] = (clock, amps[row_indices])
+        return to_return
+        
+    def _unroll_pulse_program(self, pulse_program):
+        """Returns the indices of the rows of the pulse program in the order
+        they are executed, with loops unrolled, and a boolean array saying
+        which of them are not within a loop. The first two (dummy)
+        instructions are not included. Returns None if the program contains
+        loop structures other than the non-nested LOOP/END_LOOP pairs that
+        the labscript compiler produces."""
+        inst = pulse_program['inst'][2:]
+        inst_data = pulse_program['inst_data'][2:]
+        loop_starts = np.flatnonzero(inst == 2)
+        loop_ends = np.flatnonzero(inst == 3)
+        if len(loop_starts) != len(loop_ends):
+            return None
+        # Each loop must end before the next begins, jump back to its own
+        # start, and be executed at least once:
+        if (np.any(loop_ends < loop_starts) or np.any(loop_starts[1:] <= loop_ends[:-1]) or
+                np.any(inst_data[loop_ends] != loop_starts + 2) or np.any(inst_data[loop_starts] < 1)):
+            return None
+                
+        # Split the program into segments, each of which is a block of rows
+        # executed some number of times. Segments alternate between rows
+        # outside of loops (executed once, possibly zero rows long) and
+        # loops (executed inst_data times):
+        n_segments = 2*len(loop_starts) + 1
+        seg_starts = np.empty(n_segments, dtype=int)
+        seg_lengths = np.empty(n_segments, dtype=int)
+        seg_reps = np.ones(n_segments, dtype=int)
+        seg_starts[0::2] = np.concatenate([[0], loop_ends + 1])
+        seg_lengths[0::2] = np.concatenate([loop_starts, [len(inst)]]) - seg_starts[0::2]
+        seg_starts[1::2] = loop_starts
+        seg_lengths[1::2] = loop_ends - loop_starts + 1
+        seg_reps[1::2] = inst_data[loop_starts]
+        
+        # Unroll the segments. Each contributes length*reps executed
+        # instructions, cycling through its rows reps times:
+        seg_sizes = seg_lengths*seg_reps
+        segment = np.repeat(np.arange(n_segments), seg_sizes)
+        position = np.arange(len(segment)) - np.repeat(np.cumsum(seg_sizes) - seg_sizes, seg_sizes)
+        row_indices = 2 + seg_starts[segment] + position % seg_lengths[segment]
+        top_level = segment % 2 == 0
+        return row_indices, top_level
+        
+    def _interpret_pulse_program(self, pulse_program, dds, parent):
         clock = []
         traces = {}
         for i in range(self.num_flags):
@@ -1091,35 +1452,8 @@ class PulseBlasterParser(object):
         clock = np.array(clock, dtype=np.float64)
         for name, data in traces.items():
             to_return[name] = (clock, np.array(data))
-            
+        return to_return
         
-        # if slow_clock_flag is not None:
-            # to_return['slow clock'] = to_return['flag %d'%slow_clock_flag[0]]
-            
-        clocklines_and_triggers = {}
-        for pseudoclock_name, pseudoclock in self.device.child_list.items():
-            for clock_line_name, clock_line in pseudoclock.child_list.items():
-                if clock_line.parent_port == 'internal':
-                    parent_device_name = '%s.direct_outputs'%self.name
-                    for internal_device_name, internal_device in clock_line.child_list.items():
-                        for channel_name, channel in internal_device.child_list.items():
-                            if channel.device_class == 'Trigger':
-                                clocklines_and_triggers[channel_name] = to_return[channel.parent_port]
-                                add_trace(channel_name, to_return[channel.parent_port], parent_device_name, channel.parent_port)
-                            else:
-                                if channel.device_class == 'DDS':
-                                    for subchnl_name, subchnl in channel.child_list.items():
-                                        connection = '%s_%s'%(channel.parent_port, subchnl.parent_port)
-                                        if connection in to_return:
-                                            add_trace(subchnl.name, to_return[connection], parent_device_name, connection)
-                                else:
-                                    add_trace(channel_name, to_return[channel.parent_port], parent_device_name, channel.parent_port)
-                else:
-                    clocklines_and_triggers[clock_line_name] = to_return[clock_line.parent_port]
-                    add_trace(clock_line_name, to_return[clock_line.parent_port], self.name, clock_line.parent_port)
-            
-        return clocklines_and_triggers
-    
     @profile
     def _add_pulse_program_row_from_buffer(self, traces, index):
         for i in range(self.num_flags):
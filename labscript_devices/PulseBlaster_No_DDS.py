@@ -12,8 +12,8 @@
 #####################################################################
 
 from labscript_devices import labscript_device, BLACS_tab, BLACS_worker, runviewer_parser
-from labscript_devices.PulseBlaster import PulseBlaster, PulseBlasterParser
-from labscript import PseudoclockDevice, config
+from labscript_devices.PulseBlaster import PulseBlaster, PulseBlasterParser, program_pulse_program
+from labscript import PseudoclockDevice, config, create_table
 
 import numpy as np
 
@@ -44,11 +44,12 @@ class PulseBlaster_No_DDS(PulseBlaster):
     clock_resolution = 20e-9
     n_flags = 24
     
+    pb_dtype = [('flags',np.int32), ('inst',np.int32),
+                ('inst_data',np.int32), ('length',np.float64)]
+    
     def write_pb_inst_to_h5(self, pb_inst, hdf5_file):
         # OK now we squeeze the instructions into a numpy array ready for writing to hdf5:
-        pb_dtype = [('flags',np.int32), ('inst',np.int32),
-                    ('inst_data',np.int32), ('length',np.float64)]
-        pb_inst_table = np.empty(len(pb_inst),dtype = pb_dtype)
+        pb_inst_table = np.empty(len(pb_inst),dtype = self.pb_dtype)
         for i,inst in enumerate(pb_inst):
             flagint = int(inst['flags'][::-1],2)
             instructionint = self.pb_instructions[inst['instruction']]
@@ -58,7 +59,7 @@ class PulseBlaster_No_DDS(PulseBlaster):
         
         # Okay now write it to the file: 
         group = hdf5_file['/devices/'+self.name]  
-        group.create_dataset('PULSE_PROGRAM', compression=config.compression,data = pb_inst_table)         
+        create_table(group, 'PULSE_PROGRAM', pb_inst_table)
         self.set_property('stop_time', self.stop_time, location='device_properties')
         
     def generate_code(self, hdf5_file):
@@ -66,8 +67,7 @@ class PulseBlaster_No_DDS(PulseBlaster):
         self.init_device_group(hdf5_file)
         PseudoclockDevice.generate_code(self, hdf5_file)
         dig_outputs, ignore = self.get_direct_outputs()
-        pb_inst = self.convert_to_pb_inst(dig_outputs, [], {}, {}, {})
-        self.write_pb_inst_to_h5(pb_inst, hdf5_file) 
+        self.write_pulse_program(hdf5_file, dig_outputs, [], {}, {}, {})
         
 
 from blacs.tab_base_classes import Worker, define_state
@@ -365,12 +365,10 @@ class PulseblasterNoDDSWorker(Worker):
                                         
                 # Line one is a continue with the current front panel values:
                 pb_inst_pbonly(initial_flags, CONTINUE, 0, 100)
-                # Now the rest of the program:
-                if fresh or len(self.smart_cache['pulse_program']) != len(pulse_program) or \
-                (self.smart_cache['pulse_program'] != pulse_program).any():
-                    self.smart_cache['pulse_program'] = pulse_program
-                    for args in pulse_program:
-                        pb_inst_pbonly(*args)
+                # Now the rest of the program, skipping the unchanged rows at the end:
+                previous_pulse_program = None if fresh else self.smart_cache['pulse_program']
+                program_pulse_program(pb_inst_pbonly, pulse_program, previous_pulse_program)
+                self.smart_cache['pulse_program'] = pulse_program
                         
             if self.programming_scheme == 'pb_start/BRANCH':
                 # We will be triggered by pb_start() if we are are the master pseudoclock or a single hardware trigger
@@ -12,7 +12,7 @@
 #####################################################################
 
 import os
-from labscript import PseudoclockDevice, Pseudoclock, ClockLine, IntermediateDevice, DDS, config, startupinfo, LabscriptError, set_passed_properties
+from labscript import PseudoclockDevice, Pseudoclock, ClockLine, IntermediateDevice, DDS, config, create_table, startupinfo, LabscriptError, set_passed_properties
 import numpy as np
 
 from labscript_devices import labscript_device, BLACS_tab, BLACS_worker, runviewer_parser
@@ -100,7 +100,7 @@ class RFBlaster(PseudoclockDevice):
             data['amp%s'%connection] = dds.amplitude.raw_output
             data['phase%s'%connection] = dds.phase.raw_output
         group = hdf5_file['devices'].create_group(self.name)
-        group.create_dataset('TABLE_DATA',compression=config.compression, data=data)
+        create_table(group, 'TABLE_DATA', data)
         
         # Quantise the data and save it to the h5 file:
         quantised_dtypes = [('time',np.int64),
@@ -114,7 +114,7 @@ class RFBlaster(PseudoclockDevice):
             quantised_data['freq%d'%dds] = np.array(c.fF*1e-6*data['freq%d'%dds] + 0.5)
             quantised_data['amp%d'%dds]  = np.array((2**c.bitsA - 1)*data['amp%d'%dds] + 0.5)
             quantised_data['phase%d'%dds] = np.array(c.pP*data['phase%d'%dds] + 0.5)
-        group.create_dataset('QUANTISED_DATA',compression=config.compression, data=quantised_data)
+        create_table(group, 'QUANTISED_DATA', quantised_data)
         # Generate some assembly code and compile it to machine code:
         assembly_group = group.create_group('ASSEMBLY_CODE')
         binary_group = group.create_group('BINARY_CODE')
@@ -165,7 +165,7 @@ class RFBlaster(PseudoclockDevice):
                     assembly_code = assembly_file.read()
                     assembly_group.create_dataset('DDS%d'%dds, data=assembly_code)
                     for i, diff_table in enumerate(diff_tables):
-                        diff_group.create_dataset('DDS%d_difftable%d'%(dds,i), compression=config.compression, data=diff_table)
+                        create_table(diff_group, 'DDS%d_difftable%d'%(dds,i), diff_table)
                 # compile to binary:
                 compilation = Popen([caspr,temp_assembly_filepath,temp_binary_filepath],
                                      stdout=PIPE, stderr=PIPE, cwd=rfjuice_folder,startupinfo=startupinfo)
@@ -19,7 +19,7 @@ except ImportError:
 check_version('labscript', '2.0.1', '3')
 
 from labscript_devices import labscript_device, BLACS_tab, BLACS_worker
-from labscript import TriggerableDevice, LabscriptError, set_passed_properties
+from labscript import TriggerableDevice, LabscriptError, set_passed_properties, create_table
 import numpy as np
 
 @labscript_device
@@ -83,7 +83,7 @@ class Tektronix_TDS2000(TriggerableDevice):
         group = self.init_device_group(hdf5_file)
 
         if self.captures:
-            group.create_dataset('CAPTURES', data=data)
+            create_table(group, 'CAPTURES', data)
 
 
 import os
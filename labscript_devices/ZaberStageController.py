@@ -12,7 +12,7 @@
 #####################################################################
 
 from labscript_devices import labscript_device, BLACS_tab, BLACS_worker
-from labscript import StaticAnalogQuantity, Device, LabscriptError, set_passed_properties
+from labscript import StaticAnalogQuantity, Device, LabscriptError, set_passed_properties, create_table
 import numpy as np
 
 class ZaberStageTLSR150D(StaticAnalogQuantity):
@@ -61,7 +61,7 @@ class ZaberStageController(Device):
         for conn in data_dict:
             data_array[0][conn] = data_dict[conn] 
         grp = hdf5_file.create_group('/devices/'+self.name)
-        grp.create_dataset('static_values', data=data_array)
+        create_table(grp, 'static_values', data_array)
         
 
 import time
@@ -0,0 +1,146 @@
+#####################################################################
+#                                                                   #
+# /mock_spinapi.py                                                  #
+#                                                                   #
+# Copyright 2013, Monash University                                 #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+
+"""A stand-in for the parts of the spinapi module used by the PulseBlaster
+BLACS workers. Instead of talking to hardware, programmed instructions
+are recorded in memory, so that programming of pulse programs can be
+tested and benchmarked without a PulseBlaster.
+
+To have the PulseBlaster workers use it in place of spinapi, call
+install() before the worker's init() method runs.
+
+Run this module as a script to benchmark programming a long pulse program
+in which one instruction has changed since the previous shot."""
+
+import sys
+import time
+
+import numpy as np
+
+# Instruction opcodes and memory devices, as defined in spinapi:
+CONTINUE = 0
+STOP = 1
+LOOP = 2
+END_LOOP = 3
+JSR = 4
+RTS = 5
+BRANCH = 6
+LONG_DELAY = 7
+WAIT = 8
+
+PULSE_PROGRAM = 0
+FREQ_REGS = 1
+PHASE_REGS = 2
+
+# The state of the mock device:
+board = {'programming': None, 'address': 0, 'pulse_program': [], 'running': False}
+
+
+def install():
+    """Make this module importable as spinapi, so that the PulseBlaster
+    workers use it instead of the real one"""
+    sys.modules['spinapi'] = sys.modules[__name__]
+
+def pb_select_board(board_number):
+    return 0
+
+def pb_init():
+    return 0
+
+def pb_close():
+    return 0
+
+def pb_core_clock(clock_freq):
+    return 0
+
+def pb_select_dds(dds):
+    return 0
+
+def pb_start():
+    board['running'] = True
+    return 0
+
+def pb_stop():
+    board['running'] = False
+    return 0
+
+def pb_reset():
+    board['running'] = False
+    return 0
+
+def pb_read_status():
+    return {'stopped': not board['running'], 'reset': False, 'running': board['running'], 'waiting': False}
+
+def pb_start_programming(device):
+    board['programming'] = device
+    board['address'] = 0
+    return 0
+
+def pb_stop_programming():
+    board['programming'] = None
+    return 0
+
+def _write_instruction(args):
+    if board['programming'] != PULSE_PROGRAM:
+        raise RuntimeError('pb_start_programming(PULSE_PROGRAM) has not been called')
+    address = board['address']
+    if address < len(board['pulse_program']):
+        board['pulse_program'][address] = args
+    else:
+        board['pulse_program'].append(args)
+    board['address'] += 1
+    return address
+
+def pb_inst_pbonly(flags, inst, inst_data, length):
+    return _write_instruction((flags, inst, inst_data, length))
+
+def pb_inst_dds2(freq0, phase0, amp0, dds_en0, phase_reset0,
+                 freq1, phase1, amp1, dds_en1, phase_reset1,
+                 flags, inst, inst_data, length):
+    return _write_instruction((freq0, phase0, amp0, dds_en0, phase_reset0,
+                               freq1, phase1, amp1, dds_en1, phase_reset1,
+                               flags, inst, inst_data, length))
+
+def program_freq_regs(*freqs, **kwargs):
+    return 0
+
+def program_phase_regs(*phases, **kwargs):
+    return 0
+
+def program_amp_regs(*amps):
+    return 0
+
+
+def benchmark(n_instructions=100000):
+    from labscript_devices.PulseBlaster import PulseBlaster, program_pulse_program
+    pulse_program = np.zeros(n_instructions, dtype=PulseBlaster.pb_dtype)
+    pulse_program['flags'] = np.random.randint(0, 1 << 12, n_instructions)
+    pulse_program['inst'] = CONTINUE
+    pulse_program['length'] = 1000
+    previous_pulse_program = pulse_program.copy()
+    pulse_program['flags'][n_instructions//2] += 1
+
+    pb_start_programming(PULSE_PROGRAM)
+    start_time = time.time()
+    for args in pulse_program:
+        pb_inst_dds2(*args)
+    print('Programming row by row: %.3f s' % (time.time() - start_time))
+
+    pb_start_programming(PULSE_PROGRAM)
+    start_time = time.time()
+    n_programmed = program_pulse_program(pb_inst_dds2, pulse_program, previous_pulse_program)
+    print('program_pulse_program: %.3f s (%d of %d rows programmed)' % (time.time() - start_time, n_programmed, n_instructions))
+
+
+if __name__ == '__main__':
+    benchmark()
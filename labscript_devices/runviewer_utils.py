@@ -0,0 +1,103 @@
+#####################################################################
+#                                                                   #
+# /runviewer_utils.py                                               #
+#                                                                   #
+# Copyright 2013, Monash University                                 #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+
+"""Vectorised operations common to the runviewer parsers of many devices:
+finding the ticks of the clock a device is given, putting the rows of a
+device's output table at those ticks, expanding instructions into the
+edges of the clock a pseudoclock outputs, and making step functions
+compact."""
+
+import numpy as np
+
+
+def clock_ticks(clock):
+    """Returns the times of the rising edges of a clock, given as a (times,
+    values) trace of zeros and ones. An initial value of one counts as a
+    rising edge, as clocks are low before the experiment starts."""
+    times, values = clock[0], clock[1]
+    values = np.asarray(values, dtype=int)
+    if not len(values):
+        return np.asarray(times)[:0]
+    edges = np.flatnonzero(np.diff(values) == 1) + 1
+    if values[0] == 1:
+        edges = np.concatenate([[0], edges])
+    return np.asarray(times)[edges]
+
+
+def table_on_ticks(ticks, table):
+    """Returns a (times, values) trace of a device output that takes the
+    values in successive rows of table at successive clock ticks. Rows
+    beyond the last tick, or ticks beyond the last row, are ignored."""
+    n = min(len(ticks), len(table))
+    return ticks[:n], np.asarray(table)[:n]
+
+
+def constant_on_ticks(ticks, value):
+    """Returns a (times, values) trace of an output that has the same value
+    at every clock tick, such as a static output"""
+    values = np.empty(len(ticks))
+    values.fill(value)
+    return ticks, values
+
+
+def expand_rows(starts, intervals, counts):
+    """Returns the times of events produced by rows of an instruction table,
+    where each row produces counts[i] events, spaced by intervals[i],
+    beginning at starts[i]. Rows producing no events are allowed."""
+    starts = np.asarray(starts, dtype=float)
+    intervals = np.asarray(intervals, dtype=float)
+    counts = np.asarray(counts, dtype=int)
+    # The index of each event within its row:
+    first_events = np.cumsum(counts) - counts
+    index_in_row = np.arange(counts.sum()) - np.repeat(first_events, counts)
+    return np.repeat(starts, counts) + index_in_row*np.repeat(intervals, counts)
+
+
+def segment_start_times(durations, resets, reset_times):
+    """Returns the start time of each row of an instruction table, given the
+    duration of each row, where the rows flagged in resets (such as waits
+    for a trigger) start at the next of reset_times instead of when the
+    previous row ends. The first row starts at reset_times[0]."""
+    durations = np.asarray(durations, dtype=float)
+    resets = np.asarray(resets, dtype=bool)
+    # Time elapsed since the start of the program at the start of each row,
+    # and the segment (separated by resets) that each row is in:
+    elapsed = np.cumsum(durations) - durations
+    segment = np.cumsum(resets)
+    segment_first_rows = np.concatenate([[0], np.flatnonzero(resets)])
+    segment_starts = np.asarray(reset_times, dtype=float)[:len(segment_first_rows)]
+    return segment_starts[segment] + elapsed - elapsed[segment_first_rows][segment]
+
+
+def compact_step_function(times, values):
+    """Returns a step function trace with only the points at which its
+    value changes, along with its first and last points"""
+    times = np.asarray(times)
+    values = np.asarray(values)
+    if len(values) < 3:
+        return times, values
+    changes = np.empty(len(values), dtype=bool)
+    changes[0] = changes[-1] = True
+    np.not_equal(values[1:-1], values[:-2], out=changes[1:-1])
+    return times[changes], values[changes]
+
+
+def compact_trace(trace):
+    """Returns a trace, (times, values) optionally followed by units, in the
+    compact form that parsers give to runviewer: only the points at which
+    the value changes, and the first and last points. Runviewer holds each
+    value until the next point, and the last until the shot's stop time, so
+    nothing is lost, and a digital line that toggles a few times in a shot
+    is a few points rather than one per clock tick."""
+    times, values = compact_step_function(trace[0], trace[1])
+    return (times, values) + tuple(trace[2:])
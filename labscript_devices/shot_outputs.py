@@ -0,0 +1,125 @@
+#####################################################################
+#                                                                   #
+# /shot_outputs.py                                                  #
+#                                                                   #
+# Copyright 2013, Monash University                                 #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+
+"""The values of the outputs of a compiled shot at arbitrary times, for
+cross-referencing acquisitions with what was output when they were taken.
+
+The device tables in the shot file are decoded once per shot with the
+runviewer parsers of the devices, which give each channel as a step
+function with a point only where its value changes. These change points are
+kept as an index per channel, and a query for the value at any number of
+times is a single binary search of them, without expanding the channel's
+output to one value per clock tick.
+
+    outputs = ShotOutputs(path)
+    outputs.values_at('MOT_coil_current', acquisition_times)
+
+Outputs hold their initial value until their first change, and their final
+value after the end of the shot."""
+
+import logging
+
+import numpy as np
+
+import labscript_utils.h5_lock, h5py
+from blacs.connections import ConnectionTable
+import labscript_devices
+
+logger = logging.getLogger('labscript_devices.shot_outputs')
+
+
+class ShotOutputs(object):
+    """The outputs of every channel in a shot file. The device tables are
+    decoded the first time a channel is asked for. Channels of devices that
+    cannot be decoded, and channels with no output, are left out.
+
+    The shot's connection table, if already loaded, may be passed in, as may
+    a function to look up the runviewer parser of a device class, in place of
+    labscript_devices.get_runviewer_parser()."""
+
+    def __init__(self, path, connection_table=None, get_parser=None):
+        self.path = path
+        self.connection_table = connection_table
+        if get_parser is None:
+            get_parser = labscript_devices.get_runviewer_parser
+        self.get_parser = get_parser
+        with h5py.File(path, 'r') as f:
+            self.master_pseudoclock_name = f['connection table'].attrs['master_pseudoclock']
+            self.stop_time = f['devices/%s'%self.master_pseudoclock_name].attrs['stop_time']
+        # The index of each channel, (change_times, values), keyed by name:
+        self._index = None
+
+    def _add_trace(self, index, name, trace):
+        times = np.asarray(trace[0], dtype=np.float64)
+        values = np.asarray(trace[1])
+        if not len(times):
+            # Nothing is known of the channel's output:
+            return
+        # Times should already be sorted, but searchsorted needs them to be:
+        if len(times) > 1 and np.any(times[1:] < times[:-1]):
+            order = np.argsort(times, kind='mergesort')
+            times, values = times[order], values[order]
+        index[unicode(name)] = (times, values)
+
+    def _load_device(self, index, connection_table, device, clock):
+        """Adds the traces of a device, and of the devices it clocks or
+        triggers, to the index. Devices that cannot be parsed, such as those
+        without a runviewer parser, are skipped, along with the devices they
+        clock or trigger, as runviewer does."""
+        def add_trace(name, trace, parent_device_name, connection):
+            self._add_trace(index, name, trace)
+        try:
+            device_class = self.get_parser(device.device_class)
+            clocklines_and_triggers = device_class(self.path, device).get_traces(add_trace, clock)
+        except Exception:
+            logger.warning('Could not get the outputs of device %s in shot %s' % (device.name, self.path),
+                           exc_info=True)
+            return
+        for name, trace in clocklines_and_triggers.items():
+            child_device = connection_table.find_by_name(name)
+            for grandchild_device in child_device.child_list.values():
+                self._load_device(index, connection_table, grandchild_device, trace)
+
+    def _load(self):
+        index = {}
+        if self.connection_table is None:
+            self.connection_table = ConnectionTable(self.path)
+        connection_table = self.connection_table
+        master_pseudoclock = connection_table.find_by_name(self.master_pseudoclock_name)
+        self._load_device(index, connection_table, master_pseudoclock, None)
+        self._index = index
+
+    @property
+    def channels(self):
+        if self._index is None:
+            self._load()
+        return self._index.keys()
+
+    def change_points(self, channel):
+        """Returns (times, values) of the channel at the points where its
+        value changes, along with the start and end of its output"""
+        if self._index is None:
+            self._load()
+        try:
+            return self._index[channel]
+        except KeyError:
+            raise KeyError('No output channel named %s in shot %s' % (channel, self.path))
+
+    def values_at(self, channel, times):
+        """Returns the value of the channel at each of the given times, or at
+        a single time if times is a scalar"""
+        change_times, values = self.change_points(channel)
+        indices = np.searchsorted(change_times, times, 'right') - 1
+        # Before the first change point the output holds its initial value:
+        indices = np.maximum(indices, 0)
+        return values[indices]
@@ -0,0 +1,136 @@
+#####################################################################
+#                                                                   #
+# /tests/test_shot_outputs.py                                       #
+#                                                                   #
+# Copyright 2013, Monash University                                 #
+#                                                                   #
+# This file is part of the module labscript_devices, in the         #
+# labscript suite (see http://labscriptsuite.org), and is           #
+# licensed under the Simplified BSD License. See the license.txt    #
+# file in the root of the project for the full license.             #
+#                                                                   #
+#####################################################################
+
+"""Tests of querying the outputs of a shot with ShotOutputs. Run with:
+
+    python -m unittest labscript_devices.tests.test_shot_outputs"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import labscript_utils.h5_lock, h5py
+
+from labscript_devices.shot_outputs import ShotOutputs
+
+
+class Device(object):
+    """Stands in for a device in a blacs ConnectionTable"""
+    def __init__(self, name, device_class, children=()):
+        self.name = name
+        self.device_class = device_class
+        self.child_list = dict((child.name, child) for child in children)
+
+
+class ConnectionTable(object):
+    def __init__(self, *devices):
+        self.devices = {}
+        for device in devices:
+            self.add(device)
+
+    def add(self, device):
+        self.devices[device.name] = device
+        for child in device.child_list.values():
+            self.add(child)
+
+    def find_by_name(self, name):
+        return self.devices[name]
+
+
+class TableParser(object):
+    """A runviewer parser that gives the traces stored in the device's group
+    of the shot file, one dataset of (t, value) rows per channel, and clocks
+    the device's children with the trace named 'clock'"""
+    def __init__(self, path, device):
+        self.path = path
+        self.name = device.name
+
+    def get_traces(self, add_trace, clock=None):
+        clocklines = {}
+        with h5py.File(self.path, 'r') as f:
+            for name, table in f['devices'][self.name].items():
+                trace = (table['t'], table['value'])
+                if name == 'clock':
+                    clocklines['%s_clock' % self.name] = trace
+                else:
+                    add_trace(name, trace, self.name, name)
+        return clocklines
+
+
+class BrokenParser(object):
+    def __init__(self, path, device):
+        pass
+
+    def get_traces(self, add_trace, clock=None):
+        raise ValueError('could not decode device')
+
+
+PARSERS = {'TableParser': TableParser, 'BrokenParser': BrokenParser}
+
+
+class ShotOutputsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'shot.h5')
+        dtype = [('t', float), ('value', float)]
+        with h5py.File(self.path, 'w') as f:
+            f.create_dataset('connection table', data=np.zeros(0))
+            f['connection table'].attrs['master_pseudoclock'] = 'pseudoclock'
+            pseudoclock = f.create_group('devices/pseudoclock')
+            pseudoclock.attrs['stop_time'] = 10.0
+            pseudoclock.create_dataset('clock', data=np.array([(0, 0), (1, 1)], dtype=dtype))
+            card = f.create_group('devices/card')
+            # Changes value at t = 2 and t = 5:
+            card.create_dataset('ao0', data=np.array([(0, 1.5), (2, 3.0), (5, -1.0), (10, -1.0)], dtype=dtype))
+            card.create_dataset('empty', data=np.zeros(0, dtype=dtype))
+        pseudoclock_clock = Device('pseudoclock_clock', 'ClockLine',
+                                   [Device('card', 'TableParser'), Device('broken', 'BrokenParser')])
+        self.connection_table = ConnectionTable(Device('pseudoclock', 'TableParser', [pseudoclock_clock]))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def outputs(self):
+        return ShotOutputs(self.path, self.connection_table, PARSERS.__getitem__)
+
+    def test_channels(self):
+        # The channel without output, and the device that could not be
+        # decoded, are left out:
+        self.assertEqual(sorted(self.outputs().channels), ['ao0'])
+
+    def test_scalar_queries(self):
+        outputs = self.outputs()
+        # Before the first change point, at change points, between them, and
+        # after the end of the shot:
+        for t, value in [(-1, 1.5), (0, 1.5), (1.9, 1.5), (2, 3.0), (3.5, 3.0), (5, -1.0), (7, -1.0), (20, -1.0)]:
+            self.assertEqual(outputs.values_at('ao0', t), value)
+
+    def test_array_queries(self):
+        times = np.array([-1, 0, 1.9, 2, 3.5, 5, 7, 20])
+        values = self.outputs().values_at('ao0', times)
+        self.assertTrue(np.array_equal(values, [1.5, 1.5, 1.5, 3.0, 3.0, -1.0, -1.0, -1.0]))
+
+    def test_unsorted_times(self):
+        times = np.array([7, -1, 3.5])
+        values = self.outputs().values_at('ao0', times)
+        self.assertTrue(np.array_equal(values, [-1.0, 1.5, 3.0]))
+
+    def test_unknown_channel(self):
+        self.assertRaises(KeyError, self.outputs().values_at, 'ao1', 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,6 +20,9 @@ import labscript_utils.shared_drive
 import labscript_utils.h5_lock
 import h5py
 import numpy as np
+# Chunked storage for images, so that analysis can read regions of
+# interest without reading whole images:
+from labscript_utils.h5_chunking import create_roi_dataset
 check_version('zprocess', '1.3.3', '2.0')
 
 # This file implements the protocol for a camera server, that is, a program
@@ -169,13 +172,13 @@ class TubingenCameraServer(CameraServer):
             group = f.create_group('images').create_group('side').create_group('absorption')
             with pyfits.open(r'C:\CameraControl\images\1_0_0.fits') as fits_images:
                 image_array = np.array(fits_images[0].data, dtype=float)
-                group.create_dataset('atoms',data=image_array)
+                create_roi_dataset(group, 'atoms', image_array)
             with pyfits.open(r'C:\CameraControl\images\1_0_1.fits') as fits_images:
                 image_array = np.array(fits_images[0].data, dtype=float)
-                group.create_dataset('flat',data=image_array)
+                create_roi_dataset(group, 'flat', image_array)
             with pyfits.open(r'C:\CameraControl\images\1_0_2.fits') as fits_images:
                 image_array = np.array(fits_images[0].data, dtype=float)
-                group.create_dataset('dark',data=image_array)
+                create_roi_dataset(group, 'dark', image_array)
             # Copy over the effective pixel size to a spot that lyse
             # automatically grabs params from:
             effective_pixel_size = f['/devices/camera'].attrs['effective_pixel_size']
@@ -0,0 +1,58 @@
+#####################################################################
+#                                                                   #
+# h5_chunking.py                                                    #
+#                                                                   #
+# Copyright 2013, Monash University                                 #
+#                                                                   #
+# This file is part of the labscript suite (see                     #
+# http://labscriptsuite.org) and is licensed under the Simplified   #
+# BSD License. See the license.txt file in the root of the project  #
+# for the full license.                                             #
+#                                                                   #
+#####################################################################
+
+"""Chunked storage for large datasets in shot files, such as camera images
+and acquired traces, that analysis often reads only part of. A chunk is the
+smallest unit HDF5 reads, so chunks are made small enough that reading a
+region of interest of an image, or a window of a trace, does not read much
+else, but large enough that reading the whole dataset is not slowed by
+per-chunk overhead."""
+
+import numpy as np
+
+# Datasets smaller than this are stored contiguously, they are quick to read
+# in full regardless:
+MIN_CHUNKED_BYTES = 1 << 20
+
+# The approximate size of a chunk:
+CHUNK_BYTES = 1 << 17
+
+
+def roi_chunk_shape(shape, itemsize, chunk_bytes=CHUNK_BYTES):
+    """Returns a chunk shape for a dataset of the given shape and item size
+    in bytes. Images (the last two dimensions) are split into square tiles,
+    with one tile per chunk for each index of any leading dimensions, such
+    as the frames of a stack of images. One dimensional data is split into
+    runs of consecutive elements."""
+    shape = tuple(int(n) for n in shape)
+    items_per_chunk = max(1, chunk_bytes // itemsize)
+    if len(shape) == 0:
+        return None
+    elif len(shape) == 1:
+        return (max(1, min(shape[0], items_per_chunk)),)
+    side = max(1, int(np.sqrt(items_per_chunk)))
+    rows = max(1, min(shape[-2], side))
+    # Use any space left over in narrow images for more rows:
+    cols = max(1, min(shape[-1], items_per_chunk // rows))
+    rows = max(1, min(shape[-2], items_per_chunk // cols))
+    return (1,) * (len(shape) - 2) + (rows, cols)
+
+
+def create_roi_dataset(group, name, data, **kwargs):
+    """Creates a dataset in the given h5py group like group.create_dataset(),
+    but chunked with roi_chunk_shape() if data is large enough to benefit.
+    Any other keyword arguments are passed to create_dataset()."""
+    data = np.asarray(data)
+    if data.nbytes >= MIN_CHUNKED_BYTES and 'chunks' not in kwargs:
+        kwargs['chunks'] = roi_chunk_shape(data.shape, data.dtype.itemsize)
+    return group.create_dataset(name, data=data, **kwargs)
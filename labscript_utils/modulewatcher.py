@@ -25,6 +25,9 @@ class ModuleWatcher(object):
         # The whitelist is the list of names of currently loaded modules:
         self.whitelist = set(sys.modules)
         self.modified_times = {}
+        # How many times modules have been unloaded, so that users can tell
+        # if objects they hold may refer to stale modules:
+        self.unload_count = 0
         self.main = threading.Thread(target=self.mainloop)
         self.main.daemon = True
         self.main.start()
@@ -70,6 +73,7 @@ class ModuleWatcher(object):
                                 del sys.modules[name]
                                 if name in self.modified_times:
                                     del self.modified_times[name]
+                        self.unload_count += 1
                     finally:
                         # We're done mucking around with the cached
                         # modules, normal imports in other threads
@@ -13,6 +13,8 @@
 
 from dataframe_utilities import get_series_from_shot as _get_singleshot
 from dataframe_utilities import dict_diff
+from dataframe_utilities import deserialise_dataframe as _deserialise_dataframe
+from dataframe_utilities import asdatetime as _asdatetime
 import os
 import urllib
 import urllib2
@@ -20,6 +22,7 @@ import socket
 import pickle as pickle
 import inspect
 import sys
+import contextlib
 
 import labscript_utils.h5_lock, h5py
 import pandas
@@ -61,79 +64,273 @@ class _RoutineStorage(object):
 
 routine_storage = _RoutineStorage()
 
+# Whilst lyse is running a single-shot routine, the results saved to the shot
+# at lyse.path by Run objects, keyed by the name of their column in the
+# dataframe, so that lyse can update the shot's row without reading the shot
+# file again. None at other times:
+_saved_results = None
+# The size and modification time of the shot at lyse.path when a Run last
+# closed it, or None if none has. If the file has changed since, it was
+# changed some other way, and lyse reads it again:
+_shot_stat = None
+# The file of the analysis routine lyse is running, if any. Runs created
+# where the routine's __file__ is not a local variable, such as in the run()
+# function of a cached routine, save their results in its group:
+_routine_file = None
 
-def data(filepath=None, host='localhost', timeout=5):
+
+def _is_current_shot(h5_path):
+    return path is not None and os.path.abspath(h5_path) == os.path.abspath(path)
+
+
+def _note_write(h5_path):
+    """Record the size and modification time of the shot at lyse.path,
+    if h5_path is it, after a Run has closed it"""
+    global _shot_stat
+    if _is_current_shot(h5_path):
+        stat = os.stat(h5_path)
+        _shot_stat = stat.st_mtime, stat.st_size
+
+
+def _dataframe_column_name(group, name):
+    """The name of the dataframe column in which an attribute of a group in
+    a shot file appears, or None if it does not appear in the dataframe"""
+    group_path = tuple(str(part) for part in group.strip('/').split('/'))
+    if (group_path[0] == 'results' and len(group_path) == 2 or
+            group_path[0] == 'images' and len(group_path) in (2, 4)):
+        return group_path[1:] + (str(name),)
+    return None
+
+
+def _record_result(h5_file, h5_path, group, name):
+    if _saved_results is None or not _is_current_shot(h5_path):
+        return
+    column_name = _dataframe_column_name(group, name)
+    if column_name is not None:
+        # The value as read back from the file, as lyse would read it:
+        value = h5_file[group].attrs[name]
+        if not isinstance(value, h5py.Reference):
+            _saved_results[column_name] = value
+
+
+def _set_shot_index(df):
+    try:
+        padding = ('',)*(df.columns.nlevels - 1)
+        df.set_index([('sequence',) + padding,('run time',) + padding], inplace=True, drop=False)
+        df.index.names = ['sequence', 'run time']
+        # df.set_index(['sequence', 'run time'], inplace=True, drop=False)
+    except KeyError:
+        # Empty dataframe?
+        pass
+    df.sort_index(inplace=True)
+    return df
+
+
+def _filter_dataframe(df, columns=None, sequences=None, start_time=None, end_time=None,
+                      last=None, changed_since=None):
+    """Picks out the columns and shots of a whole dataframe that a query asks
+    for, as DataFrameStore.query() does in lyse. For lyse servers too old to
+    answer queries."""
+    padding = ('',)*(df.columns.nlevels - 1)
+    if columns is not None:
+        prefixes = [('filepath',), ('sequence',), ('run time',)]
+        for column in columns:
+            prefix = (column,) if isinstance(column, basestring) else tuple(column)
+            while len(prefix) > 1 and prefix[-1] == '':
+                prefix = prefix[:-1]
+            prefixes.append(prefix)
+        df = df[[column_name for column_name in df.columns
+                 if [prefix for prefix in prefixes if tuple(column_name)[:len(prefix)] == prefix]]]
+    mask = array([True] * len(df))
+    if sequences is not None:
+        sequences = [_asdatetime(sequence) if isinstance(sequence, basestring) else sequence
+                     for sequence in sequences]
+        mask &= df[('sequence',) + padding].isin(sequences).values
+    if start_time is not None or end_time is not None:
+        if isinstance(start_time, basestring):
+            start_time = _asdatetime(start_time)
+        if isinstance(end_time, basestring):
+            end_time = _asdatetime(end_time)
+        mask &= array([isinstance(run_time, pandas.Timestamp)
+                       and (start_time is None or run_time >= start_time)
+                       and (end_time is None or run_time < end_time)
+                       for run_time in df[('run time',) + padding]], dtype=bool)
+    df = df[mask]
+    if last is not None and last < len(df):
+        df = df.iloc[len(df) - last:]
+    return df
+
+
+def _query_dataframe(host, timeout, **query):
+    port = 42519
+    response = zmq_get(port, host, {'get dataframe': query}, timeout)
+    if isinstance(response, basestring):
+        if response.startswith('error: operation not supported'):
+            # A lyse that does not answer queries. Get the whole dataframe
+            # and pick out what was asked for here instead. It has no
+            # version, so the next data_since() will get all shots again:
+            df = _set_shot_index(zmq_get(port, host, 'get dataframe', timeout))
+            return _filter_dataframe(df, **query), None, True
+        # An error message:
+        raise RuntimeError(response)
+    df = _set_shot_index(_deserialise_dataframe(response))
+    return df, response['version'], response['complete']
+
+
+def data(filepath=None, host='localhost', timeout=5, columns=None, sequences=None,
+         start_time=None, end_time=None, last=None):
+    """Returns the dataframe of shots from lyse, or the data of a single
+    shot as a series if filepath is given. Rather than the whole dataframe,
+    only some of it can be asked for: columns whose names begin with any of
+    the names or tuples in columns, shots from the given sequences, shots
+    with run times from start_time up to but not including end_time, and
+    the last number of shots meeting these conditions. Sequences and times
+    can be pandas Timestamps or strings such as '20150101T120000'."""
     if filepath is not None:
         return _get_singleshot(filepath)
     else:
-        port = 42519
-        df = zmq_get(port, host, 'get dataframe', timeout)
-        try:
-            padding = ('',)*(df.columns.nlevels - 1)
-            df.set_index([('sequence',) + padding,('run time',) + padding], inplace=True, drop=False)
-            df.index.names = ['sequence', 'run time']
-            # df.set_index(['sequence', 'run time'], inplace=True, drop=False)
-        except KeyError:
-            # Empty dataframe?
-            pass
-        df.sort_index(inplace=True)
+        df, version, complete = _query_dataframe(host, timeout, columns=columns, sequences=sequences,
+                                                 start_time=start_time, end_time=end_time, last=last)
         return df
+
+
+def data_since(version=None, host='localhost', timeout=5, columns=None, sequences=None,
+               start_time=None, end_time=None, last=None):
+    """As data(), but returns only the shots that have changed since the
+    given version, which is the version returned by a previous call. Returns
+    (df, version, complete), where complete is False if df contains only the
+    shots that have changed, and True if it contains all shots, which it will
+    if version is None, if shots have since been removed from lyse, or if
+    lyse is too old to say what has changed, in which case version is None."""
+    return _query_dataframe(host, timeout, columns=columns, sequences=sequences, start_time=start_time,
+                            end_time=end_time, last=last, changed_since=version)
         
 def globals_diff(run1, run2, group=None):
     return dict_diff(run1.get_globals(group), run2.get_globals(group))
  
 class Run(object):
+    """Access to the data in a shot file, and saving of analysis results to
+    it. Each method opens and closes the file, unless the Run is used as a
+    context manager:
+
+        with Run(path) as run:
+            ...
+
+    in which case the file is opened once, kept open until the end of the
+    with block, and results saved within it are written all at once at the
+    end of the block, or when flush() is called."""
     def __init__(self,h5_path,no_write=False):
         self.no_write = no_write
         self.h5_path = h5_path
+        # The open shot file when used as a context manager:
+        self._h5_file = None
+        # Buffered calls to _save_result and _save_result_array:
+        self._pending_writes = []
         if not self.no_write:
+            # The group were this run's results will be stored in the h5 file
+            # will be the name of the python script which is instantiating
+            # this Run object, or if that is not known, such as when called
+            # from a function, of the routine lyse is running:
+            frame = inspect.currentframe()
+            __file__ = frame.f_back.f_locals.get('__file__', _routine_file)
+            if __file__ is not None:
+                self.group = os.path.basename(__file__).split('.py')[0]
+                group = self.group
+            else:
+                # sys.stderr.write('Warning: to write results, call '
+                # 'Run.set_group(groupname), specifying the name of the group '
+                # 'you would like to save results to. This normally comes from '
+                # 'the filename of your script, but since you\'re in interactive '
+                # 'mode, there is no scipt name. Opening in read only mode for '
+                # 'the moment.\n')
+                group = None
+            # Create the results group and this script's group in it in a
+            # single opening of the file:
             with h5py.File(h5_path) as h5_file:
                 if not 'results' in h5_file:
                      h5_file.create_group('results')
-                     
-        try:
-            if not self.no_write:
-                # The group were this run's results will be stored in the h5 file
-                # will be the name of the python script which is instantiating
-                # this Run object:
-                frame = inspect.currentframe()
-                __file__ = frame.f_back.f_locals['__file__']
-                self.group = os.path.basename(__file__).split('.py')[0]
-                with h5py.File(h5_path) as h5_file:
-                    if not self.group in h5_file['results']:
-                         h5_file['results'].create_group(self.group)
-        except KeyError:
-            # sys.stderr.write('Warning: to write results, call '
-            # 'Run.set_group(groupname), specifying the name of the group '
-            # 'you would like to save results to. This normally comes from '
-            # 'the filename of your script, but since you\'re in interactive '
-            # 'mode, there is no scipt name. Opening in read only mode for '
-            # 'the moment.\n')
-            self.no_write = True
+                if group is not None and not group in h5_file['results']:
+                     h5_file['results'].create_group(group)
+            _note_write(h5_path)
+            if group is None:
+                self.no_write = True
             
+    def __enter__(self):
+        if self._h5_file is not None:
+            raise RuntimeError('Run is already open')
+        if self.no_write:
+            self._h5_file = h5py.File(self.h5_path, 'r')
+        else:
+            self._h5_file = h5py.File(self.h5_path, 'a')
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.flush()
+        finally:
+            self._pending_writes = []
+            written = self._h5_file.mode != 'r'
+            self._h5_file.close()
+            self._h5_file = None
+            if written:
+                _note_write(self.h5_path)
+
+    def flush(self):
+        """Write results saved since the last flush to the shot file, if it
+        is being held open"""
+        pending_writes, self._pending_writes = self._pending_writes, []
+        for method, args in pending_writes:
+            method(self._h5_file, *args)
+        if pending_writes:
+            self._h5_file.flush()
+
+    @contextlib.contextmanager
+    def _file(self):
+        """The shot file, opened for the duration of the with block if it is
+        not already being held open. Results waiting to be written are
+        written first, so that they can be read."""
+        if self._h5_file is not None:
+            self.flush()
+            yield self._h5_file
+        else:
+            try:
+                with h5py.File(self.h5_path) as h5_file:
+                    yield h5_file
+            finally:
+                _note_write(self.h5_path)
+
     def set_group(self, groupname):
         self.group = groupname
-        with h5py.File(self.h5_path) as h5_file:
+        if self._h5_file is not None and self._h5_file.mode == 'r':
+            # Held open read-only, reopen it for writing:
+            self._h5_file.close()
+            self._h5_file = h5py.File(self.h5_path, 'a')
+        with self._file() as h5_file:
             if not self.group in h5_file['results']:
                  h5_file['results'].create_group(self.group)
         self.no_write = False
 
     def trace_names(self):
-        with h5py.File(self.h5_path) as h5_file:
+        with self._file() as h5_file:
             try:
                 return h5_file['data']['traces'].keys()
             except KeyError:
                 return []
 
-    def get_trace(self,name):
-        with h5py.File(self.h5_path) as h5_file:
+    def get_trace(self,name,lazy=False):
+        """Returns the times and values of the trace as float arrays, or if
+        lazy is True, as LazyDatasets of the stored data types, from which
+        only the parts sliced are read."""
+        with self._file() as h5_file:
             if not name in h5_file['data']['traces']:
                 raise Exception('The trace \'%s\' doesn not exist'%name)
             trace = h5_file['data']['traces'][name]
+            if lazy:
+                return LazyDataset(self, trace.name, 't'), LazyDataset(self, trace.name, 'values')
             return array(trace['t'],dtype=float),array(trace['values'],dtype=float)         
 
     def get_result_array(self,group,name):
-        with h5py.File(self.h5_path) as h5_file:
+        with self._file() as h5_file:
             if not group in h5_file['results']:
                 raise Exception('The result group \'%s\' doesn not exist'%group)
             if not name in h5_file['results'][group]:
@@ -147,17 +344,44 @@ class Run(object):
                             'Sequence object. Per-run analysis should be done '
                             'in single-shot analysis routines, in which a '
                             'single Run object is used')
-        with h5py.File(self.h5_path,'a') as h5_file:
-            if not group:
-                # Save to analysis results group by default
-                group = 'results/' + self.group
-            elif not group in h5_file:
-                # Create the group if it doesn't exist
-                h5_file.create_group(group) 
-            if name in h5_file[group].attrs.keys() and not overwrite:
+        if self._h5_file is not None:
+            # Raise now rather than when the result is written:
+            if not overwrite and self._saved(self._save_result, name, group):
                 raise Exception('Attribute %s exists in group %s. ' \
-                                'Use overwrite=True to overwrite.' % (name, group))                   
-            h5_file[group].attrs.modify(name, value)
+                                'Use overwrite=True to overwrite.' % (name, group or 'results/' + self.group))
+            if isinstance(value, ndarray):
+                value = value.copy()
+            self._pending_writes.append((self._save_result, (name, value, group, overwrite)))
+        else:
+            with self._file() as h5_file:
+                self._save_result(h5_file, name, value, group, overwrite)
+
+    def _saved(self, save_method, name, group):
+        """Whether a result, if save_method is _save_result, or a result
+        array, if it is _save_result_array, of the given name is in the group
+        of the file being held open, or waiting to be written to it"""
+        group = group or 'results/' + self.group
+        for method, args in self._pending_writes:
+            if method == save_method and args[0] == name and (args[2] or 'results/' + self.group) == group:
+                return True
+        if group not in self._h5_file:
+            return False
+        if save_method == self._save_result:
+            return name in self._h5_file[group].attrs
+        return name in self._h5_file[group]
+
+    def _save_result(self, h5_file, name, value, group, overwrite):
+        if not group:
+            # Save to analysis results group by default
+            group = 'results/' + self.group
+        elif not group in h5_file:
+            # Create the group if it doesn't exist
+            h5_file.create_group(group) 
+        if name in h5_file[group].attrs.keys() and not overwrite:
+            raise Exception('Attribute %s exists in group %s. ' \
+                            'Use overwrite=True to overwrite.' % (name, group))                   
+        h5_file[group].attrs.modify(name, value)
+        _record_result(h5_file, self.h5_path, group, name)
         
     def save_result_array(self, name, data, group=None, overwrite=True, keep_attrs=False):
         if self.no_write:
@@ -166,26 +390,38 @@ class Run(object):
                             'Sequence object. Per-run analysis should be done '
                             'in single-shot analysis routines, in which a '
                             'single Run object is used')
-        with h5py.File(self.h5_path, 'a') as h5_file:
-            attrs = {}
-            if not group:
-                # Save dataset to results group by default
-                group = 'results/' + self.group
-            elif not group in h5_file:
-                # Create the group if it doesn't exist
-                h5_file.create_group(group) 
-            if name in h5_file[group]:
-                if overwrite:
-                    # Overwrite if dataset already exists
-                    if keep_attrs:
-                        attrs = dict(h5_file[group][name].attrs)
-                    del h5_file[group][name]
-                else:
-                    raise Exception('Dataset %s exists. Use overwrite=True to overwrite.' % 
-                                     group + '/' + name)
-            h5_file[group].create_dataset(name, data=data)
-            for key, val in attrs.items():
-                h5_file[group][name].attrs[key] = val
+        if self._h5_file is not None:
+            # Raise now rather than when the result is written:
+            if not overwrite and self._saved(self._save_result_array, name, group):
+                raise Exception('Dataset %s/%s exists. Use overwrite=True to overwrite.' %
+                                (group or 'results/' + self.group, name))
+            if isinstance(data, ndarray):
+                data = data.copy()
+            self._pending_writes.append((self._save_result_array, (name, data, group, overwrite, keep_attrs)))
+        else:
+            with self._file() as h5_file:
+                self._save_result_array(h5_file, name, data, group, overwrite, keep_attrs)
+
+    def _save_result_array(self, h5_file, name, data, group, overwrite, keep_attrs):
+        attrs = {}
+        if not group:
+            # Save dataset to results group by default
+            group = 'results/' + self.group
+        elif not group in h5_file:
+            # Create the group if it doesn't exist
+            h5_file.create_group(group) 
+        if name in h5_file[group]:
+            if overwrite:
+                # Overwrite if dataset already exists
+                if keep_attrs:
+                    attrs = dict(h5_file[group][name].attrs)
+                del h5_file[group][name]
+            else:
+                raise Exception('Dataset %s exists. Use overwrite=True to overwrite.' % 
+                                 group + '/' + name)
+        h5_file[group].create_dataset(name, data=data)
+        for key, val in attrs.items():
+            h5_file[group][name].attrs[key] = val
 
     def get_traces(self, *names):
         traces = []
@@ -220,8 +456,11 @@ class Run(object):
         for name, value in zip(names, values):
             self.save_result_array(name, value)
     
-    def get_image(self,orientation,label,image):
-        with h5py.File(self.h5_path) as h5_file:
+    def get_image(self,orientation,label,image,lazy=False):
+        """Returns the image as an array, or if lazy is True, as a
+        LazyDataset from which only the parts sliced are read, for example a
+        region of interest."""
+        with self._file() as h5_file:
             if not 'images' in h5_file:
                 raise Exception('File does not contain any images')
             if not orientation in h5_file['images']:
@@ -230,6 +469,8 @@ class Run(object):
                 raise Exception('File does not contain any images with label \'%s\''%label)
             if not image in h5_file['images'][orientation][label]:
                 raise Exception('Image \'%s\' not found in file'%image)
+            if lazy:
+                return LazyDataset(self, h5_file['images'][orientation][label][image].name)
             return array(h5_file['images'][orientation][label][image])
     
     def get_images(self,orientation,label, *images):
@@ -240,13 +481,13 @@ class Run(object):
         
     def get_all_image_labels(self):
         images_list = {}
-        with h5py.File(self.h5_path) as h5_file:
+        with self._file() as h5_file:
             for orientation in h5_file['/images'].keys():
                 images_list[orientation] = h5_file['/images'][orientation].keys()                
         return images_list                
     
     def get_image_attributes(self, orientation):
-        with h5py.File(self.h5_path) as h5_file:
+        with self._file() as h5_file:
             if not 'images' in h5_file:
                 raise Exception('File does not contain any images')
             if not orientation in h5_file['images']:
@@ -255,18 +496,18 @@ class Run(object):
         
     def get_globals(self,group=None):
         if not group:
-            with h5py.File(self.h5_path) as h5_file:
+            with self._file() as h5_file:
                 return dict(h5_file['globals'].attrs)
         else:
             try:
-                with h5py.File(self.h5_path) as h5_file:
+                with self._file() as h5_file:
                     return dict(h5_file['globals'][group].attrs)
             except KeyError:
                 return {}
 
     def get_globals_raw(self, group=None):
         globals_dict = {}
-        with h5py.File(self.h5_path) as h5_file:
+        with self._file() as h5_file:
             if group == None:
                 for obj in h5_file['globals'].values():
                     temp_dict = dict(obj.attrs)
@@ -307,7 +548,7 @@ class Run(object):
                 for key, val in temp_dict.items():
                     if val:
                         expansion_dict[key] = val
-        with h5py.File(self.h5_path) as h5_file:
+        with self._file() as h5_file:
             h5_file['globals'].visititems(append_expansion)
         return expansion_dict
                    
@@ -318,12 +559,12 @@ class Run(object):
                 temp_dict = dict(obj.attrs)
                 for key, val in temp_dict.items():
                     units_dict[key] = val
-        with h5py.File(self.h5_path) as h5_file:
+        with self._file() as h5_file:
             h5_file['globals'].visititems(append_units)
         return units_dict
 
     def globals_groups(self):
-        with h5py.File(self.h5_path) as h5_file:
+        with self._file() as h5_file:
             try:
                 return h5_file['globals'].keys()
             except KeyError:
@@ -333,12 +574,68 @@ class Run(object):
         return globals_diff(self, other_run, group)            
     
         
+class LazyDataset(object):
+    """A read-only view of a dataset in a run's shot file, or of one field
+    of a dataset with a compound data type. Slicing it reads only the data
+    sliced, with h5py, under the same file lock as other access to the shot
+    file. The file is opened for each slice unless the run is held open as
+    a context manager, which is faster when taking many slices.
+    Indexing with [...] or converting it with numpy.array() reads the whole
+    dataset."""
+    def __init__(self, run, name, field=None):
+        self.run = run
+        self.name = name
+        self.field = field
+        with run._file() as h5_file:
+            dataset = h5_file[name]
+            self.shape = dataset.shape
+            if field is None:
+                self.dtype = dataset.dtype
+            else:
+                self.dtype = dataset.dtype.fields[field][0]
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        size = 1
+        for n in self.shape:
+            size *= n
+        return size
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        with self.run._file() as h5_file:
+            dataset = h5_file[self.name]
+            if self.field is None:
+                return dataset[key]
+            if not isinstance(key, tuple):
+                key = (key,)
+            return dataset[key + (self.field,)]
+
+    def __array__(self, dtype=None):
+        data = self[...]
+        if dtype is not None:
+            data = data.astype(dtype)
+        return data
+
+    def __repr__(self):
+        return '<LazyDataset %s%s: shape %s, type %s>' % (self.name, '' if self.field is None else '[%s]' % self.field,
+                                                         self.shape, self.dtype)
+
+
 class Sequence(Run):
     def __init__(self,h5_path,run_paths):
         if isinstance(run_paths, pandas.DataFrame):
             run_paths = run_paths['filepath']
         self.h5_path = h5_path
         self.no_write = False
+        self._h5_file = None
+        self._pending_writes = []
         with h5py.File(h5_path) as h5_file:
             if not 'results' in h5_file:
                  h5_file.create_group('results')
@@ -347,15 +644,16 @@ class Sequence(Run):
         
         # The group were the results will be stored in the h5 file will
         # be the name of the python script which is instantiating this
-        # Sequence object:
+        # Sequence object, or if that is not known, such as when called from
+        # a function, of the routine lyse is running:
         frame = inspect.currentframe()
-        try:
-            __file__ = frame.f_back.f_locals['__file__']
+        __file__ = frame.f_back.f_locals.get('__file__', _routine_file)
+        if __file__ is not None:
             self.group = os.path.basename(__file__).split('.py')[0]
             with h5py.File(h5_path) as h5_file:
                 if not self.group in h5_file['results']:
                      h5_file['results'].create_group(self.group)
-        except KeyError:
+        else:
             sys.stderr.write('Warning: to write results, call '
             'Sequence.set_group(groupname), specifying the name of the group '
             'you would like to save results to. This normally comes from '
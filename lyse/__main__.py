@@ -4,6 +4,7 @@ from __future__ import division, unicode_literals, print_function, absolute_impo
 
 import os
 import sys
+import ast
 import socket
 import Queue
 import logging
@@ -11,6 +12,7 @@ import threading
 import signal
 import subprocess
 import time
+import multiprocessing
 
 
 # Turn on our error catching for all subsequent imports
@@ -53,10 +55,11 @@ from labscript_utils.setup_logging import setup_logging
 from labscript_utils.qtwidgets.headerview_with_widgets import HorizontalHeaderViewWithWidgets
 import labscript_utils.shared_drive as shared_drive
 
-from lyse.dataframe_utilities import (concat_with_padding,
+from lyse.dataframe_utilities import (DataFrameCache,
+                                      DataFrameStore,
                                       get_dataframe_from_shot,
                                       get_dataframe_from_shots,
-                                      replace_with_padding)
+                                      get_flat_records_from_shots)
 
 from qtutils import inmain_decorator, UiLoader, DisconnectContextManager
 from qtutils.outputbox import OutputBox
@@ -171,6 +174,7 @@ class WebServer(ZMQServer):
         if request_data == 'hello':
             return 'hello'
         elif request_data == 'get dataframe':
+            app.filebox.flush_shot_updates()
             # convert_objects() picks fixed datatypes for columns that are
             # compatible with fixed datatypes, dramatically speeding up
             # pickling. But we don't impose fixed datatypes earlier than now
@@ -182,6 +186,12 @@ class WebServer(ZMQServer):
             return app.filebox.shots_model.dataframe.convert_objects(
                        convert_dates=False, convert_numeric=False, convert_timedeltas=False)
         elif isinstance(request_data, dict):
+            if 'get dataframe' in request_data:
+                # A query for some columns and rows of the dataframe, see
+                # DataFrameStore.query() for the options:
+                query = request_data['get dataframe']
+                app.filebox.flush_shot_updates()
+                return app.filebox.shots_model.query(**query)
             if 'filepath' in request_data:
                 h5_filepath = shared_drive.path_to_local(request_data['filepath'])
                 if not (isinstance(h5_filepath, unicode) or isinstance(h5_filepath, str)):
@@ -189,7 +199,8 @@ class WebServer(ZMQServer):
                 app.filebox.incoming_queue.put(h5_filepath)
                 return 'added successfully'
         return ("error: operation not supported. Recognised requests are:\n "
-                "'get dataframe'\n 'hello'\n {'filepath': <some_h5_filepath>}")
+                "'get dataframe'\n 'hello'\n {'filepath': <some_h5_filepath>}\n "
+                "{'get dataframe': <dict of query options>}")
 
 
 class LyseMainWindow(QtGui.QMainWindow):
@@ -203,8 +214,35 @@ class LyseMainWindow(QtGui.QMainWindow):
         return result
 
 
+def get_routine_options(filepath):
+    """Returns a dict of the options declared by an analysis routine. These
+    are module-level assignments of literal values to names beginning with
+    'lyse_', for example 'lyse_stateless = True'. The file is parsed, not
+    run, so options must be plain literals."""
+    options = {}
+    try:
+        with open(filepath) as f:
+            module = ast.parse(f.read(), filepath)
+    except (IOError, SyntaxError):
+        # The worker will report the problem when it runs the routine:
+        return options
+    for node in module.body:
+        if not isinstance(node, ast.Assign):
+            continue
+        for target in node.targets:
+            if isinstance(target, ast.Name) and target.id.startswith('lyse_'):
+                try:
+                    options[target.id] = ast.literal_eval(node.value)
+                except ValueError:
+                    pass
+    return options
+
+
 class AnalysisRoutine(object):
 
+    # How many worker processes a stateless routine gets if it does not say:
+    DEFAULT_N_POOL_WORKERS = min(multiprocessing.cpu_count(), 4)
+
     def __init__(self, filepath, model, output_box_port):
         self.filepath = filepath
         self.shortname = os.path.basename(self.filepath)
@@ -219,7 +257,7 @@ class AnalysisRoutine(object):
         self.error = False
         self.done = False
 
-        self.to_worker, self.from_worker, self.worker = self.start_worker()
+        self.start_workers()
 
         # Make a row to put into the model:
         active_item =  QtGui.QStandardItem()
@@ -233,21 +271,52 @@ class AnalysisRoutine(object):
 
         self.exiting = False
 
+    def start_workers(self):
+        # A routine that declares 'lyse_stateless = True' keeps nothing
+        # between shots, so it can analyse several shots at once in a pool
+        # of worker processes:
+        self.options = get_routine_options(self.filepath)
+        self.stateless = bool(self.options.get('lyse_stateless', False))
+        if self.stateless:
+            self.n_workers = max(1, int(self.options.get('lyse_n_workers', self.DEFAULT_N_POOL_WORKERS)))
+        else:
+            self.n_workers = 1
+        self.to_worker, self.from_worker, self.worker = self.start_worker()
+        self.extra_workers = [self.start_worker() for _ in range(self.n_workers - 1)]
+        # Workers not currently analysing a shot:
+        self.idle_workers = Queue.Queue()
+        self.idle_workers.put((self.to_worker, self.from_worker, self.worker))
+        for child_handles in self.extra_workers:
+            self.idle_workers.put(child_handles)
+
     def start_worker(self):
         # Start a worker process for this analysis routine:
         child_handles = zprocess.subprocess_with_queues('analysis_subprocess.py', self.output_box_port)
         to_worker, from_worker, worker = child_handles
-        # Tell the worker what script it with be executing:
+        # Tell the worker what script it with be executing, and the options
+        # the script declares:
         to_worker.put(self.filepath)
+        to_worker.put(self.options)
         return to_worker, from_worker, worker
 
     def do_analysis(self, filepath):
-        self.to_worker.put(['analyse', filepath])
-        signal, data = self.from_worker.get()
+        """Runs the routine on a shot, returning whether it succeeded, the
+        results it saved to the shot keyed by dataframe column name, or None
+        if it changed the shot file in a way the shot has to be read again to
+        see, and the size and modification time of the shot file afterward"""
+        # Stateless routines may be asked to analyse several shots from
+        # different threads at once, each gets a worker to itself:
+        idle_workers = self.idle_workers
+        to_worker, from_worker, worker = child_handles = idle_workers.get()
+        try:
+            to_worker.put(['analyse', filepath])
+            signal, results, shot_stat = from_worker.get()
+        finally:
+            idle_workers.put(child_handles)
         if signal == 'error':
-            return False
+            return False, results, shot_stat
         elif signal == 'done':
-            return True
+            return True, results, shot_stat
         else:
             raise ValueError('invalid signal %s'%str(signal))
 
@@ -311,6 +380,10 @@ class AnalysisRoutine(object):
         self.to_worker.put(['quit',None])
         timeout_time = time.time() + 2
         self.exiting = True
+        for to_worker, from_worker, worker in self.extra_workers:
+            to_worker.put(['quit', None])
+            QtCore.QTimer.singleShot(50,
+                lambda worker=worker: self.check_child_exited(worker, timeout_time, kill=False, restart=False))
         QtCore.QTimer.singleShot(50,
             lambda: self.check_child_exited(self.worker, timeout_time, kill=False, restart=restart))
 
@@ -337,7 +410,7 @@ class AnalysisRoutine(object):
             app.output_box.output('%s worker exited cleanly\n'%self.shortname)
 
         if restart:
-            self.to_worker, self.from_worker, self.worker = self.start_worker()
+            self.start_workers()
             app.output_box.output('%s worker restarted\n'%self.shortname)
         self.exiting = False
 
@@ -464,6 +537,13 @@ class RoutineBox(object):
 
         self.routines = []
 
+        # Shots being analysed concurrently, in the order they arrived, and
+        # the final messages of those that have finished, which are passed on
+        # to the filebox in that same order:
+        self.shots_in_progress = []
+        self.finished_shots = {}
+        self.shots_in_progress_lock = threading.Lock()
+
         self.connect_signals()
 
         self.analysis = threading.Thread(target = self.analysis_loop)
@@ -671,7 +751,32 @@ class RoutineBox(object):
                 # TODO: get the filepath of the output h5 file:
                 # filepath = self.filechooserentry.get_text()
             self.logger.info('got a file to process: %s'%filepath)
-            self.do_analysis(filepath)
+            if self.concurrent_shots() > 1:
+                with self.shots_in_progress_lock:
+                    self.shots_in_progress.append(filepath)
+                thread = threading.Thread(target=self.do_concurrent_analysis, args=(filepath,))
+                thread.daemon = True
+                thread.start()
+            else:
+                self.do_analysis(filepath)
+
+    @inmain_decorator()
+    def concurrent_shots(self):
+        """How many shots may be analysed at once. This is more than one
+        only if every enabled routine is stateless, in which case it is the
+        smallest number of workers any of them has."""
+        if self.multishot:
+            return 1
+        enabled_routines = [r for r in self.routines if r.enabled()]
+        if not enabled_routines or not all([r.stateless for r in enabled_routines]):
+            return 1
+        return min([r.n_workers for r in enabled_routines])
+
+    @inmain_decorator()
+    def enabled_routines(self):
+        """The enabled routines, in order. self.routines is changed in the
+        main thread, so worker threads must get it from there"""
+        return [r for r in self.routines if r.enabled()]
 
     def todo(self):
         """How many analysis routines are not done?"""
@@ -686,6 +791,8 @@ class RoutineBox(object):
         error = False
         while remaining:
             self.logger.debug('%d routines left to do'%remaining)
+            results = {}
+            shot_stat = None
             for routine in self.routines:
                 if routine.enabled() and not routine.done:
                     break
@@ -694,7 +801,7 @@ class RoutineBox(object):
             if routine is not None:
                 self.logger.info('running analysis routine %s'%routine.shortname)
                 routine.set_status('working')
-                success = routine.do_analysis(filepath)
+                success, results, shot_stat = routine.do_analysis(filepath)
                 if success:
                     routine.set_status('done')
                     self.logger.debug('success')
@@ -713,11 +820,59 @@ class RoutineBox(object):
             except ZeroDivisionError:
                 # All routines got deleted mid-analysis, we're done here:
                 status_percent = 100.0
-            self.to_filebox.put(['progress', status_percent])
+            self.to_filebox.put(['progress', status_percent, filepath, results, shot_stat])
         if error:
-            self.to_filebox.put(['error', None])
+            self.to_filebox.put(['error', None, filepath, results, shot_stat])
         else:
-            self.to_filebox.put(['done', 100.0])
+            self.to_filebox.put(['done', 100.0, filepath, {}, None])
+        self.logger.debug('completed analysis of %s'%filepath)
+
+    def do_concurrent_analysis(self, filepath):
+        """Run all enabled analysis routines once on the given shot file,
+        whilst other threads do the same for other shots. Only used when all
+        enabled routines are stateless. Progress is reported as it happens,
+        but whether the shot is done or errored is reported only after all
+        earlier shots have finished, so that the filebox sees results in
+        shot order."""
+        error = False
+        results = shot_stat = None
+        try:
+            routines = self.enabled_routines()
+            for i, routine in enumerate(routines):
+                self.logger.info('running analysis routine %s on %s'%(routine.shortname, filepath))
+                # Routine status icons are shared by all shots in progress, so
+                # they show the state of the most recent change:
+                routine.set_status('working')
+                try:
+                    success, results, shot_stat = routine.do_analysis(filepath)
+                except Exception:
+                    # The worker was killed by a restart or removal of the
+                    # routine, or sent something unexpected. The shot may have
+                    # been partly written to, so have it read again:
+                    self.logger.exception('analysis routine %s failed on %s'%(routine.shortname, filepath))
+                    success, results, shot_stat = False, None, None
+                if success:
+                    routine.set_status('done')
+                else:
+                    routine.set_status('error')
+                    error = True
+                    break
+                status_percent = 100*float(i + 1)/len(routines)
+                self.to_filebox.put(['progress', status_percent, filepath, results, shot_stat])
+        except Exception:
+            self.logger.exception('analysis of %s failed'%filepath)
+            error, results, shot_stat = True, None, None
+        finally:
+            # Always report the shot as finished, or every later shot would
+            # be held back waiting for it:
+            if error:
+                final_message = ['error', None, filepath, results, shot_stat]
+            else:
+                final_message = ['done', 100.0, filepath, {}, None]
+            with self.shots_in_progress_lock:
+                self.finished_shots[filepath] = final_message
+                while self.shots_in_progress and self.shots_in_progress[0] in self.finished_shots:
+                    self.to_filebox.put(self.finished_shots.pop(self.shots_in_progress.pop(0)))
         self.logger.debug('completed analysis of %s'%filepath)
 
     def reorder(self, order):
@@ -1079,20 +1234,62 @@ class TableView(QtGui.QTableView):
         return result
 
 
-class DataFrameModel(QtCore.QObject):
+class DataFrameModel(QtCore.QAbstractTableModel):
+
+    """A table of the shots in the dataframe for the filebox's view. Cells
+    are not stored in the model, they are read from the DataFrameStore when
+    the view asks for them, which it does only for the cells it is showing.
+    Updates signal dataChanged for only the cells that changed."""
 
     COL_STATUS = 0
     COL_FILEPATH = 1
 
     ROLE_STATUS_PERCENT = QtCore.Qt.UserRole + 1
 
+    # When the table is sorted, how long to wait after rows are added or
+    # changed before re-sorting, so that a burst of changes re-sorts once:
+    RESORT_DELAY = 200
+
     columns_changed = Signal()
 
     def __init__(self, view, exp_config):
-        QtCore.QObject.__init__(self)
+        QtCore.QAbstractTableModel.__init__(self)
         self._view = view
         self.exp_config = exp_config
-        self._model = UneditableModel()
+
+        # This will contain all the scalar data from the shot files that
+        # are currently open, from which self.dataframe is made:
+        self.store = DataFrameStore()
+        # How many levels the dataframe's multiindex has:
+        self.nlevels = self.store.nlevels
+
+        # The single-shot analysis progress of each row of the store, in
+        # percent. How many are not yet at 100, and a row of the table
+        # before which all shots are known to be done, from which to start
+        # looking for the next one to analyse:
+        self.status_percent = []
+        self.n_incomplete = 0
+        self.first_incomplete_hint = 0
+
+        # The column the table is sorted by, or -1 for the order in which
+        # shots were added. If sorted, self.order is an array of the row of
+        # the store shown in each row of the table, and self.order_inverse
+        # the row of the table each row of the store is shown in:
+        self.sort_column = -1
+        self.sort_order = QtCore.Qt.AscendingOrder
+        self.order = None
+        self.order_inverse = None
+
+        # Column indices to names and vice versa for fast lookup:
+        self.column_indices = {'__status': self.COL_STATUS, ('filepath', ''): self.COL_FILEPATH}
+        self.column_names = {self.COL_STATUS: '__status', self.COL_FILEPATH: ('filepath', '')}
+        self.columns_visible = {self.COL_STATUS: True, self.COL_FILEPATH: True}
+
+        # Whether or not a deleted column was visible at the time it was deleted (by name):
+        self.deleted_columns_visible = {}
+
+        self.status_header_icon = QtGui.QIcon(':qtutils/fugue/information')
+        self.status_done_icon = QtGui.QIcon(':qtutils/fugue/tick')
 
         headerview_style = """
                            QHeaderView {
@@ -1105,48 +1302,36 @@ class DataFrameModel(QtCore.QObject):
                            }
                            """
 
-        self._header = HorizontalHeaderViewWithWidgets(self._model)
+        self._header = HorizontalHeaderViewWithWidgets(self)
         self._vertheader = QtGui.QHeaderView(QtCore.Qt.Vertical)
         self._vertheader.setResizeMode(QtGui.QHeaderView.Fixed)
         self._vertheader.setStyleSheet(headerview_style)
         self._header.setStyleSheet(headerview_style)
         self._vertheader.setHighlightSections(True)
         self._vertheader.setClickable(True)
-        self._view.setModel(self._model)
+        # All rows are the height the item delegate asks for:
+        fontmetrics = QtGui.QFontMetrics(self._view.font())
+        self._vertheader.setDefaultSectionSize(fontmetrics.height() + ItemDelegate.EXTRA_ROW_HEIGHT)
+        self._view.setModel(self)
         self._view.setHorizontalHeader(self._header)
         self._view.setVerticalHeader(self._vertheader)
-        self._delegate = ItemDelegate(self._view, self._model, self.COL_STATUS, self.ROLE_STATUS_PERCENT)
+        self._delegate = ItemDelegate(self._view, self, self.COL_STATUS, self.ROLE_STATUS_PERCENT)
         self._view.setItemDelegate(self._delegate)
         self._view.setSelectionBehavior(QtGui.QTableView.SelectRows)
         self._view.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
 
-        # This dataframe will contain all the scalar data
-        # from the shot files that are currently open:
-        index = pandas.MultiIndex.from_tuples([('filepath', '')])
-        self.dataframe = pandas.DataFrame({'filepath': []}, columns=index)
-        # How many levels the dataframe's multiindex has:
-        self.nlevels = self.dataframe.columns.nlevels
-
-        status_item = QtGui.QStandardItem()
-        status_item.setIcon(QtGui.QIcon(':qtutils/fugue/information'))
-        status_item.setToolTip('status/progress of single-shot analysis')
-        self._model.setHorizontalHeaderItem(self.COL_STATUS, status_item)
-
-        filepath_item = QtGui.QStandardItem('filepath')
-        filepath_item.setToolTip('filepath')
-        self._model.setHorizontalHeaderItem(self.COL_FILEPATH, filepath_item)
-
         self._view.setColumnWidth(self.COL_STATUS, 70)
         self._view.setColumnWidth(self.COL_FILEPATH, 100)
 
-        # Column indices to names and vice versa for fast lookup:
-        self.column_indices = {'__status': self.COL_STATUS, ('filepath', ''): self.COL_FILEPATH}
-        self.column_names = {self.COL_STATUS: '__status', self.COL_FILEPATH: ('filepath', '')}
-        self.columns_visible = {self.COL_STATUS: True, self.COL_FILEPATH: True}
+        # Shots are shown in the order they were added until a column
+        # header is clicked:
+        self._header.setSortIndicator(-1, self.sort_order)
+        self._view.setSortingEnabled(True)
+        self.resort_timer = QtCore.QTimer()
+        self.resort_timer.setSingleShot(True)
+        self.resort_timer.setInterval(self.RESORT_DELAY)
+        self.resort_timer.timeout.connect(self.resort)
 
-        # Whether or not a deleted column was visible at the time it was deleted (by name):
-        self.deleted_columns_visible = {}
-        
         # Make the actions for the context menu:
         self.action_remove_selected = QtGui.QAction(
             QtGui.QIcon(':qtutils/fugue/minus'), 'Remove selected shots',  self._view)
@@ -1157,40 +1342,210 @@ class DataFrameModel(QtCore.QObject):
         self._view.customContextMenuRequested.connect(self.on_view_context_menu_requested)
         self.action_remove_selected.triggered.connect(self.on_remove_selection)
 
-    def get_model_row_by_filepath(self, filepath):
-        filepath_colname = ('filepath',) + ('',) * (self.nlevels - 1)
-        possible_items = self._model.findItems(filepath, column=self.column_indices[filepath_colname])
-        if len(possible_items) > 1:
-            raise LookupError('Multiple items found')
-        elif not possible_items:
-            raise LookupError('No item found')
+    @inmain_decorator()
+    def query(self, **kwargs):
+        return self.store.query(**kwargs)
+
+    @property
+    @inmain_decorator()
+    def dataframe(self):
+        """A dataframe of the scalar data from the shot files that are
+        currently open. Made only when the data has changed since the last
+        time it was asked for, so it should not be modified."""
+        return self.store.dataframe
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.store.n_rows
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.column_names)
 
-        item = possible_items[0]
-        index = item.index()
-        return index.row()
+    def flags(self, index):
+        return QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled
+
+    def store_row(self, row):
+        """The row of the store shown in a row of the table"""
+        if self.order is None:
+            return row
+        return int(self.order[row])
+
+    def table_row(self, store_row):
+        """The row of the table a row of the store is shown in"""
+        if self.order_inverse is None:
+            return store_row
+        return int(self.order_inverse[store_row])
+
+    def column_values(self, column):
+        """The array of values in the store for a column of the table, or
+        None for the status column"""
+        column_name = self.column_names[column]
+        if not isinstance(column_name, tuple):
+            # One of our special columns, does not correspond to a column in the dataframe:
+            return None
+        return self.store.columns.get(self.store.strip_padding(column_name))
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.store_row(index.row())
+        column = index.column()
+        if column == self.COL_STATUS:
+            if role == self.ROLE_STATUS_PERCENT:
+                return self.status_percent[row]
+            elif role == QtCore.Qt.DecorationRole:
+                return self.status_done_icon
+            return None
+        if column == self.COL_FILEPATH:
+            if role == QtCore.Qt.DisplayRole:
+                return self.store.columns[('filepath',)][row]
+            return None
+        if role == QtCore.Qt.TextAlignmentRole:
+            return QtCore.Qt.AlignCenter
+        elif role not in (QtCore.Qt.DisplayRole, QtCore.Qt.ToolTipRole):
+            return None
+        values = self.column_values(column)
+        if values is None:
+            return None
+        if values.dtype.kind == 'M':
+            # Timestamps, stored in UTC, shown in their time zone:
+            value = self.store.get_value(self.store.strip_padding(self.column_names[column]), row)
+        else:
+            value = values[row]
+        if role == QtCore.Qt.ToolTipRole:
+            return repr(value)
+        if isinstance(value, float):
+            value_str = scientific_notation(value)
+        else:
+            value_str = str(value)
+        lines = value_str.splitlines()
+        if len(lines) > 1:
+            return lines[0] + ' ...'
+        return value_str
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Vertical:
+            if role == QtCore.Qt.DisplayRole and section < self.store.n_rows:
+                filepath = self.store.columns[('filepath',)][self.store_row(section)]
+                return os.path.splitext(os.path.basename(filepath))[0]
+            return None
+        if section not in self.column_names:
+            return None
+        if section == self.COL_STATUS:
+            if role == QtCore.Qt.DecorationRole:
+                return self.status_header_icon
+            elif role == QtCore.Qt.ToolTipRole:
+                return 'status/progress of single-shot analysis'
+            return None
+        if role in (QtCore.Qt.DisplayRole, QtCore.Qt.ToolTipRole):
+            return '\n'.join(self.column_names[section]).strip()
+        return None
+
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        self.sort_column = column
+        self.sort_order = order
+        self.resort()
+
+    def schedule_resort(self):
+        if self.order is not None or self.sort_column >= 0:
+            self.resort_timer.start()
+
+    def sorted_order(self):
+        """Returns the order the rows of the store should be shown in,
+        sorted by self.sort_column, and its inverse, or None, None if
+        unsorted"""
+        if self.sort_column < 0 or self.sort_column not in self.column_names:
+            return None, None
+        n_rows = self.store.n_rows
+        if self.sort_column == self.COL_STATUS:
+            keys = np.array(self.status_percent)
+        else:
+            keys = self.column_values(self.sort_column)
+            if keys is None:
+                return None, None
+            keys = keys[:n_rows]
+        if keys.dtype == object:
+            # Python's sort, which is stable, and can compare mixed types:
+            order = np.array(sorted(range(n_rows), key=keys.__getitem__), dtype=int)
+        else:
+            order = np.argsort(keys, kind='mergesort')
+        if self.sort_order == QtCore.Qt.DescendingOrder:
+            order = order[::-1]
+        order_inverse = np.empty(n_rows, dtype=int)
+        order_inverse[order] = np.arange(n_rows)
+        return order, order_inverse
+
+    def resort(self):
+        """Puts the rows of the table in order of the sort column, keeping
+        the selection and any other persistent indices on the same shots"""
+        self.resort_timer.stop()
+        self.layoutAboutToBeChanged.emit()
+        persistent_indices = self.persistentIndexList()
+        store_rows = [self.store_row(index.row()) for index in persistent_indices]
+        self.order, self.order_inverse = self.sorted_order()
+        for index, store_row in zip(persistent_indices, store_rows):
+            self.changePersistentIndex(index, self.index(self.table_row(store_row), index.column()))
+        self.first_incomplete_hint = 0
+        self.layoutChanged.emit()
+
+    def remove_store_rows(self, store_rows):
+        self.store.remove_rows(store_rows)
+        keep = np.ones(len(self.status_percent), dtype=bool)
+        keep[store_rows] = False
+        self.status_percent = [status_percent for status_percent, kept in zip(self.status_percent, keep) if kept]
+        self.n_incomplete = sum(1 for status_percent in self.status_percent if status_percent != 100)
+        self.first_incomplete_hint = 0
+        if self.order is not None:
+            # Rows of the store after those removed move up:
+            new_store_rows = np.cumsum(keep) - 1
+            self.order = new_store_rows[self.order[keep[self.order]]]
+            self.order_inverse = np.empty(len(self.order), dtype=int)
+            self.order_inverse[self.order] = np.arange(len(self.order))
 
     def on_remove_selection(self, confirm=True):
         selection_model = self._view.selectionModel()
-        selected_indexes = selection_model.selectedRows()
-        selected_name_items = [self._model.itemFromIndex(index) for index in selected_indexes]
-        if not selected_name_items:
+        selected_rows = sorted(set(index.row() for index in selection_model.selectedRows()))
+        if not selected_rows:
+            return
+        if confirm and not question_dialog("Remove %d shots?" % len(selected_rows)):
             return
-        if confirm and not question_dialog("Remove %d shots?" % len(selected_name_items)):
+        # Remove contiguous ranges of rows, the last first so that the
+        # row numbers of those yet to be removed do not change:
+        ranges = []
+        for row in selected_rows:
+            if ranges and row == ranges[-1][1] + 1:
+                ranges[-1][1] = row
+            else:
+                ranges.append([row, row])
+        for first, last in reversed(ranges):
+            self.beginRemoveRows(QtCore.QModelIndex(), first, last)
+            self.remove_store_rows([self.store_row(row) for row in range(first, last + 1)])
+            self.endRemoveRows()
+
+    def set_status_percent(self, store_row, status_percent):
+        previous_status_percent = self.status_percent[store_row]
+        if status_percent == previous_status_percent:
             return
-        # Remove from DataFrame first:
-        self.dataframe = self.dataframe.drop(index.row() for index in selected_indexes)
-        self.dataframe.index = pandas.Index(range(len(self.dataframe)))
-        # Delete one at a time from Qt model:
-        for name_item in selected_name_items:
-            row = name_item.row()
-            self._model.removeRow(row)
+        self.status_percent[store_row] = status_percent
+        row = self.table_row(store_row)
+        if previous_status_percent == 100:
+            self.n_incomplete += 1
+            self.first_incomplete_hint = min(self.first_incomplete_hint, row)
+        elif status_percent == 100:
+            self.n_incomplete -= 1
+        index = self.index(row, self.COL_STATUS)
+        self.dataChanged.emit(index, index)
+        if self.sort_column == self.COL_STATUS:
+            self.schedule_resort()
 
     def mark_selection_not_done(self):
         selected_indexes = self._view.selectedIndexes()
         selected_rows = set(index.row() for index in selected_indexes)
         for row in selected_rows:
-            status_item = self._model.item(row, self.COL_STATUS)
-            status_item.setData(0, self.ROLE_STATUS_PERCENT)
+            self.set_status_percent(self.store_row(row), 0)
 
     def on_view_context_menu_requested(self, point):
         menu = QtGui.QMenu(self._view)
@@ -1198,8 +1553,7 @@ class DataFrameModel(QtCore.QObject):
         menu.exec_(QtGui.QCursor.pos())
 
     def on_double_click(self, index):
-        filepath_item = self._model.item(index.row(), self.COL_FILEPATH)
-        shot_filepath = filepath_item.text()
+        shot_filepath = self.store.columns[('filepath',)][self.store_row(index.row())]
 
         # get path to text editor
         viewer_path = self.exp_config.get('programs', 'hdf5_viewer')
@@ -1228,9 +1582,9 @@ class DataFrameModel(QtCore.QObject):
         """Pads the keys and values of our lists of column names so that
         they still match those in the dataframe after the number of
         levels in its multiindex has increased"""
-        extra_levels = self.dataframe.columns.nlevels - self.nlevels
+        extra_levels = self.store.nlevels - self.nlevels
         if extra_levels > 0:
-            self.nlevels = self.dataframe.columns.nlevels
+            self.nlevels = self.store.nlevels
             column_indices = {}
             column_names = {}
             for column_name in self.column_indices:
@@ -1245,15 +1599,64 @@ class DataFrameModel(QtCore.QObject):
             self.column_indices = column_indices
             self.column_names = column_names
 
+    def update_columns(self):
+        """Adds columns to the table for any new columns in the dataframe,
+        and removes those no longer in it"""
+        dataframe_column_names = set(self.store.column_names)
+        new_column_names = dataframe_column_names - set(self.column_names.values())
+        defunct_column_names = (set(self.column_names.values()) - dataframe_column_names
+                                - {self.column_names[self.COL_STATUS], self.column_names[self.COL_FILEPATH]})
+        if not new_column_names and not defunct_column_names:
+            return
+
+        defunct_column_indices = [self.column_indices[column_name] for column_name in defunct_column_names]
+        for column_number in sorted(defunct_column_indices, reverse=True):
+            # In reverse order so that removals do not change the position
+            # of columns yet to be removed.
+            self.beginRemoveColumns(QtCore.QModelIndex(), column_number, column_number)
+            # Save whether or not the column was visible when it was
+            # removed (so that if it is re-added the visibility will be retained):
+            self.deleted_columns_visible[self.column_names[column_number]] = self.columns_visible[column_number]
+            # Renumber the columns after it:
+            self.column_names = {index if index < column_number else index - 1: name
+                                 for index, name in self.column_names.items() if index != column_number}
+            self.columns_visible = {index if index < column_number else index - 1: visible
+                                    for index, visible in self.columns_visible.items() if index != column_number}
+            self.column_indices = {name: index for index, name in self.column_names.items()}
+            if self.sort_column == column_number:
+                self.sort_column = -1
+            elif self.sort_column > column_number:
+                self.sort_column -= 1
+            self.endRemoveColumns()
+        if defunct_column_indices and self.sort_column < 0:
+            self.schedule_resort()
+
+        if new_column_names:
+            new_columns_start = len(self.column_names)
+            self.beginInsertColumns(QtCore.QModelIndex(), new_columns_start,
+                                    new_columns_start + len(new_column_names) - 1)
+            for i, column_name in enumerate(sorted(new_column_names)):
+                column_number = new_columns_start + i
+                self.column_names[column_number] = column_name
+                self.column_indices[column_name] = column_number
+                # Restore the former visibility of this column if we've seen
+                # one with its name before, new columns are visible by default:
+                self.columns_visible[column_number] = self.deleted_columns_visible.get(column_name, True)
+            self.endInsertColumns()
+            for column_number in range(new_columns_start, len(self.column_names)):
+                self._view.setColumnHidden(column_number, not self.columns_visible[column_number])
+                # Resize any new columns to fit contents:
+                self._view.resizeColumnToContents(column_number)
+
+        self.columns_changed.emit()
+
     @inmain_decorator()
     def update_row(self, filepath, dataframe_already_updated=False, status_percent=None, new_row_data=None):
-        """"Updates a row in the dataframe and Qt model
-        to the data in the HDF5 file for that shot. Also sets the percent done, if specified"""
-        # Update the row in the dataframe first:
-        df_row_index = np.where(self.dataframe['filepath'].values == filepath)
-        try:
-            df_row_index = df_row_index[0][0]
-        except IndexError:
+        """"Updates a row in the dataframe to the data in the HDF5 file for
+        that shot, and tells the view its cells have changed. Also sets the
+        percent done, if specified"""
+        store_row = self.store.row_index(filepath)
+        if store_row is None:
             # Row has been deleted, nothing to do here:
             return
         if not dataframe_already_updated:
@@ -1261,103 +1664,53 @@ class DataFrameModel(QtCore.QObject):
                 # This can be passed in from the caller as a performace optimisation.
                 # Opening the file can be slow, better not to do it in the GUI thread.
                 new_row_data = get_dataframe_from_shot(filepath)
-            self.dataframe = replace_with_padding(self.dataframe, new_row_data, df_row_index)
+            self.store.replace_row(filepath, new_row_data)
             self.update_column_levels()
+            self.update_columns()
+            row = self.table_row(store_row)
+            self.dataChanged.emit(self.index(row, self.COL_FILEPATH), self.index(row, self.columnCount() - 1))
+            self.schedule_resort()
+        if status_percent is not None:
+            self.set_status_percent(store_row, status_percent)
 
-        # Check and create necessary new columns in the Qt model:
-        new_column_names = set(self.dataframe.columns) - set(self.column_names.values())
-        new_columns_start = self._model.columnCount()
-        self._model.insertColumns(new_columns_start, len(new_column_names))
-        for i, column_name in enumerate(sorted(new_column_names)):
-            # Set the header label of the new column:
-            column_number = new_columns_start + i
-            self.column_names[column_number] = column_name
-            self.column_indices[column_name] = column_number
-            if column_name in self.deleted_columns_visible:
-                # Restore the former visibility of this column if we've
-                # seen one with its name before:
-                visible = self.deleted_columns_visible[column_name]
-                self.columns_visible[column_number] = visible
-                self._view.setColumnHidden(column_number, not visible)
-            else:
-                # new columns are visible by default:
-                self.columns_visible[column_number] = True
-            column_name_as_string = '\n'.join(column_name).strip()
-            header_item = QtGui.QStandardItem(column_name_as_string)
-            header_item.setToolTip(column_name_as_string)
-            self._model.setHorizontalHeaderItem(column_number, header_item)
-        if new_column_names:
-            # Update the visibility state of new columns, in case some new columns are hidden:
-            self.set_columns_visible
-
-        # Check and remove any no-longer-needed columns in the Qt model:
-        defunct_column_names = (set(self.column_names.values()) - set(self.dataframe.columns)
-                                - {self.column_names[self.COL_STATUS], self.column_names[self.COL_FILEPATH]})
-        defunct_column_indices = [self.column_indices[column_name] for column_name in defunct_column_names]
-        for column_number in sorted(defunct_column_indices, reverse=True):
-            # Remove columns from the Qt model. In reverse order so that
-            # removals do not change the position of columns yet to be
-            # removed.
-            self._model.removeColumn(column_number)
-            # Save whether or not the column was visible when it was
-            # removed (so that if it is re-added the visibility will be retained):
-            self.deleted_columns_visible[self.column_names[column_number]] = self.columns_visible[column_number]
-            del self.column_names[column_number]
-            del self.columns_visible[column_number]
-
-        if defunct_column_indices:
-            # Renumber the keys of self.columns_visible and self.column_names to reflect deletions:
-            self.column_names = {newindex: name for newindex, (oldindex, name) in enumerate(sorted(self.column_names.items()))}
-            self.columns_visible = {newindex: visible for newindex, (oldindex, visible) in enumerate(sorted(self.columns_visible.items()))}
-            # Update the inverse mapping of self.column_names:
-            self.column_indices = {name: index for index, name in self.column_names.items()}
-
-        # Update the data in the Qt model:
-        model_row_number = self.get_model_row_by_filepath(filepath)
-        dataframe_row = dict(self.dataframe.ix[df_row_index])
-        for column_number, column_name in self.column_names.items():
-            if not isinstance(column_name, tuple):
-                # One of our special columns, does not correspond to a column in the dataframe:
+    @inmain_decorator()
+    def apply_shot_updates(self, updates):
+        """Applies a batch of updates to the rows of shots, given as a dict
+        keyed by filepath. Each update is a dict with the shot's new
+        'status_percent', or None, its new 'row' of data as a dataframe, or
+        None, and 'results', a dict of values saved to the shot since,
+        keyed by column name."""
+        # The columns changed in each row of the store, or None for all:
+        changed_columns = {}
+        for filepath, update in updates.items():
+            store_row = self.store.row_index(filepath)
+            if store_row is None:
+                # Row has been deleted, nothing to do here:
                 continue
-            item = self._model.item(model_row_number, column_number)
-            if item is None:
-                # This is the first time we've written a value to this part of the model:
-                item = QtGui.QStandardItem('NaN')
-                item.setData(QtCore.Qt.AlignCenter, QtCore.Qt.TextAlignmentRole)
-                self._model.setItem(model_row_number, column_number, item)
-            value = dataframe_row[column_name]
-            if isinstance(value, float):
-                value_str = scientific_notation(value)
-            else:
-                value_str = str(value)
-            lines = value_str.splitlines()
-            if len(lines) > 1:
-                short_value_str = lines[0] + ' ...'
+            if update['row'] is not None:
+                self.store.replace_row(filepath, update['row'])
+                changed_columns[store_row] = None
+            if update['results']:
+                self.store.update_values(filepath, update['results'])
+                if changed_columns.get(store_row, ()) is not None:
+                    changed_columns.setdefault(store_row, set()).update(update['results'])
+        self.update_column_levels()
+        self.update_columns()
+        for store_row, column_names in changed_columns.items():
+            if column_names is None:
+                first, last = self.COL_FILEPATH, self.columnCount() - 1
             else:
-                short_value_str = value_str
-            item.setText(short_value_str)
-            item.setToolTip(repr(value))
-            vert_header_item = QtGui.QStandardItem(os.path.splitext(os.path.basename(filepath))[0])
-            self._model.setVerticalHeaderItem(model_row_number, vert_header_item)
-
-        for i, column_name in enumerate(sorted(new_column_names)):
-            # Resize any new columns to fit contents:
-            column_number = new_columns_start + i
-            self._view.resizeColumnToContents(column_number)
-
-        if status_percent is not None:
-            status_item = self._model.item(model_row_number, self.COL_STATUS)
-            status_item.setData(status_percent, self.ROLE_STATUS_PERCENT)
-
-        if new_column_names or defunct_column_names:
-            self.columns_changed.emit()
-
-    def new_row(self, filepath):
-        status_item = QtGui.QStandardItem()
-        status_item.setData(0, self.ROLE_STATUS_PERCENT)
-        status_item.setIcon(QtGui.QIcon(':qtutils/fugue/tick'))
-        name_item = QtGui.QStandardItem(filepath)
-        return [status_item, name_item]
+                column_indices = [self.column_indices[self.store.pad(self.store.strip_padding(tuple(column_name)))]
+                                  for column_name in column_names]
+                first, last = min(column_indices), max(column_indices)
+            row = self.table_row(store_row)
+            self.dataChanged.emit(self.index(row, first), self.index(row, last))
+        for filepath, update in updates.items():
+            store_row = self.store.row_index(filepath)
+            if store_row is not None and update['status_percent'] is not None:
+                self.set_status_percent(store_row, update['status_percent'])
+        if changed_columns:
+            self.schedule_resort()
 
     @inmain_decorator()
     def add_files(self, filepaths, new_row_data=None):
@@ -1366,25 +1719,20 @@ class DataFrameModel(QtCore.QObject):
             # Ignore duplicate shots when not doing repeats.
             (isRep, _, _, _) =   labscript_utils.file_utils.is_rep_name(filepath)
 
-            if not filepath in self.dataframe['filepath'].values:
+            if self.store.row_index(filepath) is None:
                 # we are not a duplicate
                 to_add.append(filepath)
             elif isRep:
                 # We are a duplicate, but also a rep
                 to_add.append(filepath)
-                
-                # Remove all instances from dataframe:
-                idx = self.dataframe['filepath'].values == filepath
-                self.dataframe['filepath'][idx] = ""
-                
-                # And also from the front panel
-                filepath_colname = ('filepath',) + ('',) * (self.nlevels - 1)
-                existing_items = self._model.findItems(filepath, column=self.column_indices[filepath_colname])
-                
-                for item in existing_items:
-                    item.setText("")
-                    item.setToolTip("")
-                
+
+                # Remove all instances from dataframe, and so also from the front panel:
+                row = self.table_row(self.store.row_index(filepath))
+                self.store.clear_filepath(filepath)
+                index = self.index(row, self.COL_FILEPATH)
+                self.dataChanged.emit(index, index)
+                self.headerDataChanged.emit(QtCore.Qt.Vertical, row, row)
+
             else:
                 # Ignore duplicates:
                 app.output_box.output('Warning: Ignoring duplicate shot %s\n' % filepath, red=True)
@@ -1393,10 +1741,8 @@ class DataFrameModel(QtCore.QObject):
                     new_row_data = new_row_data.drop(df_row_index[0])
                     new_row_data.index = pandas.Index(range(len(new_row_data)))
 
-        for filepath in to_add:
-            # Add the new row to the model:
-            self._model.appendRow(self.new_row(filepath))
-            self._view.resizeRowToContents(self._model.rowCount() - 1)
+        if not to_add:
+            return
         # Add the new rows to the dataframe.
         if new_row_data is None:
             # This can be passed in from the caller as a performace optimisation.
@@ -1404,25 +1750,134 @@ class DataFrameModel(QtCore.QObject):
             new_row_data = get_dataframe_from_shots(to_add)
         else:
             assert len(new_row_data) == len(to_add)
-        self.dataframe = concat_with_padding(self.dataframe, new_row_data)
-        
+        first = self.store.n_rows
+        last = first + len(to_add) - 1
+        self.beginInsertRows(QtCore.QModelIndex(), first, last)
+        self.store.append(new_row_data)
+        self.status_percent.extend([0] * len(to_add))
+        self.n_incomplete += len(to_add)
+        if self.order is not None:
+            # Shown at the end until re-sorted:
+            new_rows = np.arange(first, last + 1)
+            self.order = np.concatenate([self.order, new_rows])
+            self.order_inverse = np.concatenate([self.order_inverse, new_rows])
+        self.endInsertRows()
+
         self.update_column_levels()
-        for filepath in to_add:
-            self.update_row(filepath, dataframe_already_updated=True)
+        self.update_columns()
+        self.schedule_resort()
 
     @inmain_decorator()
-    def get_first_incomplete(self):
-        """Returns the filepath of the first shot in the model that has not
-        been analysed"""
-        for row in range(self._model.rowCount()):
-            status_item = self._model.item(row, self.COL_STATUS)
-            if status_item.data(self.ROLE_STATUS_PERCENT) != 100:
-                filepath_item = self._model.item(row, self.COL_FILEPATH)
-                return filepath_item.text()
+    def get_first_incomplete(self, exclude=()):
+        """Returns the filepath of the first shot in the table that has not
+        been analysed, ignoring those in exclude. Rows before
+        self.first_incomplete_hint are known to be done, so usually only
+        the rows of the shots in progress are looked at."""
+        if not self.n_incomplete:
+            return None
+        filepaths = self.store.columns[('filepath',)]
+        row = self.first_incomplete_hint
+        all_done_so_far = True
+        while row < self.store.n_rows:
+            store_row = self.store_row(row)
+            filepath = filepaths[store_row]
+            # Rows of shots that have been re-added as repeats have no filepath:
+            if self.status_percent[store_row] == 100 or not filepath:
+                if all_done_so_far:
+                    self.first_incomplete_hint = row + 1
+            elif filepath not in exclude:
+                return filepath
+            else:
+                all_done_so_far = False
+            row += 1
+
+
+class ShotReaderPool(object):
+    """A pool of subprocesses that read shot files in parallel, returning
+    flat records as returned by dataframe_utilities.get_flat_record_from_shot.
+    The subprocesses are started the first time they are needed."""
+
+    # Fewer shots than this per subprocess are read in the calling thread
+    # instead, as sending them to the subprocesses would not be any faster:
+    MIN_SHOTS_PER_WORKER = 4
+
+    # How long to wait for the subprocesses to read a batch of shots, in
+    # seconds per shot read by each, but at least MIN_TIMEOUT. Beyond this
+    # they are assumed to have hung or crashed:
+    TIMEOUT_PER_SHOT = 10
+    MIN_TIMEOUT = 30
+
+    def __init__(self, n_workers=None):
+        if n_workers is None:
+            n_workers = min(multiprocessing.cpu_count(), 8)
+        self.n_workers = n_workers
+        self.workers = []
+
+    def start_workers(self):
+        for i in range(self.n_workers):
+            to_worker, from_worker, worker = zprocess.subprocess_with_queues('ingestion_subprocess.py')
+            self.workers.append((to_worker, from_worker, worker))
+
+    def stop_workers(self):
+        """Terminates the subprocesses. They are started again the next
+        time they are needed."""
+        for to_worker, from_worker, worker in self.workers:
+            if worker.poll() is None:
+                worker.terminate()
+        self.workers = []
+
+    def read_records(self, filepaths):
+        """Returns a list of flat records for the given shot files and a list
+        of error messages, in the same way as
+        dataframe_utilities.get_flat_records_from_shots"""
+        n_chunks = min(self.n_workers, len(filepaths) // self.MIN_SHOTS_PER_WORKER)
+        if n_chunks < 2:
+            return get_flat_records_from_shots(filepaths)
+        if not self.workers:
+            self.start_workers()
+        chunk_size = -(-len(filepaths) // n_chunks)
+        chunks = [filepaths[i:i + chunk_size] for i in range(0, len(filepaths), chunk_size)]
+        for (to_worker, from_worker, worker), chunk in zip(self.workers, chunks):
+            to_worker.put(['read', chunk])
+        deadline = time.time() + max(self.MIN_TIMEOUT, self.TIMEOUT_PER_SHOT * chunk_size)
+        records = []
+        errors = []
+        failure = None
+        # The replies of all the subprocesses are collected even once one has
+        # failed, so that none are left to be taken as the replies for the
+        # next batch:
+        for (to_worker, from_worker, worker), chunk in zip(self.workers, chunks):
+            try:
+                signal, data = from_worker.get(timeout=max(deadline - time.time(), 0))
+            except zprocess.TimeoutError:
+                signal, data = 'error', 'Timed out reading shot files, shot reader subprocess not responding'
+            if signal != 'done':
+                if failure is None:
+                    failure = data
+                continue
+            chunk_records, chunk_errors = data
+            records.extend(chunk_records)
+            errors.extend(chunk_errors)
+        if failure is not None:
+            # A subprocess that timed out may still reply later, so start
+            # afresh rather than reading its reply as that for another batch:
+            self.stop_workers()
+            raise RuntimeError(failure)
+        return records, errors
 
 
 class FileBox(object):
 
+    # The most and fewest shots to add to the dataframe at once. Between
+    # these limits, a quarter of the shots waiting in the incoming queue are
+    # taken each time, so that a backlog is added in a few large batches:
+    MIN_BATCH_SIZE = 5
+    MAX_BATCH_SIZE = 1000
+
+    # How often, in milliseconds, the progress and results of analysis are
+    # applied to the shots table. Updates in between are batched up:
+    SHOT_UPDATE_INTERVAL = 100
+
     def __init__(self, container, exp_config, to_singleshot, from_singleshot, to_multishot, from_multishot):
 
         self.exp_config = exp_config
@@ -1462,6 +1917,21 @@ class FileBox(object):
         # or paused:
         self.incoming_queue = Queue.Queue()
 
+        # An on-disk cache of dataframe rows, so that shots that have not
+        # changed since lyse last read them need not be read again:
+        self.dataframe_cache = DataFrameCache()
+
+        # Subprocesses for reading large numbers of incoming shots in parallel:
+        self.shot_reader_pool = ShotReaderPool()
+
+        # Progress and results of analysis not yet applied to the shots
+        # table, keyed by filepath:
+        self.pending_shot_updates = {}
+        self.pending_shot_updates_lock = threading.Lock()
+        self.shot_update_timer = QtCore.QTimer()
+        self.shot_update_timer.timeout.connect(self.flush_shot_updates)
+        self.shot_update_timer.start(self.SHOT_UPDATE_INTERVAL)
+
         # Start the thread to handle incoming files, and store them in
         # a buffer if processing is paused:
         self.incoming = threading.Thread(target=self.incoming_buffer_loop)
@@ -1562,6 +2032,8 @@ class FileBox(object):
                 if self.incoming_queue.qsize() == 0:
                     # Wait momentarily in case more arrive so we can batch process them:
                     time.sleep(0.1)
+                batch_size = self.incoming_queue.qsize() // 4
+                batch_size = max(self.MIN_BATCH_SIZE, min(batch_size, self.MAX_BATCH_SIZE))
                 while True:
                     try:
                         filepath = self.incoming_queue.get(False)
@@ -1569,7 +2041,7 @@ class FileBox(object):
                         break
                     else:
                         filepaths.append(filepath)
-                        if len(filepaths) >= 5:
+                        if len(filepaths) >= batch_size:
                             break
                 logger.info('adding:\n%s' % '\n'.join(filepaths))
                 if n_shots_added == 0:
@@ -1579,23 +2051,21 @@ class FileBox(object):
                 # Remove duplicates from the list (preserving order) in case the
                 # client sent the same filepath multiple times:
                 filepaths = sorted(set(filepaths), key=filepaths.index) # Inefficient but readable
-                # We open the HDF5 files here outside the GUI thread so as not to hang the GUI:
-                dataframes = []
-                for i, filepath in enumerate(filepaths):
-                    dataframe = get_dataframe_from_shot(filepath)
-                    dataframes.append(dataframe)
-                    n_shots_added += 1
-                    shots_remaining = self.incoming_queue.qsize()
-                    total_shots = n_shots_added + shots_remaining + len(filepaths) - (i + 1)
-                    if i != len(filepaths) - 1:
-                        # Leave the last update until after dataframe concatenation.
-                        # Looks more responsive that way:
-                        self.set_add_shots_progress(n_shots_added, total_shots)
-                new_row_data = concat_with_padding(*dataframes)
+                # We open the HDF5 files here outside the GUI thread so as not to hang the GUI.
+                # Shots that are unchanged since we last read them are loaded from the cache,
+                # and the rest read in parallel by the shot reader pool:
+                new_row_data = self.dataframe_cache.get_dataframe_from_shots(filepaths, self.read_records)
+                n_shots_added += len(filepaths)
+                shots_remaining = self.incoming_queue.qsize()
+                total_shots = n_shots_added + shots_remaining
                 self.set_add_shots_progress(n_shots_added, total_shots)
-                self.shots_model.add_files(filepaths, new_row_data)
+                if len(new_row_data):
+                    # Only the shots that could be read:
+                    filepaths = list(new_row_data['filepath'].values)
+                    self.shots_model.add_files(filepaths, new_row_data)
                 if shots_remaining == 0:
                     n_shots_added = 0 # reset our counter for the next batch
+                    self.dataframe_cache.schedule_save()
                 # Let the analysis loop know to look for new shots:
                 self.analysis_pending.set()
             except Exception:
@@ -1603,6 +2073,12 @@ class FileBox(object):
                 # otherwise uncaught exception visible to the user:
                 zprocess.raise_exception_in_thread(sys.exc_info())
 
+    def read_records(self, filepaths):
+        records, errors = self.shot_reader_pool.read_records(filepaths)
+        for message in errors:
+            app.output_box.output(message, red=True)
+        return records, errors
+
     def analysis_loop(self):
         logger = logging.getLogger('lyse.FileBox.analysis_loop')
         # HDF5 prints lots of errors by default, for things that aren't
@@ -1616,8 +2092,17 @@ class FileBox(object):
             at_least_one_shot_analysed = False
             while True:
                 if not self.analysis_paused:
-                    # Find the first shot that has not finished being analysed:
-                    filepath = self.shots_model.get_first_incomplete()
+                    n_concurrent = app.singleshot_routinebox.concurrent_shots()
+                    if n_concurrent > 1:
+                        # Analyse all remaining shots, several at a time:
+                        if self.do_concurrent_singleshot_analysis(n_concurrent):
+                            at_least_one_shot_analysed = True
+                        if self.analysis_paused:
+                            continue
+                        filepath = None
+                    else:
+                        # Find the first shot that has not finished being analysed:
+                        filepath = self.get_first_incomplete()
                     if filepath is not None:
                         logger.info('analysing: %s'%filepath)
                         self.do_singleshot_analysis(filepath)
@@ -1625,6 +2110,8 @@ class FileBox(object):
                     if filepath is None and at_least_one_shot_analysed:
                         self.multishot_required = True
                     if filepath is None:
+                        # Save the rows of the shots we analysed to the cache:
+                        self.dataframe_cache.schedule_save()
                         break
                     if self.multishot_required:
                         logger.info('doing multishot analysis')
@@ -1642,26 +2129,96 @@ class FileBox(object):
         # This automatically triggers the slot that sets self.analysis_paused
         self.ui.pushButton_analysis_running.setChecked(True)
 
+    def get_first_incomplete(self, exclude=()):
+        """The first shot in the shots table that has not been analysed,
+        ignoring those in exclude and those whose progress has not yet been
+        applied to the table"""
+        with self.pending_shot_updates_lock:
+            exclude = set(exclude).union(self.pending_shot_updates)
+        return self.shots_model.get_first_incomplete(exclude=exclude)
+
     def do_singleshot_analysis(self, filepath):
         self.to_singleshot.put(filepath)
         while True:
-            signal, status_percent = self.from_singleshot.get()
-            if signal in ['error', 'progress']:
-                # Do the file reading here outside the GUI thread so as not to hang the GUI:
-                new_row_data = get_dataframe_from_shot(filepath)
-                self.shots_model.update_row(filepath, status_percent=status_percent, new_row_data=new_row_data)
-            if signal == 'done':
-                # No need to update the dataframa again, that should have been done with the last 'progress' signal:
-                self.shots_model.update_row(filepath, status_percent=status_percent, dataframe_already_updated=True)
-                return
-            if signal == 'error':
-                self.pause_analysis()
+            signal, status_percent, filepath, results, shot_stat = self.from_singleshot.get()
+            self.handle_singleshot_signal(signal, status_percent, filepath, results, shot_stat)
+            if signal in ['done', 'error']:
                 return
 
+    def do_concurrent_singleshot_analysis(self, n_concurrent):
+        """Analyse shots until there are none left, keeping up to
+        n_concurrent of them in progress at once. Stops sending new shots if
+        analysis is paused, and returns once those in progress have
+        finished. Returns the number of shots analysed."""
+        logger = logging.getLogger('lyse.FileBox.analysis_loop')
+        in_progress = set()
+        n_analysed = 0
+        while True:
+            while not self.analysis_paused and len(in_progress) < n_concurrent:
+                filepath = self.get_first_incomplete(exclude=in_progress)
+                if filepath is None:
+                    break
+                logger.info('analysing: %s'%filepath)
+                self.to_singleshot.put(filepath)
+                in_progress.add(filepath)
+            if not in_progress:
+                return n_analysed
+            signal, status_percent, filepath, results, shot_stat = self.from_singleshot.get()
+            self.handle_singleshot_signal(signal, status_percent, filepath, results, shot_stat)
+            if signal in ['done', 'error']:
+                in_progress.discard(filepath)
+                n_analysed += 1
+
+    def handle_singleshot_signal(self, signal, status_percent, filepath, results, shot_stat):
+        """Adds the progress of analysis of a shot, and the results the
+        routine saved to it, to the updates to be applied to the shots table
+        at the next flush_shot_updates()"""
+        new_row_data = None
+        if signal in ['error', 'progress'] and results is None:
+            # The routine changed the shot file other than by saving results
+            # with lyse.Run, so it has to be read again. Do the file reading
+            # here outside the GUI thread so as not to hang the GUI:
+            new_row_data = self.dataframe_cache.get_dataframe_from_shots([filepath], self.read_records)
+            if not len(new_row_data):
+                # Could not read the shot, leave its row as it was:
+                new_row_data = None
+        elif results is not None and shot_stat is not None:
+            # Saving the results changed the shot file. Update its cached
+            # row to match, so it is not read again on the next reload. The
+            # file's size and modification time were taken by the worker when
+            # the results were read back, as the next routine may already be
+            # writing to the file:
+            self.dataframe_cache.update_results(filepath, results, shot_stat)
+        with self.pending_shot_updates_lock:
+            if filepath not in self.pending_shot_updates:
+                self.pending_shot_updates[filepath] = {'status_percent': None, 'row': None, 'results': {}}
+            update = self.pending_shot_updates[filepath]
+            if status_percent is not None:
+                update['status_percent'] = status_percent
+            if new_row_data is not None:
+                # Includes any results saved before:
+                update['row'] = new_row_data
+                update['results'] = {}
+            elif results:
+                update['results'].update(results)
+        if signal == 'error':
+            self.pause_analysis()
+
+    @inmain_decorator()
+    def flush_shot_updates(self):
+        """Applies all progress and results of analysis received since the
+        last call to the shots table at once"""
+        with self.pending_shot_updates_lock:
+            updates, self.pending_shot_updates = self.pending_shot_updates, {}
+        if updates:
+            self.shots_model.apply_shot_updates(updates)
+
     def do_multishot_analysis(self):
+        # Multishot routines must see the results of all single-shot analysis:
+        self.flush_shot_updates()
         self.to_multishot.put(None)
         while True:
-            signal, _ = self.from_multishot.get()
+            signal, _, _, _, _ = self.from_multishot.get()
             if signal == 'done':
                 self.multishot_required = False
                 return
@@ -1777,3 +2334,5 @@ if __name__ == "__main__":
     
     qapplication.exec_()
     server.shutdown()
+    # Save any rows not yet saved by the cache's scheduled saves:
+    app.filebox.dataframe_cache.save()
@@ -13,13 +13,17 @@
 
 import labscript_utils.excepthook
 import zprocess
-to_parent, from_parent, kill_lock = zprocess.setup_connection_with_parent(lock = True)
+if __name__ == '__main__':
+    # Connect to lyse before anything slow is imported. Only when run as a
+    # subprocess, so that the module can be imported by its tests:
+    to_parent, from_parent, kill_lock = zprocess.setup_connection_with_parent(lock = True)
 
 import sys
 import os
 import threading
 import traceback
 import time
+import hashlib
 
 import sip
 # Have to set PyQt API via sip before importing PyQt:
@@ -43,6 +47,7 @@ lyse.figure_manager.install()
 from matplotlib.backends.backend_qt4agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt4agg import NavigationToolbar2QT as NavigationToolbar
 import pylab
+import numpy as np
 import zprocess.locking, labscript_utils.h5_lock, h5py
 
 import zprocess
@@ -207,10 +212,37 @@ class Plot(object):
 
 
 class AnalysisWorker(object):
-    def __init__(self, filepath, to_parent, from_parent):
+    def __init__(self, filepath, options, to_parent, from_parent):
         self.to_parent = to_parent
         self.from_parent = from_parent
         self.filepath = filepath
+
+        # A multishot routine declaring 'lyse_incremental = True' defines a
+        # function update(df, state), which is called with only the shots
+        # added or changed since it last ran, and a dict it can keep
+        # results in from one run to the next. If it also declares
+        # 'lyse_columns', only those columns are fetched, and shots whose
+        # values in them have not changed are left out:
+        self.incremental = bool(options.get('lyse_incremental', False))
+        self.columns = options.get('lyse_columns', None)
+        self.state = {}
+        # The lyse dataframe version the routine has seen up to, and each
+        # shot's values in the routine's columns at that time:
+        self.data_version = None
+        self.row_values = {}
+
+        # A routine declaring 'lyse_cached = True' has its top level run only
+        # once, rather than every shot, and again only if the file or any
+        # module it imports changes. It defines a function run(path, state),
+        # which is called for each shot, and optionally setup(), which is
+        # called after loading and returns the state (otherwise a dict):
+        self.cached = bool(options.get('lyse_cached', False))
+        self.namespace = None
+        self.cached_state = None
+        # What the cached namespace was made from:
+        self.source_stat = None
+        self.source_hash = None
+        self.unload_count = None
         
         # Add user script directory to the pythonpath:
         sys.path.insert(0, os.path.dirname(self.filepath))
@@ -243,11 +275,11 @@ class AnalysisWorker(object):
                     path = data
                     success = self.do_analysis(path)
                     if success:
-                        self.to_parent.put(['done', None])
+                        self.to_parent.put(['done', self.saved_results, self.shot_stat])
                     else:
-                        self.to_parent.put(['error', None])
+                        self.to_parent.put(['error', self.saved_results, self.shot_stat])
                 else:
-                    self.to_parent.put(['error','invalid task %s'%str(task)])
+                    self.to_parent.put(['error','invalid task %s'%str(task), None])
         
     @inmain_decorator()
     def do_analysis(self, path):
@@ -256,6 +288,25 @@ class AnalysisWorker(object):
             print('%s %s %s ' %(now, os.path.basename(self.filepath), os.path.basename(path)))
         else:
             print('%s %s' %(now, os.path.basename(self.filepath)))
+        # The results saved to the shot, and the size and modification time
+        # of the shot file with them saved, sent to the parent when done:
+        self.saved_results = {}
+        self.shot_stat = None
+
+        incremental = self.incremental and path is None
+        if incremental:
+            try:
+                df, complete, data_version, row_values = self.get_changed_data()
+            except:
+                traceback_lines = traceback.format_exception(*sys.exc_info())
+                sys.stderr.write(''.join(traceback_lines))
+                return False
+            if not complete and not len(df):
+                print('no changes to analyse\n')
+                # Don't fetch the same unchanged rows again next time:
+                self.data_version = data_version
+                self.row_values = row_values
+                return True
 
         self.pre_analysis_plot_actions()
 
@@ -270,12 +321,44 @@ class AnalysisWorker(object):
         sandbox.deprecation_messages['path'] = deprecation_message
         # Use lyse.path instead:
         lyse.path = path
+        # So that Runs the routine creates inside functions know its name:
+        lyse._routine_file = self.filepath
+        # Record the results the routine saves to the shot, so that lyse can
+        # update the shot's row in the dataframe without reading it again:
+        if path is not None:
+            lyse._saved_results = {}
+            lyse._shot_stat = None
+            file_stat = self.get_file_stat(path)
 
         # Do not let the modulewatcher unload any modules whilst we're working:
         try:
             with self.modulewatcher.lock:
                 # Actually run the user's analysis!
-                execfile(self.filepath, sandbox, sandbox)
+                if self.cached:
+                    namespace = self.get_cached_namespace()
+                else:
+                    execfile(self.filepath, sandbox, sandbox)
+                    namespace = sandbox
+                if incremental:
+                    if 'update' not in namespace:
+                        raise NameError('incremental routines must define a function update(df, state)')
+                    if complete:
+                        self.state = {}
+                    try:
+                        namespace['update'](df, self.state)
+                    except:
+                        # The state may have been partly updated with these
+                        # rows, so start again from all shots next time:
+                        self.state = {}
+                        self.data_version = None
+                        self.row_values = {}
+                        raise
+                    self.data_version = data_version
+                    self.row_values = row_values
+                elif self.cached:
+                    if 'run' not in namespace:
+                        raise NameError('cached routines must define a function run(path, state)')
+                    namespace['run'](path, self.cached_state)
         except:
             traceback_lines = traceback.format_exception(*sys.exc_info())
             del traceback_lines[1]
@@ -285,9 +368,100 @@ class AnalysisWorker(object):
         else:
             return True
         finally:
+            if path is not None:
+                self.saved_results, self.shot_stat = self.get_saved_results(path, file_stat)
             print('')
             self.post_analysis_plot_actions()
+
+    @staticmethod
+    def get_file_stat(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime, stat.st_size
+
+    def get_saved_results(self, path, file_stat):
+        """The results the routine saved to the shot with lyse.Run, keyed by
+        dataframe column name, and the size and modification time of the shot
+        file now. The results are None if the shot file was changed other
+        than by a Run since it was last closed, in which case lyse has to read
+        it again"""
+        saved_results = lyse._saved_results
+        lyse._saved_results = None
+        shot_stat = self.get_file_stat(path)
+        if lyse._shot_stat is not None:
+            # A Run wrote to the file, it should be as that Run left it:
+            file_stat = lyse._shot_stat
+        if shot_stat != file_stat:
+            return None, shot_stat
+        return saved_results, shot_stat
         
+    def get_cached_namespace(self):
+        """Returns the namespace of a cached routine, compiling and running
+        its top level and setup() only if the file's contents, or any module
+        the modulewatcher knows of, have changed since last time. The file is
+        only read and hashed if its modification time or size has changed."""
+        if self.modulewatcher.unload_count != self.unload_count:
+            self.namespace = None
+        stat = os.stat(self.filepath)
+        source_stat = (stat.st_mtime, stat.st_size)
+        if self.namespace is not None and source_stat == self.source_stat:
+            return self.namespace
+        with open(self.filepath, 'rb') as f:
+            source = f.read()
+        source_hash = hashlib.sha1(source).hexdigest()
+        if self.namespace is None or source_hash != self.source_hash:
+            # If loading fails, try again next time:
+            self.namespace = None
+            code = compile(source, self.filepath, 'exec')
+            namespace = {'__name__': '__main__', '__file__': self.filepath}
+            exec(code, namespace)
+            if 'setup' in namespace:
+                self.cached_state = namespace['setup']()
+            else:
+                self.cached_state = {}
+            self.namespace = namespace
+            self.source_hash = source_hash
+            self.unload_count = self.modulewatcher.unload_count
+        self.source_stat = source_stat
+        return self.namespace
+
+    def get_changed_data(self):
+        """Returns a dataframe of the shots added or changed since the
+        incremental routine last ran successfully, and whether it instead
+        holds all shots, as on the first run or after shots have been removed
+        from lyse. Also returns the dataframe version and row values to
+        remember if the routine succeeds."""
+        df, data_version, complete = lyse.data_since(self.data_version, columns=self.columns)
+        if complete:
+            row_values = {}
+        else:
+            row_values = self.row_values.copy()
+        if self.columns is not None and len(df):
+            changed = []
+            for filepath, row in zip(df['filepath'], df.values.tolist()):
+                changed.append(filepath not in row_values or not self.rows_equal(row_values[filepath], row))
+                row_values[filepath] = row
+            if not complete:
+                df = df[changed]
+        return df, complete, data_version, row_values
+
+    @staticmethod
+    def rows_equal(row, other_row):
+        """Whether two lists of dataframe values are equal, comparing
+        arrays element by element and counting NaNs as equal to each other"""
+        if len(row) != len(other_row):
+            return False
+        for value, other_value in zip(row, other_row):
+            if isinstance(value, np.ndarray) or isinstance(other_value, np.ndarray):
+                if not (isinstance(value, np.ndarray) and isinstance(other_value, np.ndarray)
+                        and value.dtype == other_value.dtype and np.array_equal(value, other_value)):
+                    return False
+            elif value != other_value and not (value != value and other_value != other_value):
+                return False
+        return True
+
     def pre_analysis_plot_actions(self):
         for plot in self.plots.values():
             plot.save_axis_limits()
@@ -325,11 +499,12 @@ class AnalysisWorker(object):
         
 if __name__ == '__main__':
     filepath = from_parent.get()
+    options = from_parent.get()
     
     # Set a meaningful client id for zprocess.locking:
     zprocess.locking.set_client_process_name('lyse-'+os.path.basename(filepath))
     
     qapplication = QtGui.QApplication(sys.argv)
-    worker = AnalysisWorker(filepath, to_parent, from_parent)
+    worker = AnalysisWorker(filepath, options, to_parent, from_parent)
     qapplication.exec_()
         
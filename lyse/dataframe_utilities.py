@@ -14,6 +14,12 @@
 import labscript_utils.h5_lock, h5py
 import pandas
 import os
+import sys
+import cPickle
+import threading
+import logging
+import hashlib
+import traceback
 from numpy import *
 import tzlocal
 import labscript_utils.shared_drive
@@ -73,6 +79,56 @@ def get_nested_dict_from_shot(filepath):
             pass
         return row
 
+def get_flat_record_from_shot(filepath):
+    """Returns the same data as flatten_dict(get_nested_dict_from_shot(filepath)),
+    but opens the shot file only once, and walks the images group in a
+    single pass with visititems() rather than looking up each orientation,
+    label and image by name."""
+    record = {}
+    with h5py.File(filepath, 'r') as h5_file:
+        for name, value in runmanager.get_shot_globals_from_file(h5_file).items():
+            record[(str(name),)] = value
+        if 'results' in h5_file:
+            for groupname, resultsgroup in h5_file['results'].items():
+                # A results group takes the place of any global of the same name:
+                record.pop((str(groupname),), None)
+                for key, val in resultsgroup.attrs.items():
+                    record[(str(groupname), str(key))] = val
+
+        def visit_images(name, obj):
+            path = tuple(str(part) for part in name.split('/'))
+            if len(path) == 1 and isinstance(obj, h5py.Group):
+                # orientation:
+                record.pop(path, None)
+                for key, val in obj.attrs.items():
+                    record[path + (str(key),)] = val
+            elif len(path) == 3:
+                # orientation/label/image:
+                for key, val in obj.attrs.items():
+                    if not isinstance(val, h5py.Reference):
+                        record[path + (str(key),)] = val
+
+        if 'images' in h5_file:
+            h5_file['images'].visititems(visit_images)
+        attrs = dict(h5_file.attrs)
+        record[('filepath',)] = filepath
+        record[('agnostic_path',)] = labscript_utils.shared_drive.path_to_agnostic(filepath)
+        record[('sequence',)] = asdatetime(attrs['sequence_id'].split('_')[0])
+        record[('sequence_index',)] = attrs.get('sequence_index', float('nan'))
+        if 'script' in h5_file:
+            record[('labscript',)] = h5_file['script'].attrs['name']
+        if 'run time' in attrs:
+            record[('run time',)] = asdatetime(attrs['run time'])
+        else:
+            record[('run time',)] = float('nan')
+        if 'run number' in attrs:
+            record[('run number',)] = attrs['run number']
+        if 'individual id' in attrs:
+            record[('individual id',)] = attrs['individual id']
+            if 'generation' in attrs:
+                record[('generation',)] = attrs['generation']
+    return record
+
 def flatten_dict(dictionary, keys=tuple()):
     """Takes a nested dictionary whose keys are strings, and returns a
     flat dictionary whose keys are tuples of strings, each element of
@@ -100,6 +156,26 @@ def flat_dict_to_hierarchical_dataframe(dictionary):
     index = pandas.MultiIndex.from_tuples(sorted(result.keys()))
     return pandas.DataFrame([result],columns=index)
 
+def flat_dicts_to_hierarchical_dataframe(dictionaries):
+    """As flat_dict_to_hierarchical_dataframe, but for many flat
+    dictionaries at once, each becoming a row of the dataframe. Much faster
+    than making a dataframe for each and concatenating them."""
+    max_tuple_length = 2 # Must have at least two levels to make a MultiIndex
+    for dictionary in dictionaries:
+        for key in dictionary:
+            max_tuple_length = max(max_tuple_length,len(key))
+    rows = []
+    for dictionary in dictionaries:
+        row = {}
+        for key in dictionary:
+            row[key + ('',)*(max_tuple_length - len(key))] = dictionary[key]
+        rows.append(row)
+    columns = set()
+    for row in rows:
+        columns.update(row)
+    index = pandas.MultiIndex.from_tuples(sorted(columns))
+    return pandas.DataFrame(rows,columns=index)
+
 def flat_dict_to_flat_series(dictionary):
     max_tuple_length = 2 # Must have at least two levels to make a MultiIndex
     result = {}
@@ -114,17 +190,228 @@ def flat_dict_to_flat_series(dictionary):
     return pandas.Series(result,index=keys)
 
 def get_dataframe_from_shot(filepath):
-    nested_dict = get_nested_dict_from_shot(filepath)
-    flat_dict =  flatten_dict(nested_dict)
+    flat_dict = get_flat_record_from_shot(filepath)
     df = flat_dict_to_hierarchical_dataframe(flat_dict)
     return df
 
 def get_dataframe_from_shots(filepaths):
     return concat_with_padding(*[get_dataframe_from_shot(filepath) for filepath in filepaths])
 
+def get_flat_records_from_shots(filepaths):
+    """Returns a list of flat records, as returned by
+    get_flat_record_from_shot, for the given shot files, and a list of error
+    messages. Rather than raising an exception if a shot cannot be read, its
+    record is None and the traceback is added to the error messages."""
+    records = []
+    errors = []
+    for filepath in filepaths:
+        try:
+            records.append(get_flat_record_from_shot(filepath))
+        except Exception:
+            records.append(None)
+            message = ''.join(traceback.format_exception(*sys.exc_info()))
+            errors.append('Could not read shot %s:\n%s' % (filepath, message))
+    return records, errors
+
+class DataFrameCache(object):
+    """An on-disk cache of the dataframe rows of shot files, so that
+    reloading a folder of shots does not require every shot file to be
+    read again. The cache for each folder of shots is a pickled dataframe,
+    along with the size and modification time of each shot it contains.
+    The caches are kept in a directory of the user's own, cache_dir, by
+    default in their local application data, and not in the shot folders:
+    these are often on shared drives, and unpickling a file that others
+    can write to would let them run code in lyse. A cached row is only used if the shot file
+    still has the same size and modification time, otherwise the shot is
+    read again and its row replaced.
+
+    Rows read by get_dataframe_from_shots(), or updated with the results
+    of analysis by update_results(), are held in memory until save() is
+    called, so that updating the rows of shots that have just
+    been analysed does not require rewriting the cache file each time.
+    Each save rewrites the cache of the whole folder, so callers adding
+    shots one at a time should use schedule_save(), which saves at most
+    once every save_interval seconds, and call save() before exiting."""
+
+    version = 2
+    save_interval = 30
+
+    def __init__(self, cache_dir=None):
+        self.logger = logging.getLogger('lyse.DataFrameCache')
+        if cache_dir is None:
+            cache_dir = self.default_cache_dir()
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()
+        # Cached rows for each folder, as loaded from disk or last saved,
+        # keyed by folder. Each is a tuple (keys, positions, dataframe),
+        # where keys is a dict of filepath: (mtime, size), and positions a
+        # dict of filepath: row number in the dataframe:
+        self.folders = {}
+        # Records of shots read since the cache was last saved, keyed by
+        # folder. Each is a dict of filepath: (key, flat record):
+        self.pending = {}
+        # The timer for the save requested by schedule_save(), if any:
+        self.save_timer = None
+
+    @staticmethod
+    def default_cache_dir():
+        if os.name == 'nt':
+            base_dir = os.getenv('LOCALAPPDATA') or os.path.expanduser('~')
+        else:
+            base_dir = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        return os.path.join(base_dir, 'labscript_suite', 'lyse_dataframe_cache')
+
+    def cache_path(self, folder):
+        """The path of the cache file of a folder of shots"""
+        folder = os.path.normcase(os.path.abspath(folder))
+        if isinstance(folder, unicode):
+            folder = folder.encode('utf8')
+        return os.path.join(self.cache_dir, hashlib.sha1(folder).hexdigest() + '.pickle')
+
+    @staticmethod
+    def get_key(filepath):
+        stat = os.stat(filepath)
+        return stat.st_mtime, stat.st_size
+
+    def load_folder(self, folder):
+        if folder in self.folders:
+            return self.folders[folder]
+        keys, dataframe = {}, pandas.DataFrame()
+        cache_path = self.cache_path(folder)
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'rb') as f:
+                    cache = cPickle.load(f)
+                if cache['version'] == self.version and cache['folder'] == folder:
+                    keys, dataframe = cache['keys'], cache['dataframe']
+            except Exception as e:
+                # A cache written by an incompatible version of pandas or
+                # truncated. Not fatal, the shots will be read again:
+                self.logger.warning('Could not load cache %s: %s' % (cache_path, str(e)))
+        if len(dataframe):
+            positions = {filepath: i for i, filepath in enumerate(dataframe['filepath'].values)}
+        else:
+            positions = {}
+        self.folders[folder] = keys, positions, dataframe
+        return self.folders[folder]
+
+    def get_dataframe_from_shots(self, filepaths, read_records=None):
+        """Equivalent to get_dataframe_from_shots(filepaths), but with rows
+        of unmodified shots loaded from the cache rather than read from the
+        shot files. Other shots are read with read_records(filepaths), which
+        should return a list of flat records and a list of error messages,
+        as get_flat_records_from_shots (the default) does. Shots that could
+        not be read are left out of the returned dataframe."""
+        if read_records is None:
+            read_records = get_flat_records_from_shots
+        cached_positions = {}
+        records = {}
+        to_read = []
+        with self.lock:
+            for filepath in filepaths:
+                folder = os.path.dirname(filepath)
+                keys, positions, dataframe = self.load_folder(folder)
+                pending = self.pending.setdefault(folder, {})
+                key = self.get_key(filepath)
+                if filepath in pending and pending[filepath][0] == key:
+                    records[filepath] = pending[filepath][1]
+                elif filepath in positions and keys[filepath] == key:
+                    cached_positions.setdefault(folder, []).append(positions[filepath])
+                else:
+                    to_read.append((filepath, key))
+        # Read the files without holding the lock, this is the slow part:
+        new_records, errors = read_records([filepath for filepath, key in to_read])
+        with self.lock:
+            for (filepath, key), record in zip(to_read, new_records):
+                if record is not None:
+                    self.pending[os.path.dirname(filepath)][filepath] = key, record
+                    records[filepath] = record
+            dataframes = [self.folders[folder][2].iloc[rows] for folder, rows in cached_positions.items()]
+        if records:
+            dataframes.append(flat_dicts_to_hierarchical_dataframe(records.values()))
+        for message in errors:
+            self.logger.error(message)
+        if not [df for df in dataframes if len(df)]:
+            return pandas.DataFrame()
+        result = concat_with_padding(*dataframes)
+        # Put the rows in the order they were requested:
+        positions = {filepath: i for i, filepath in enumerate(result['filepath'].values)}
+        result = result.iloc[[positions[filepath] for filepath in filepaths if filepath in positions]]
+        result.index = pandas.Index(range(len(result)))
+        return result
+
+    def update_results(self, filepath, results, key):
+        """Set values saved to a shot since its row was cached, given as a
+        dict keyed by column name, and record the shot's size and
+        modification time with them saved, as returned by get_key(), so that
+        its cached row remains valid without reading the shot again. Does
+        nothing if the shot is not cached."""
+        folder = os.path.dirname(filepath)
+        with self.lock:
+            keys, positions, dataframe = self.load_folder(folder)
+            pending = self.pending.setdefault(folder, {})
+            if filepath in pending:
+                record = dict(pending[filepath][1])
+            elif filepath in positions:
+                row = dataframe.iloc[positions[filepath]]
+                record = {DataFrameStore.strip_padding(column_name): value for column_name, value in row.iteritems()}
+            else:
+                return
+            for column_name, value in results.items():
+                record[DataFrameStore.strip_padding(tuple(column_name))] = value
+            pending[filepath] = tuple(key), record
+
+    def schedule_save(self):
+        """Calls save() in a background thread in save_interval seconds,
+        unless a save is already scheduled. Rows read in the meantime are
+        saved then too."""
+        with self.lock:
+            if self.save_timer is None:
+                self.save_timer = threading.Timer(self.save_interval, self.save)
+                self.save_timer.daemon = True
+                self.save_timer.start()
+
+    def save(self):
+        """Merge rows read since the last save into the cache of each folder
+        and write the caches to disk"""
+        with self.lock:
+            # This save includes any that was scheduled:
+            timer, self.save_timer = self.save_timer, None
+            if timer is not None and timer is not threading.current_thread():
+                timer.cancel()
+            for folder, pending in self.pending.items():
+                if not pending:
+                    continue
+                keys, positions, dataframe = self.folders[folder]
+                keys = keys.copy()
+                for filepath, (key, record) in pending.items():
+                    keys[filepath] = key
+                kept = [i for filepath, i in positions.items() if filepath not in pending]
+                new_rows = flat_dicts_to_hierarchical_dataframe([record for key, record in pending.values()])
+                dataframe = concat_with_padding(dataframe.iloc[sorted(kept)], new_rows)
+                positions = {filepath: i for i, filepath in enumerate(dataframe['filepath'].values)}
+                self.folders[folder] = keys, positions, dataframe
+                self.pending[folder] = {}
+                cache_path = self.cache_path(folder)
+                temp_path = cache_path + '.tmp'
+                try:
+                    if not os.path.exists(self.cache_dir):
+                        # Readable only by the user:
+                        os.makedirs(self.cache_dir, 0o700)
+                    with open(temp_path, 'wb') as f:
+                        cPickle.dump({'version': self.version, 'folder': folder, 'keys': keys,
+                                      'dataframe': dataframe}, f, cPickle.HIGHEST_PROTOCOL)
+                    # os.rename will not overwrite an existing file on Windows:
+                    if os.path.exists(cache_path):
+                        os.remove(cache_path)
+                    os.rename(temp_path, cache_path)
+                except (IOError, OSError) as e:
+                    # Disk full, perhaps. Not fatal, the rows are still
+                    # cached in memory:
+                    self.logger.warning('Could not save cache %s: %s' % (cache_path, str(e)))
+
 def get_series_from_shot(filepath):
-    nested_dict = get_nested_dict_from_shot(filepath)
-    flat_dict =  flatten_dict(nested_dict)
+    flat_dict = get_flat_record_from_shot(filepath)
     s = flat_dict_to_flat_series(flat_dict)
     return s
 
@@ -168,6 +455,373 @@ def replace_with_padding(df,row,index):
     df = df.sort()
     return df
 
+class DataFrameStore(object):
+    """Column-wise storage for the rows of the lyse dataframe, in which
+    adding a row, replacing a row and adding a column take amortised
+    constant time, rather than the time taken to rebuild a dataframe of
+    all the shots. Each column is a numpy array with spare capacity for
+    more rows, which is doubled when it runs out. A pandas dataframe of the
+    stored rows is made only when it is asked for, and kept until the data
+    changes.
+
+    Columns are named by tuples as in the dataframe, but without padding,
+    which is added when the dataframe is made. Column dtypes follow the
+    rules pandas uses when concatenating rows: integers become floats and
+    booleans become objects when a row is missing a value (NaN), and
+    columns of mixed types become objects. Columns of timestamps, such as
+    the sequence and run time, are stored as datetime64 values in UTC, and
+    made timezone aware again in the dataframe.
+
+    Every change to the store increments its version, and each row records
+    the version at which it last changed, so that query() can return only
+    the rows that have changed since a client last asked."""
+
+    def __init__(self, initial_capacity=64):
+        self.capacity = initial_capacity
+        self.n_rows = 0
+        # How many levels the dataframe's multiindex has:
+        self.nlevels = 2
+        self.columns = {('filepath',): empty(self.capacity, dtype=object)}
+        # The time zone of each column of timestamps, or None if they have
+        # none, keyed by column name:
+        self.time_zones = {}
+        # Row numbers by filepath:
+        self.rows = {}
+        self.version = 0
+        # The version at which each row last changed:
+        self.row_versions = zeros(self.capacity, dtype=int64)
+        # The version at which rows were last removed. Clients with an
+        # older version than this must be sent all rows:
+        self.removed_version = 0
+        self._dataframe = None
+
+    @staticmethod
+    def strip_padding(column_name):
+        while len(column_name) > 1 and column_name[-1] == '':
+            column_name = column_name[:-1]
+        return column_name
+
+    def pad(self, column_name):
+        return column_name + ('',) * (self.nlevels - len(column_name))
+
+    @staticmethod
+    def common_dtype(dtype1, dtype2):
+        """The dtype a column must have to hold values of both dtypes"""
+        kinds = {'b': 'b', 'i': 'i', 'u': 'i', 'f': 'f', 'M': 'M'}
+        kind1, kind2 = kinds.get(dtype1.kind, 'O'), kinds.get(dtype2.kind, 'O')
+        if kind1 == kind2 == 'b':
+            return dtype(bool)
+        elif kind1 == kind2 == 'M':
+            return dtype('datetime64[ns]')
+        elif kind1 == kind2 == 'i':
+            return dtype('int64')
+        elif kind1 in 'if' and kind2 in 'if':
+            return dtype('float64')
+        return dtype(object)
+
+    @staticmethod
+    def column_values(series):
+        """The values of a column of a dataframe, as an array of a dtype
+        that can be stored, and the time zone of its timestamps, if any"""
+        if series.dtype.kind in 'biuf':
+            return series.values, None
+        if series.dtype.kind == 'M':
+            # Timestamps, in UTC if timezone aware:
+            return asarray(series.values, dtype='datetime64[ns]'), getattr(series.dtype, 'tz', None)
+        # Anything else pandas does not store as a plain numpy array is kept
+        # as Python objects:
+        return series.astype(object).values, None
+
+    @staticmethod
+    def timestamps(values, time_zone):
+        """A DatetimeIndex of datetime64 values in UTC, in the given time
+        zone if it is not None"""
+        index = pandas.DatetimeIndex(values)
+        if time_zone is not None:
+            index = index.tz_localize('UTC').tz_convert(time_zone)
+        return index
+
+    def _timestamp_objects(self, values, time_zone, n_values):
+        """An object array of the first n_values of an array of datetime64
+        values in UTC, as Timestamps in the time zone"""
+        objects = empty(len(values), dtype=object)
+        objects[:n_values] = list(self.timestamps(values[:n_values], time_zone))
+        return objects
+
+    def column_data(self, column_name, indices=slice(None)):
+        """The values of a column in the given rows, all of them by default,
+        as they appear in the dataframe"""
+        values = self.columns[column_name][:self.n_rows][indices]
+        if values.dtype.kind == 'M':
+            return self.timestamps(values, self.time_zones[column_name])
+        return values
+
+    def get_value(self, column_name, index):
+        """The value in a row of a column, as it appears in the dataframe"""
+        column = self.columns[column_name]
+        if column.dtype.kind == 'M':
+            return self.column_data(column_name, [index])[0]
+        return column[index]
+
+    def _grow(self, n_rows):
+        if n_rows <= self.capacity:
+            return
+        while self.capacity < n_rows:
+            self.capacity *= 2
+        for column_name, column in self.columns.items():
+            new_column = empty(self.capacity, dtype=column.dtype)
+            new_column[:self.n_rows] = column[:self.n_rows]
+            self.columns[column_name] = new_column
+        row_versions = zeros(self.capacity, dtype=int64)
+        row_versions[:self.n_rows] = self.row_versions[:self.n_rows]
+        self.row_versions = row_versions
+
+    def _write(self, column_name, start, values, time_zone=None):
+        column = self.columns[column_name]
+        if column.dtype.kind == 'M' or values.dtype.kind == 'M':
+            if not (column.dtype.kind == values.dtype.kind == 'M'
+                    and str(self.time_zones[column_name]) == str(time_zone)):
+                # Timestamps mixed with other values, or with timestamps in
+                # another time zone, are stored as Timestamp objects:
+                if column.dtype.kind == 'M':
+                    column = self.columns[column_name] = self._timestamp_objects(
+                        column, self.time_zones.pop(column_name), self.n_rows)
+                if values.dtype.kind == 'M':
+                    values = self._timestamp_objects(values, time_zone, len(values))
+        new_dtype = self.common_dtype(column.dtype, values.dtype)
+        if new_dtype != column.dtype:
+            column = self.columns[column_name] = column.astype(new_dtype)
+        column[start:start + len(values)] = values
+
+    def _write_missing(self, column_name, start, stop):
+        column = self.columns[column_name]
+        if column.dtype.kind == 'M':
+            column[start:stop] = datetime64('NaT')
+            return
+        if column.dtype.kind in 'iu':
+            column = self.columns[column_name] = column.astype(float)
+        elif column.dtype.kind != 'f' and column.dtype != object:
+            column = self.columns[column_name] = column.astype(object)
+        column[start:stop] = nan
+
+    def _add_column(self, column_name, values_dtype, time_zone=None):
+        column = empty(self.capacity, dtype=values_dtype)
+        self.columns[column_name] = column
+        if column.dtype.kind == 'M':
+            self.time_zones[column_name] = time_zone
+        self.nlevels = max(self.nlevels, len(column_name))
+        if self.n_rows:
+            self._write_missing(column_name, 0, self.n_rows)
+
+    def _write_rows(self, start, dataframe):
+        stop = start + len(dataframe)
+        written = set()
+        for padded_name, series in dataframe.iteritems():
+            column_name = self.strip_padding(padded_name)
+            values, time_zone = self.column_values(series)
+            if column_name not in self.columns:
+                self._add_column(column_name, self.common_dtype(values.dtype, values.dtype), time_zone)
+            self._write(column_name, start, values, time_zone)
+            written.add(column_name)
+        for column_name in self.columns:
+            if column_name not in written:
+                self._write_missing(column_name, start, stop)
+        self.version += 1
+        self.row_versions[start:stop] = self.version
+        self._dataframe = None
+
+    def append(self, dataframe):
+        """Add the rows of a dataframe, with MultiIndex column labels as
+        returned by get_dataframe_from_shots(), to the end of the store"""
+        start = self.n_rows
+        self._grow(start + len(dataframe))
+        self._write_rows(start, dataframe)
+        self.n_rows += len(dataframe)
+        for i, filepath in enumerate(self.columns[('filepath',)][start:self.n_rows]):
+            self.rows[filepath] = start + i
+
+    def replace_row(self, filepath, dataframe):
+        """Replace the row for a shot with the single row of a dataframe"""
+        self._write_rows(self.rows[filepath], dataframe)
+
+    def update_values(self, filepath, values):
+        """Set some of the values in the row for a shot, given as a dict
+        keyed by column name, adding columns as needed. The rest of the row
+        is unchanged."""
+        index = self.rows[filepath]
+        for column_name, value in values.items():
+            column_name = self.strip_padding(tuple(column_name))
+            values_array = asarray(value)
+            if values_array.ndim == 0 and values_array.dtype.kind in 'biuf':
+                values_array = values_array.reshape(1)
+            else:
+                # Strings, arrays and anything else are stored as objects:
+                values_array = empty(1, dtype=object)
+                values_array[0] = value
+            if column_name not in self.columns:
+                self._add_column(column_name, values_array.dtype)
+            self._write(column_name, index, values_array)
+        self.version += 1
+        self.row_versions[index] = self.version
+        self._dataframe = None
+
+    def row_index(self, filepath):
+        """The row number of a shot, or None if it is not in the store"""
+        return self.rows.get(filepath)
+
+    def get_row(self, index):
+        """A dict of the values in a row, keyed by padded column name"""
+        return {self.pad(column_name): self.get_value(column_name, index) for column_name in self.columns}
+
+    def clear_filepath(self, filepath):
+        """Set the filepath of a shot's row to an empty string, so that a
+        new row can be added for the same file. To clients asking what has
+        changed, this is the shot being removed, so they are sent all rows
+        next time rather than a changed row with no filepath."""
+        index = self.rows.pop(filepath)
+        self.columns[('filepath',)][index] = ''
+        self.version += 1
+        self.row_versions[index] = self.version
+        self.removed_version = self.version
+        self._dataframe = None
+
+    def remove_rows(self, indices):
+        """Remove rows by row number"""
+        keep = ones(self.n_rows, dtype=bool)
+        keep[list(indices)] = False
+        self.n_rows = int(keep.sum())
+        for column_name, column in self.columns.items():
+            new_column = empty(self.capacity, dtype=column.dtype)
+            new_column[:self.n_rows] = column[:len(keep)][keep]
+            self.columns[column_name] = new_column
+        row_versions = zeros(self.capacity, dtype=int64)
+        row_versions[:self.n_rows] = self.row_versions[:len(keep)][keep]
+        self.row_versions = row_versions
+        self.rows = {filepath: i for i, filepath in enumerate(self.columns[('filepath',)][:self.n_rows])
+                     if filepath}
+        self.version += 1
+        self.removed_version = self.version
+        self._dataframe = None
+
+    def query(self, columns=None, sequences=None, start_time=None, end_time=None,
+              last=None, changed_since=None):
+        """Returns a subset of the stored data, serialised with
+        serialise_columns(). Only columns whose names begin with one of the
+        names or tuples in columns are included, along with the filepath,
+        sequence and run time columns. Rows can be limited to those from the
+        given sequences, those with run times from start_time up to but not
+        including end_time, and the last number of rows meeting these
+        conditions. Sequences and times can be pandas Timestamps or strings
+        in the format of the shot files' sequence ids and run times.
+
+        If changed_since is the version returned by a previous query, only
+        rows that have changed since then are returned, unless rows have
+        since been removed. The result's 'complete' item says whether all
+        rows meeting the conditions were returned."""
+        mask = ones(self.n_rows, dtype=bool)
+        complete = changed_since is None or changed_since < self.removed_version
+        if not complete:
+            mask &= self.row_versions[:self.n_rows] > changed_since
+        if sequences is not None:
+            sequences = [asdatetime(sequence) if isinstance(sequence, basestring) else sequence
+                         for sequence in sequences]
+            sequence_column = self.columns[('sequence',)][:self.n_rows]
+            if sequence_column.dtype.kind == 'M':
+                # Compare as nanoseconds since the epoch, in UTC:
+                mask &= in1d(sequence_column.view(int64), [pandas.Timestamp(sequence).value for sequence in sequences])
+            else:
+                mask &= pandas.Series(sequence_column).isin(sequences).values
+        if start_time is not None or end_time is not None:
+            if isinstance(start_time, basestring):
+                start_time = asdatetime(start_time)
+            if isinstance(end_time, basestring):
+                end_time = asdatetime(end_time)
+            run_times = self.columns[('run time',)][:self.n_rows]
+            if run_times.dtype.kind == 'M':
+                # Compare as nanoseconds since the epoch, in UTC:
+                run_times = run_times.view(int64)
+                mask &= run_times != datetime64('NaT').view(int64)
+                if start_time is not None:
+                    mask &= run_times >= pandas.Timestamp(start_time).value
+                if end_time is not None:
+                    mask &= run_times < pandas.Timestamp(end_time).value
+            else:
+                in_range = [isinstance(run_time, pandas.Timestamp)
+                            and (start_time is None or run_time >= start_time)
+                            and (end_time is None or run_time < end_time) for run_time in run_times]
+                mask &= array(in_range, dtype=bool)
+        indices = nonzero(mask)[0]
+        if last is not None:
+            indices = indices[len(indices) - last:] if last < len(indices) else indices
+        if columns is None:
+            column_names = sorted(self.columns)
+        else:
+            prefixes = [(column,) if isinstance(column, basestring) else self.strip_padding(tuple(column))
+                        for column in columns]
+            prefixes += [('filepath',), ('sequence',), ('run time',)]
+            column_names = sorted(column_name for column_name in self.columns
+                                  if [prefix for prefix in prefixes if column_name[:len(prefix)] == prefix])
+        arrays = [self.columns[column_name][indices] for column_name in column_names]
+        time_zones = [self.time_zones.get(column_name) for column_name in column_names]
+        result = serialise_columns([self.pad(column_name) for column_name in column_names], arrays, time_zones)
+        result['version'] = self.version
+        result['complete'] = complete
+        return result
+
+    @property
+    def column_names(self):
+        """The padded names of all columns, as in the dataframe"""
+        return [self.pad(column_name) for column_name in self.columns]
+
+    @property
+    def dataframe(self):
+        if self._dataframe is None:
+            column_names = sorted(self.columns)
+            index = pandas.MultiIndex.from_tuples([self.pad(column_name) for column_name in column_names])
+            data = {self.pad(column_name): self.column_data(column_name) for column_name in column_names}
+            self._dataframe = pandas.DataFrame(data, columns=index, index=pandas.Index(range(self.n_rows)))
+        return self._dataframe
+
+def serialise_columns(column_names, arrays, time_zones=None):
+    """Returns a dict, suitable for pickling, of the given column names and
+    arrays of column values. The values of numeric and datetime64 columns
+    are included as their raw bytes, which are much faster to pickle and
+    unpickle than a dataframe. Other columns are included as lists of
+    values. time_zones, if given, is the time zone of each column of
+    datetime64 values in UTC, or None."""
+    if time_zones is None:
+        time_zones = [None] * len(arrays)
+    dtypes = []
+    data = []
+    for values in arrays:
+        if values.dtype.kind in 'biufM':
+            dtypes.append(values.dtype.str)
+            data.append(values.tostring())
+        else:
+            dtypes.append(None)
+            data.append(list(values))
+    return {'columns': column_names, 'dtypes': dtypes, 'data': data, 'time_zones': time_zones}
+
+def deserialise_dataframe(serialised_columns):
+    """Returns a dataframe of the columns serialised by serialise_columns()"""
+    column_names = serialised_columns['columns']
+    time_zones = serialised_columns.get('time_zones', [None] * len(column_names))
+    data = {}
+    for column_name, dtype_str, values, time_zone in zip(column_names, serialised_columns['dtypes'],
+                                                         serialised_columns['data'], time_zones):
+        if dtype_str is not None:
+            data[column_name] = fromstring(values, dtype=dtype_str)
+            if data[column_name].dtype.kind == 'M':
+                data[column_name] = DataFrameStore.timestamps(data[column_name], time_zone)
+        else:
+            values_array = empty(len(values), dtype=object)
+            values_array[:] = values
+            data[column_name] = values_array
+    if not column_names:
+        return pandas.DataFrame()
+    index = pandas.MultiIndex.from_tuples(column_names)
+    return pandas.DataFrame(data, columns=index)
+
 def dict_diff(dict1, dict2):
     """Return the difference between two dictionaries as a dictionary of key: [val1, val2] pairs.
     Keys unique to either dictionary are included as key: [val1, '-'] or key: ['-', val2]."""
@@ -195,3 +849,54 @@ def dict_diff(dict1, dict2):
         diff[key] = ['-', dict2[key]]
 
     return diff
+
+
+def benchmark(n_shots=200):
+    """Times reading a folder of synthetic shot files with
+    get_flat_record_from_shot() and with get_nested_dict_from_shot()"""
+    import tempfile
+    import shutil
+    import time
+    folder = tempfile.mkdtemp()
+    try:
+        filepaths = []
+        for i in range(n_shots):
+            filepath = os.path.join(folder, 'shot_%04d.h5' % i)
+            with h5py.File(filepath, 'w') as h5_file:
+                h5_file.attrs['sequence_id'] = '20150101T000000_benchmark'
+                h5_file.attrs['sequence_index'] = 0
+                h5_file.attrs['run time'] = '20150101T000000'
+                h5_file.attrs['run number'] = i
+                h5_file.create_group('script').attrs['name'] = 'benchmark.py'
+                globals_group = h5_file.create_group('globals')
+                for j in range(100):
+                    globals_group.attrs['global_%d' % j] = float(j)
+                for j in range(10):
+                    resultsgroup = h5_file.create_group('results/routine_%d' % j)
+                    for k in range(20):
+                        resultsgroup.attrs['result_%d' % k] = float(i + k)
+                    resultsgroup.create_dataset('array', data=zeros(100))
+                for orientation in ['side', 'top']:
+                    for label in ['absorption', 'fluorescence']:
+                        for image in ['atoms', 'flat', 'dark']:
+                            dataset = h5_file.create_dataset('images/%s/%s/%s' % (orientation, label, image),
+                                                             data=zeros((16, 16)))
+                            dataset.attrs['exposure_time'] = 1e-3
+            filepaths.append(filepath)
+
+        start_time = time.time()
+        nested_records = [flatten_dict(get_nested_dict_from_shot(filepath)) for filepath in filepaths]
+        print('get_nested_dict_from_shot: %.3f s for %d shots' % (time.time() - start_time, n_shots))
+        start_time = time.time()
+        flat_records = [get_flat_record_from_shot(filepath) for filepath in filepaths]
+        print('get_flat_record_from_shot: %.3f s for %d shots' % (time.time() - start_time, n_shots))
+        for nested_record, flat_record in zip(nested_records, flat_records):
+            assert sorted(nested_record) == sorted(flat_record)
+            for key, value in nested_record.items():
+                assert array_equal(asarray(value), asarray(flat_record[key])), key
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    benchmark()
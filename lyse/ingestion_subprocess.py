@@ -0,0 +1,41 @@
+#####################################################################
+#                                                                   #
+# /ingestion_subprocess.py                                          #
+#                                                                   #
+# Copyright 2013, Monash University                                 #
+#                                                                   #
+# This file is part of the program lyse, in the labscript suite     #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+
+import labscript_utils.excepthook
+import zprocess
+to_parent, from_parent, kill_lock = zprocess.setup_connection_with_parent(lock = True)
+
+import os
+import zprocess.locking, labscript_utils.h5_lock, h5py
+
+from lyse.dataframe_utilities import get_flat_records_from_shots
+
+
+def mainloop():
+    while True:
+        task, data = from_parent.get()
+        with kill_lock:
+            if task == 'quit':
+                break
+            elif task == 'read':
+                filepaths = data
+                records, errors = get_flat_records_from_shots(filepaths)
+                to_parent.put(['done', (records, errors)])
+            else:
+                to_parent.put(['error', 'invalid task %s' % str(task)])
+
+
+if __name__ == '__main__':
+    # Set a meaningful client id for zprocess.locking:
+    zprocess.locking.set_client_process_name('lyse-ingestion-%d' % os.getpid())
+    mainloop()
@@ -0,0 +1,148 @@
+#####################################################################
+#                                                                   #
+# /tests/test_cached_routines.py                                    #
+#                                                                   #
+# Copyright 2013, Monash University                                 #
+#                                                                   #
+# This file is part of the program lyse, in the labscript suite     #
+# (see http://labscriptsuite.org), and is licensed under the        #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+
+"""Tests of how the analysis subprocess loads cached routines, whose top
+level runs only when they change, and that their run(path, state)
+functions can save results with lyse.Run. Run with:
+
+    python -m unittest lyse.tests.test_cached_routines"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import labscript_utils.h5_lock, h5py
+
+import lyse
+from lyse.analysis_subprocess import AnalysisWorker
+
+ROUTINE = '''
+import lyse
+
+lyse_cached = True
+
+def setup():
+    return {'value': %d}
+
+def run(path, state):
+    run = lyse.Run(path)
+    run.save_result('x', state['value'])
+'''
+
+
+class ModuleWatcher(object):
+    """Stands in for the modulewatcher, which counts how many times it has
+    unloaded modules that changed on disk"""
+    def __init__(self):
+        self.unload_count = 0
+
+
+class CachedRoutineTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.routine_path = os.path.join(self.folder, 'cached_routine.py')
+        self.write_routine(7)
+        self.shot_path = os.path.join(self.folder, 'shot.h5')
+        with h5py.File(self.shot_path, 'w'):
+            pass
+        # A worker with only what get_cached_namespace() needs, rather than
+        # the connection to lyse and the Qt thread that __init__ sets up:
+        self.worker = AnalysisWorker.__new__(AnalysisWorker)
+        self.worker.filepath = self.routine_path
+        self.worker.modulewatcher = ModuleWatcher()
+        self.worker.namespace = None
+        self.worker.cached_state = None
+        self.worker.source_stat = None
+        self.worker.source_hash = None
+        self.worker.unload_count = None
+
+    def tearDown(self):
+        lyse.path = None
+        lyse._routine_file = None
+        lyse._saved_results = None
+        lyse._shot_stat = None
+        shutil.rmtree(self.folder)
+
+    def write_routine(self, value, mtime_offset=0):
+        with open(self.routine_path, 'w') as f:
+            f.write(ROUTINE % value)
+        # Make sure the modification time differs from the last write's,
+        # which it might not on filesystems with coarse timestamps:
+        stat = os.stat(self.routine_path)
+        os.utime(self.routine_path, (stat.st_atime, stat.st_mtime + mtime_offset))
+
+    def run_routine(self):
+        # As the analysis subprocess runs a cached routine each shot:
+        namespace = self.worker.get_cached_namespace()
+        lyse.path = self.shot_path
+        lyse._routine_file = self.routine_path
+        lyse._saved_results = {}
+        namespace['run'](self.shot_path, self.worker.cached_state)
+
+    def saved_value(self):
+        with h5py.File(self.shot_path, 'r') as f:
+            return f['results/cached_routine'].attrs['x']
+
+    def test_loaded_once(self):
+        namespace = self.worker.get_cached_namespace()
+        self.assertTrue(namespace['lyse_cached'])
+        self.assertEqual(self.worker.cached_state, {'value': 7})
+        self.worker.cached_state['value'] = 8
+        # Not loaded again, so setup() is not called again either:
+        self.assertIs(self.worker.get_cached_namespace(), namespace)
+        self.assertEqual(self.worker.cached_state, {'value': 8})
+
+    def test_reloaded_when_changed(self):
+        namespace = self.worker.get_cached_namespace()
+        self.write_routine(9, mtime_offset=10)
+        self.assertIsNot(self.worker.get_cached_namespace(), namespace)
+        self.assertEqual(self.worker.cached_state, {'value': 9})
+
+    def test_not_reloaded_when_only_touched(self):
+        namespace = self.worker.get_cached_namespace()
+        self.write_routine(7, mtime_offset=10)
+        self.assertIs(self.worker.get_cached_namespace(), namespace)
+
+    def test_reloaded_when_modules_unloaded(self):
+        namespace = self.worker.get_cached_namespace()
+        self.worker.modulewatcher.unload_count += 1
+        self.assertIsNot(self.worker.get_cached_namespace(), namespace)
+        self.assertIs(self.worker.get_cached_namespace(), self.worker.namespace)
+
+    def test_failed_load_retried(self):
+        with open(self.routine_path, 'w') as f:
+            f.write('raise ValueError()\n')
+        self.assertRaises(ValueError, self.worker.get_cached_namespace)
+        self.assertIsNone(self.worker.namespace)
+        # Retried even though the file has not changed:
+        self.assertRaises(ValueError, self.worker.get_cached_namespace)
+        self.write_routine(7, mtime_offset=10)
+        self.assertEqual(self.worker.get_cached_namespace()['__file__'], self.routine_path)
+
+    def test_save_result(self):
+        self.run_routine()
+        self.assertEqual(self.saved_value(), 7)
+        self.write_routine(9, mtime_offset=10)
+        self.run_routine()
+        self.assertEqual(self.saved_value(), 9)
+
+    def test_saved_results_recorded(self):
+        self.run_routine()
+        self.assertEqual(lyse._saved_results, {('cached_routine', 'x'): 7})
+        self.assertIsNotNone(lyse._shot_stat)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -682,20 +682,24 @@ def get_shot_globals(filepath):
     """Returns the evaluated globals for a shot, for use by labscript or lyse.
     Simple dictionary access as in dict(h5py.File(filepath).attrs) would be fine
     except we want to apply some hacks, so it's best to do that in one place."""
-    params = {}
     with h5py.File(filepath) as f:
-        for name, value in f['globals'].attrs.items():
-            # Convert numpy bools to normal bools:
-            if isinstance(value, np.bool_):
-                value = bool(value)
-            # Convert null HDF references to None:
-            if isinstance(value, h5py.Reference) and not value:
-                value = None
-            # Convert numpy strings to Python ones.
-            # DEPRECATED, for backward compat with old files.
-            if isinstance(value, np.str_):
-                value = str(value)
-            params[name] = value
+        return get_shot_globals_from_file(f)
+
+def get_shot_globals_from_file(h5_file):
+    """As get_shot_globals, but for a shot file that is already open"""
+    params = {}
+    for name, value in h5_file['globals'].attrs.items():
+        # Convert numpy bools to normal bools:
+        if isinstance(value, np.bool_):
+            value = bool(value)
+        # Convert null HDF references to None:
+        if isinstance(value, h5py.Reference) and not value:
+            value = None
+        # Convert numpy strings to Python ones.
+        # DEPRECATED, for backward compat with old files.
+        if isinstance(value, np.str_):
+            value = str(value)
+        params[name] = value
     return params
 
 def set_shot_globals(h5file, shot_globals):
@@ -1208,6 +1208,14 @@ class PoppedOutOutputBoxWindow(QtGui.QDialog):
 
 class RunManager(object):
 
+    # Maximum number of compiled shots to submit to BLACS in one request:
+    BLACS_BATCH_SIZE = 100
+    # Submit what we have if it has been this long (in seconds) since the
+    # last submission, so BLACS isn't kept waiting during slow compilations:
+    BLACS_BATCH_INTERVAL = 0.5
+    # Extra time allowed for BLACS to reply, per file in the batch:
+    BLACS_BATCH_TIMEOUT_PER_FILE = 0.1
+
     # Constants for the model in the axes tab:
     AXES_COL_NAME = 0
     AXES_COL_LENGTH = 1
@@ -2849,8 +2857,16 @@ class RunManager(object):
             try:
                 labscript_file, run_files, send_to_BLACS, BLACS_host, send_to_runviewer = self.compile_queue.get()
                 run_files = iter(run_files)  # Should already be in iterator but just in case
+                # Compiled files waiting to be submitted to BLACS. They are
+                # sent in batches, flushed when enough have accumulated or
+                # enough time has passed, so that BLACS is not kept waiting
+                # for shots when compilation is slow:
+                BLACS_pending = []
+                BLACS_last_submitted = time.time()
                 while True:
                     if self.compilation_aborted.is_set():
+                        if BLACS_pending:
+                            self.send_to_BLACS(BLACS_pending, BLACS_host)
                         self.output_box.output('Compilation aborted.\n\n', red=True)
                         break
                     try:
@@ -2860,6 +2876,8 @@ class RunManager(object):
                             # create an extra file unnecessarily.
                             run_file = run_files.next()
                         except StopIteration:
+                            if BLACS_pending:
+                                self.send_to_BLACS(BLACS_pending, BLACS_host)
                             self.output_box.output('Ready.\n\n')
                             break
                         else:
@@ -2870,7 +2888,12 @@ class RunManager(object):
                                 self.compilation_aborted.set()
                                 continue
                             if send_to_BLACS:
-                                self.send_to_BLACS(run_file, BLACS_host)
+                                BLACS_pending.append(run_file)
+                                if (len(BLACS_pending) >= self.BLACS_BATCH_SIZE or
+                                        time.time() - BLACS_last_submitted > self.BLACS_BATCH_INTERVAL):
+                                    self.send_to_BLACS(BLACS_pending, BLACS_host)
+                                    BLACS_pending = []
+                                    BLACS_last_submitted = time.time()
                             if send_to_runviewer:
                                 self.send_to_runviewer(run_file)
                     except Exception as e:
@@ -3042,16 +3065,31 @@ class RunManager(object):
         logger.debug(run_files)
         return labscript_file, run_files
 
-    def send_to_BLACS(self, run_file, BLACS_hostname):
+    def send_to_BLACS(self, run_files, BLACS_hostname):
+        """Submit a batch of run files to BLACS in a single request. BLACS
+        replies with one message per file, in order"""
         port = int(self.exp_config.get('ports', 'BLACS'))
-        agnostic_path = shared_drive.path_to_agnostic(run_file)
-        self.output_box.output('Submitting run file %s.\n' % os.path.basename(run_file))
+        agnostic_paths = [shared_drive.path_to_agnostic(run_file) for run_file in run_files]
+        if len(run_files) == 1:
+            self.output_box.output('Submitting run file %s.\n' % os.path.basename(run_files[0]))
+        else:
+            self.output_box.output('Submitting %d run files.\n' % len(run_files))
         try:
-            response = zprocess.zmq_get(port, BLACS_hostname, data=agnostic_path)
-            if 'added successfully' in response:
-                self.output_box.output(response)
-            else:
-                raise Exception(response)
+            # Allow BLACS a little extra time per file to check it:
+            timeout = 5 + self.BLACS_BATCH_TIMEOUT_PER_FILE * len(run_files)
+            responses = zprocess.zmq_get(port, BLACS_hostname, data=agnostic_paths, timeout=timeout)
+            if isinstance(responses, basestring):
+                # Not a list of responses. BLACS doesn't understand batch
+                # submissions, or something else went wrong:
+                raise Exception(responses)
+            for run_file, response in zip(run_files, responses):
+                if 'added successfully' in response:
+                    if len(run_files) == 1:
+                        self.output_box.output(response)
+                    else:
+                        self.output_box.output('%s: %s' % (os.path.basename(run_file), response))
+                else:
+                    raise Exception('%s: %s' % (os.path.basename(run_file), response))
         except Exception as e:
             self.output_box.output('Couldn\'t submit job to control server: %s\n' % str(e), red=True)
             self.compilation_aborted.set()
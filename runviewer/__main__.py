@@ -89,6 +89,8 @@ import labscript_devices
 from labscript_utils.labconfig import LabConfig, config_prefix
 
 from resample import resample as _resample
+from trace_pyramid import TracePyramid
+import trace_loader
 
 
 def set_win_appusermodel(window_id):
@@ -184,6 +186,10 @@ class RunviewerMainWindow(QMainWindow):
 
         
 class RunViewer(object):
+
+    # How many points resampled traces have:
+    RESAMPLE_POINTS = 3*2000+2
+
     def __init__(self):
         self.ui = UiLoader().load(os.path.join(os.path.dirname(os.path.realpath(__file__)),'main.ui'), RunviewerMainWindow())
         
@@ -238,8 +244,20 @@ class RunViewer(object):
         self.plot_widgets = {}
         self.plot_items = {}
         
+        # Plots are resampled in a thread when their visible ranges change.
+        # Bursts of range changes, as when scrolling, are coalesced by a
+        # timer, and the thread abandons a request once there is a newer one:
+        self._resample_timer = QTimer()
+        self._resample_timer.setSingleShot(True)
+        self._resample_timer.setInterval(50)
+        self._resample_timer.timeout.connect(self._queue_resample)
+        self._resample_queue = Queue()
+        self._resample_generation = 0
+        # The (xmin, xmax, width) each plot item was last resampled for,
+        # keyed by (channel, shot):
+        self._resampled_params = {}
+
         # start resample thread
-        self._resample = False
         self._thread = threading.Thread(target=self._resample_thread)
         self._thread.daemon = True
         self._thread.start()
@@ -461,6 +479,7 @@ class RunViewer(object):
                             to_delete.append(shot)
                     for shot in to_delete:
                         del self.plot_items[channel][shot]
+                        self._resampled_params.pop((channel, shot), None)
                     
                     # do we need to add any plot items for shots that were not previously selected?
                     for shot, colour in ticked_shots.items():
@@ -469,6 +488,7 @@ class RunViewer(object):
                             # Add empty plot as it the custom resampling we do will happen quicker if we don't attempt to first plot all of the data
                             plot_item = self.plot_widgets[channel].plot([0,0],[0], pen=pg.mkPen(QColor(colour), width=2), stepMode=True) 
                             self.plot_items[channel][shot] = plot_item
+                            self._resampled_params.pop((channel, shot), None)
                     
                 # If no, create one
                 else:
@@ -479,7 +499,7 @@ class RunViewer(object):
                     self.create_plot(channel, ticked_shots)
                 self.plot_widgets[channel].hide()
                     
-        self._resample = True
+        self._request_resample()
 
     def create_plot(self, channel, ticked_shots):
         self.plot_widgets[channel] = pg.PlotWidget()#name=channel)
@@ -489,6 +509,8 @@ class RunViewer(object):
         self.plot_widgets[channel].showAxis('right', True)
         self.plot_widgets[channel].setXLink('runviewer - time axis link') 
         self.plot_widgets[channel].sigXRangeChanged.connect(self.on_x_range_changed)                     
+        # Resample for the new width if the plot is resized:
+        self.plot_widgets[channel].getViewBox().sigResized.connect(self.on_x_range_changed)
         self.ui.plot_layout.addWidget(self.plot_widgets[channel])
         
         has_units = False
@@ -500,6 +522,7 @@ class RunViewer(object):
                 plot_item = self.plot_widgets[channel].plot([0,0],[0], pen=pg.mkPen(QColor(colour), width=2), stepMode=True)
                 self.plot_items.setdefault(channel, {})
                 self.plot_items[channel][shot] = plot_item
+                self._resampled_params.pop((channel, shot), None)
                 
                 if len(shot.traces[channel]) == 3:
                     has_units = True
@@ -511,16 +534,47 @@ class RunViewer(object):
             self.plot_widgets[channel].setLabel('left', channel)
         
     def on_x_range_changed(self, *args):
-        # print 'x range changed'
-        self._resample = True
-        
-    @inmain_decorator(wait_for_return=True)
-    def _get_resample_params(self, channel, shot):
-        rect = self.plot_items[channel][shot].getViewBox().viewRect()
-        xmin, xmax = rect.left(), rect.width() + rect.left()
-        dx = xmax - xmin
-        view_range = self.plot_widgets[channel].viewRange()
-        return view_range[0][0], view_range[0][1], dx
+        self._request_resample()
+
+    def _request_resample(self):
+        # (Re)start the timer, so that we resample once things stop changing:
+        self._resample_timer.start()
+
+    def _queue_resample(self):
+        """Works out which shown plot items' visible ranges or widths have
+        changed since they were last resampled, and asks the resample thread
+        to resample them, superseding any previous request"""
+        ticked_shots = self.get_selected_shots_and_colours()
+        shown_channels = set()
+        for i in range(self.channel_model.rowCount()):
+            check_item = self.channel_model.item(i, CHANNEL_MODEL__CHECKBOX_INDEX)
+            if check_item.checkState() == Qt.Checked and check_item.isEnabled():
+                shown_channels.add(unicode(check_item.text()))
+        jobs = []
+        for channel in shown_channels:
+            if channel not in self.plot_widgets or channel not in self.plot_items:
+                continue
+            plot_widget = self.plot_widgets[channel]
+            (xmin, xmax), _ = plot_widget.viewRange()
+            params = (xmin, xmax, plot_widget.width())
+            for shot, plot_item in self.plot_items[channel].items():
+                if shot in ticked_shots and self._resampled_params.get((channel, shot)) != params:
+                    jobs.append((channel, shot, ticked_shots[shot], params))
+        self._resample_generation += 1
+        if jobs:
+            self._resample_queue.put((self._resample_generation, jobs))
+
+    def _set_resampled_data(self, generation, channel, shot, colour, params, xnew, ynew):
+        if generation != self._resample_generation:
+            # The view has changed since, this will be resampled again:
+            return
+        try:
+            plot_item = self.plot_items[channel][shot]
+        except KeyError:
+            # Removed in the meantime:
+            return
+        plot_item.setData(xnew, ynew, pen=pg.mkPen(QColor(colour), width=2), stepMode=True)
+        self._resampled_params[channel, shot] = params
     
     def resample(self,data_x, data_y, xmin, xmax, stop_time, num_pixels):
         """This is a function for downsampling the data before plotting
@@ -532,7 +586,7 @@ class RunViewer(object):
         of interpolation."""
         #TODO: Only finely sample the currently visible region. Coarsely sample the rest
         # x_out = numpy.float32(numpy.linspace(data_x[0], data_x[-1], 4000*(data_x[-1]-data_x[0])/(xmax-xmin)))
-        x_out = numpy.float64(numpy.linspace(xmin, xmax, 3*2000+2))
+        x_out = numpy.float64(numpy.linspace(xmin, xmax, self.RESAMPLE_POINTS))
         y_out = numpy.empty(len(x_out)-1, dtype=numpy.float64)
         data_x = numpy.float64(data_x)
         data_y = numpy.float64(data_y)
@@ -726,40 +780,34 @@ class RunViewer(object):
     def _resample_thread(self):
         logger = logging.getLogger('runviewer.resample_thread')
         while True:
-            if self._resample:
-                self._resample = False
-                # print 'resampling'
-                ticked_shots = inmain(self.get_selected_shots_and_colours)
-                for shot, colour in ticked_shots.items():
-                    for channel in shot.traces:                        
-                        if self.channel_checked_and_enabled(channel):
-                            try:
-                                xmin, xmax, dx = self._get_resample_params(channel,shot)
-                                
-                                # We go a bit outside the visible range so that scrolling
-                                # doesn't immediately go off the edge of the data, and the
-                                # next resampling might have time to fill in more data before
-                                # the user sees any empty space.
-                                xnew, ynew = self.resample(shot.traces[channel][0], shot.traces[channel][1], xmin, xmax, shot.stop_time, dx)
-                                inmain(self.plot_items[channel][shot].setData, xnew, ynew, pen=pg.mkPen(QColor(colour), width=2), stepMode=True)
-                            except Exception:
-                                #self._resample = True
-                                pass
-                        else:
-                            logger.info('ignoring channel %s'%channel)
-            time.sleep(0.5)
-    
-    @inmain_decorator(wait_for_return=True)
-    def channel_checked_and_enabled(self, channel):
-        logger.info('is channel %s enabled'%channel)
-        index = self.channel_model.index(0, CHANNEL_MODEL__CHANNEL_INDEX)
-        indexes = self.channel_model.match(index, Qt.DisplayRole, channel, 1, Qt.MatchExactly)
-        logger.info('number of matches %d'%len(indexes))
-        if len(indexes) == 1:
-            check_item = self.channel_model.itemFromIndex(indexes[0])
-            if check_item.checkState() == Qt.Checked and check_item.isEnabled():
-                return True
-        return False
+            generation, jobs = self._resample_queue.get()
+            # Only the latest request matters:
+            while not self._resample_queue.empty():
+                generation, jobs = self._resample_queue.get()
+            for channel, shot, colour, params in jobs:
+                if generation != self._resample_generation:
+                    # The user has kept scrolling, don't bother finishing:
+                    break
+                if channel not in shot.traces:
+                    continue
+                xmin, xmax, width = params
+                try:
+                    pyramid = shot.pyramid(channel)
+                    # Plot the steps in view as they are if there are few
+                    # enough of them:
+                    steps = pyramid.get_steps(xmin, xmax, shot.stop_time, self.RESAMPLE_POINTS)
+                    if steps is not None:
+                        xnew, ynew = steps
+                    else:
+                        # Otherwise resample from a decimation of the trace
+                        # with about as many points in view as there will be
+                        # in the plot:
+                        data_x, data_y = pyramid.get_samples(xmin, xmax, self.RESAMPLE_POINTS)
+                        xnew, ynew = self.resample(data_x, data_y, xmin, xmax, shot.stop_time, width)
+                except Exception:
+                    logger.exception('failed to resample channel %s'%channel)
+                    continue
+                inmain_later(self._set_resampled_data, generation, channel, shot, colour, params, xnew, ynew)
     
     def on_x_axis_reset(self):
         self._hidden_plot[0].enableAutoRange(axis=pg.ViewBox.XAxis)   
@@ -896,6 +944,8 @@ class Shot(object):
         self._traces = None
         # store list of channels
         self._channels = None
+        # TracePyramids of traces that have been displayed, keyed by channel:
+        self._pyramids = {}
         
         # TODO: Get this dynamically
         device_list = ['PulseBlaster', 'NI_PCIe_6363', 'NI_PCI_6733']
@@ -917,48 +967,38 @@ class Shot(object):
     def delete_cache(self):
         self._channels = None
         self._traces = None
+        self._pyramids = {}
         
     def _load(self):
         if self._channels is None:
             self._channels = {}
         if self._traces is None:
             self._traces = {}
-            
+
+        # Use the traces cached from when the shot was last opened, if
+        # nothing they depend on has changed:
+        try:
+            cache_key = trace_loader.cache_key(self.path)
+        except Exception:
+            cache_key = None
+        cached = trace_loader.read_cache(self.path, cache_key) if cache_key is not None else None
+        if cached is not None:
+            self._traces, self._channels = cached
+            return
+
         # Let's walk the connection table, starting with the master pseudoclock
-        master_pseudoclock_device = self.connection_table.find_by_name(self.master_pseudoclock_name)   
-        
-        self._load_device(master_pseudoclock_device)
+        failed = trace_loader.load_traces(self.path, self.connection_table, self.master_pseudoclock_name,
+                                          self.add_trace)
+
+        # Don't cache a device's failure to load, it may not happen next time:
+        if cache_key is not None and not failed:
+            trace_loader.write_cache(self.path, cache_key, self._traces, self._channels)
     
     def add_trace(self, name, trace, parent_device_name, connection):
         name = unicode(name)
         self._channels[name] = {'device_name':parent_device_name, 'port':connection}
         self._traces[name] = trace
     
-    def _load_device(self, device, clock=None):
-        try:
-            print 'loading %s'%device.name
-            module = device.device_class
-            # Load the master pseudoclock class
-            # labscript_devices.import_device(module)
-            device_class = labscript_devices.get_runviewer_parser(module)
-            device_instance = device_class(self.path, device)
-            clocklines_and_triggers = device_instance.get_traces(self.add_trace, clock)
-
-            for name, trace in clocklines_and_triggers.items():
-                child_device = self.connection_table.find_by_name(name)
-                for grandchild_device_name, grandchild_device in child_device.child_list.items():
-                    self._load_device(grandchild_device, trace)
-            
-        except Exception:
-            #TODO: print/log exception traceback
-            # if device.name == 'ni_card_0' or device.name == 'pulseblaster_0' or device.name == 'pineblaster_0' or device.name == 'ni_card_1' or device.name == 'novatechdds9m_0':
-                # raise
-            # raise
-            if hasattr(device, 'name'):
-                print 'Failed to load device %s'%device.name
-            else:
-                print 'Failed to load device (unknown name, device object does not have attribute name)'
-    
     @property
     def channels(self):
         if self._channels is None:
@@ -970,6 +1010,14 @@ class Shot(object):
         # clear cache variables to cut down on memory usage
         pass
     
+    def pyramid(self, channel):
+        """Returns a TracePyramid of the channel's trace, making it the first
+        time it is asked for"""
+        if channel not in self._pyramids:
+            times, values = self.traces[channel][:2]
+            self._pyramids[channel] = TracePyramid(times, values)
+        return self._pyramids[channel]
+
     @property
     def traces(self):
         # if traces cached:
@@ -0,0 +1,232 @@
+#####################################################################
+#                                                                   #
+# /trace_loader.py                                                  #
+#                                                                   #
+# Copyright 2014, Monash University                                 #
+#                                                                   #
+# This file is part of the program runviewer, in the labscript      #
+# suite (see http://labscriptsuite.org), and is licensed under the  #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+
+"""Loading of the traces of the devices in a shot, in parallel and with a
+cache on disk.
+
+Devices are parsed starting with the master pseudoclock, each being given
+the trace of the clock line or trigger it is connected to. Once the master
+pseudoclock has been parsed, the devices it clocks, along with the devices
+they in turn clock, are independent of each other, and are parsed in a pool
+of processes.
+
+Decoded traces are saved alongside the shot file, compressed, and are used
+when the shot is next opened so long as neither the device tables in the shot
+file, the runviewer parsers nor the versions of runviewer, blacs and
+labscript_utils have changed since. Traces are only cached if every device
+loaded. The cache is an npz file of plain arrays, read without unpickling, as
+shot folders are often on shared drives that others can write to."""
+
+import os
+import glob
+import json
+import hashlib
+import multiprocessing
+
+import numpy
+import labscript_utils
+import labscript_utils.h5_lock, h5py
+import blacs
+from blacs.connections import ConnectionTable
+import labscript_devices
+import runviewer
+
+# Change this if the format of the cache changes:
+CACHE_FORMAT_VERSION = 2
+
+CACHE_FILE_SUFFIX = '.runviewer_cache'
+
+_pool = None
+_parsers_hash = None
+# Connection tables of shots, for processes in the pool:
+_connection_tables = {}
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = multiprocessing.Pool(min(multiprocessing.cpu_count(), 4))
+    return _pool
+
+
+def parsers_hash():
+    """A hash of the source of all the modules in labscript_devices, in
+    which the runviewer parsers are defined, so that cached traces are not
+    used once a parser has changed"""
+    global _parsers_hash
+    if _parsers_hash is None:
+        hasher = hashlib.sha1()
+        folder = os.path.dirname(os.path.abspath(labscript_devices.__file__))
+        for filepath in sorted(glob.glob(os.path.join(folder, '*.py'))):
+            hasher.update(os.path.basename(filepath))
+            with open(filepath, 'rb') as f:
+                hasher.update(f.read())
+        _parsers_hash = hasher.hexdigest()
+    return _parsers_hash
+
+
+def shot_devices_hash(path):
+    """A hash of everything in a shot file that the runviewer parsers read:
+    the connection table and the devices group"""
+    hasher = hashlib.sha1()
+
+    def hash_object(name, obj):
+        hasher.update(repr(name))
+        for key in sorted(obj.attrs):
+            hasher.update(repr((key, obj.attrs[key])))
+        if isinstance(obj, h5py.Dataset):
+            data = numpy.asarray(obj[()])
+            if data.dtype.hasobject:
+                hasher.update(repr(data.tolist()))
+            else:
+                hasher.update(repr((data.dtype.descr, data.shape)))
+                hasher.update(numpy.ascontiguousarray(data).tostring())
+
+    with h5py.File(path, 'r') as h5_file:
+        hash_object('connection table', h5_file['connection table'])
+        hash_object('devices', h5_file['devices'])
+        h5_file['devices'].visititems(hash_object)
+    return hasher.hexdigest()
+
+
+def cache_key(path):
+    # The parsers also use runviewer, blacs.connections and labscript_utils,
+    # which are not in labscript_devices, so include their versions:
+    versions = '%s-%s-%s' % (runviewer.__version__, blacs.__version__, labscript_utils.__version__)
+    return '%d-%s-%s-%s' % (CACHE_FORMAT_VERSION, versions, parsers_hash(), shot_devices_hash(path))
+
+
+def read_cache(path, key):
+    """Returns the traces and channels cached for the shot, or None if there
+    is no cache or it is out of date"""
+    try:
+        with open(path + CACHE_FILE_SUFFIX, 'rb') as f:
+            # Never unpickle, the file may have been written by anyone:
+            cached = numpy.load(f, allow_pickle=False)
+            index = json.loads(str(cached['index']))
+            if index['key'] != key:
+                return None
+            traces = {}
+            for i, (name, length) in enumerate(zip(index['names'], index['lengths'])):
+                traces[name] = tuple(cached['trace_%d_%d' % (i, j)] for j in range(length))
+    except Exception:
+        return None
+    return traces, index['channels']
+
+
+def write_cache(path, key, traces, channels):
+    """Saves the shot's traces and channels to the cache file next to it.
+    Failure, such as not being allowed to write to the folder, is not an
+    error, the traces just won't be cached. Nor are traces that hold
+    arrays of Python objects, which could only be stored by pickling."""
+    cache_path = path + CACHE_FILE_SUFFIX
+    temp_path = cache_path + '.tmp'
+    names = sorted(traces)
+    arrays = {}
+    for i, name in enumerate(names):
+        for j, array in enumerate(traces[name]):
+            array = numpy.asarray(array)
+            if array.dtype.hasobject:
+                return
+            arrays['trace_%d_%d' % (i, j)] = array
+    index = {'key': key, 'names': names, 'lengths': [len(traces[name]) for name in names],
+             'channels': channels}
+    try:
+        arrays['index'] = numpy.array(json.dumps(index))
+        with open(temp_path, 'wb') as f:
+            numpy.savez_compressed(f, **arrays)
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+        os.rename(temp_path, cache_path)
+    except Exception:
+        print 'Could not save runviewer trace cache for %s' % path
+
+
+def load_device(path, connection_table, device, clock, add_trace, recurse=True, failed=None):
+    """Parses the traces of a device, calling add_trace(name, trace,
+    parent_device_name, connection) for each, and if recurse is True, of the
+    devices it clocks or triggers. Returns the device's clock lines and
+    triggers, as a dict of traces keyed by name. The names of devices that
+    could not be parsed are appended to the list failed, if given."""
+    try:
+        print 'loading %s'%device.name
+        device_class = labscript_devices.get_runviewer_parser(device.device_class)
+        device_instance = device_class(path, device)
+        clocklines_and_triggers = device_instance.get_traces(add_trace, clock)
+        if recurse:
+            for name, trace in clocklines_and_triggers.items():
+                child_device = connection_table.find_by_name(name)
+                for grandchild_device_name, grandchild_device in child_device.child_list.items():
+                    load_device(path, connection_table, grandchild_device, trace, add_trace, failed=failed)
+        return clocklines_and_triggers
+    except Exception:
+        if hasattr(device, 'name'):
+            print 'Failed to load device %s'%device.name
+        else:
+            print 'Failed to load device (unknown name, device object does not have attribute name)'
+        if failed is not None:
+            failed.append(getattr(device, 'name', None))
+        return {}
+
+
+def load_device_tree(path, device_name, clock):
+    """Parses the traces of a device and all the devices it clocks or
+    triggers, returning a list of the arguments add_trace() was called with,
+    and a list of the names of devices that could not be parsed. Runs in the
+    process pool."""
+    if path not in _connection_tables:
+        _connection_tables.clear()
+        _connection_tables[path] = ConnectionTable(path)
+    connection_table = _connection_tables[path]
+    device = connection_table.find_by_name(device_name)
+    added_traces = []
+    def add_trace(*args):
+        added_traces.append(args)
+    failed = []
+    load_device(path, connection_table, device, clock, add_trace, failed=failed)
+    return added_traces, failed
+
+
+def load_traces(path, connection_table, master_pseudoclock_name, add_trace):
+    """Parses the traces of all devices in the shot, calling add_trace(name,
+    trace, parent_device_name, connection) for each. The master pseudoclock
+    is parsed in this process, and the trees of devices it clocks in the
+    process pool, if there is more than one. Returns a list of the names of
+    devices that could not be parsed."""
+    failed = []
+    master_pseudoclock = connection_table.find_by_name(master_pseudoclock_name)
+    clocklines_and_triggers = load_device(path, connection_table, master_pseudoclock, None, add_trace,
+                                          recurse=False, failed=failed)
+    subtrees = []
+    for name, trace in clocklines_and_triggers.items():
+        child_device = connection_table.find_by_name(name)
+        for device_name in child_device.child_list:
+            subtrees.append((device_name, trace))
+    if len(subtrees) > 1:
+        try:
+            pool = get_pool()
+            results = [pool.apply_async(load_device_tree, (path, device_name, trace))
+                       for device_name, trace in subtrees]
+            results = [result.get() for result in results]
+        except Exception:
+            print 'Could not load devices in parallel, loading them one at a time instead'
+        else:
+            for added_traces, failed_devices in results:
+                for args in added_traces:
+                    add_trace(*args)
+                failed.extend(failed_devices)
+            return failed
+    for device_name, trace in subtrees:
+        load_device(path, connection_table, connection_table.find_by_name(device_name), trace, add_trace,
+                    failed=failed)
+    return failed
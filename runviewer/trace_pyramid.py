@@ -0,0 +1,87 @@
+#####################################################################
+#                                                                   #
+# /trace_pyramid.py                                                 #
+#                                                                   #
+# Copyright 2014, Monash University                                 #
+#                                                                   #
+# This file is part of the program runviewer, in the labscript      #
+# suite (see http://labscriptsuite.org), and is licensed under the  #
+# Simplified BSD License. See the license.txt file in the root of   #
+# the project for the full license.                                 #
+#                                                                   #
+#####################################################################
+
+import numpy
+
+
+class TracePyramid(object):
+    """Decimated copies of a trace at successively coarser resolutions, so
+    that resampling a trace for display need only look at about as many
+    points as there are pixels, rather than every point in the trace. Each
+    coarser level is made by grouping FACTOR consecutive points of the level
+    below into a block, keeping the time of its first point and its minimum,
+    maximum and final values. Keeping the extremes means that short spikes
+    still show up when zoomed out, as they do when resampling the full trace."""
+
+    FACTOR = 4
+    # No coarser levels are made once a level has fewer points than this:
+    MIN_POINTS = 4096
+
+    def __init__(self, times, values):
+        times = numpy.asarray(times, dtype=numpy.float64)
+        values = numpy.asarray(values, dtype=numpy.float64)
+        # Each level is (times, minima, maxima, final values). At full
+        # resolution these are all just the values:
+        self.levels = [(times, values, values, values)]
+        while len(times) > self.MIN_POINTS:
+            starts = numpy.arange(0, len(times), self.FACTOR)
+            ends = numpy.minimum(starts + self.FACTOR, len(times)) - 1
+            _, minima, maxima, finals = self.levels[-1]
+            times = times[starts]
+            self.levels.append((times,
+                                numpy.minimum.reduceat(minima, starts),
+                                numpy.maximum.reduceat(maxima, starts),
+                                finals[ends]))
+
+    def get_samples(self, xmin, xmax, num_points):
+        """Returns times and values to resample for showing the part of the
+        trace between xmin and xmax at a resolution of num_points. They come
+        from the coarsest level that still has at least num_points points in
+        that range, and extend only one point beyond it at either end."""
+        for level in range(len(self.levels) - 1, -1, -1):
+            times = self.levels[level][0]
+            start = max(numpy.searchsorted(times, xmin, 'right') - 1, 0)
+            stop = min(numpy.searchsorted(times, xmax, 'right') + 1, len(times))
+            if stop - start >= num_points:
+                break
+        times, minima, maxima, finals = self.levels[level]
+        if level == 0:
+            return times[start:stop], finals[start:stop]
+        # Each block becomes three points at the time it begins, so that the
+        # resampler sees its extremes and ends on its final value:
+        sample_times = numpy.repeat(times[start:stop], 3)
+        sample_values = numpy.empty(len(sample_times))
+        sample_values[0::3] = minima[start:stop]
+        sample_values[1::3] = maxima[start:stop]
+        sample_values[2::3] = finals[start:stop]
+        return sample_times, sample_values
+
+    def get_steps(self, xmin, xmax, stop_time, max_steps):
+        """Returns the edges and values of the steps of the trace between
+        xmin and xmax, clipped to that range and ending at stop_time if it is
+        within it, for plotting as is with stepMode. Parsers give traces with
+        only the points where their values change, so a channel that steps
+        only a few times needs no resampling to be drawn exactly. Returns
+        None if there are more than max_steps steps in the range, or none at
+        all, in which case the trace should be resampled instead."""
+        times, _, _, values = self.levels[0]
+        end = min(xmax, stop_time)
+        start = max(numpy.searchsorted(times, xmin, 'right') - 1, 0)
+        stop = numpy.searchsorted(times, end, 'left')
+        if end <= xmin or stop <= start or stop - start > max_steps:
+            return None
+        edges = numpy.empty(stop - start + 1)
+        edges[:-1] = times[start:stop]
+        edges[0] = max(edges[0], xmin)
+        edges[-1] = end
+        return edges, values[start:stop]